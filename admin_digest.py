@@ -0,0 +1,80 @@
+import threading
+import logging
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+class AdminDigestSender:
+    """
+    שליחה תקופתית של סיכומי בדיקה למנהל
+
+    במקום הודעה למנהל על כל תמונה, התמונות הממתינות (temp_images במצב
+    pending) נאספות כל interval שניות לסיכומים של עד max_items תמונות.
+    אם שליחת סיכום נכשלת, התמונות שלו חוזרות לתור.
+    """
+
+    def __init__(self, db, send_digest, interval=120, max_items=10):
+        """
+        Args:
+            db: מנהל מסד הנתונים
+            send_digest: פונקציה המקבלת (מזהה סיכום, רשימת תמונות) ושולחת אותו למנהל
+            interval: שניות בין סיכומים
+            max_items: מספר התמונות המרבי בסיכום
+        """
+        self.db = db
+        self.send_digest = send_digest
+        self.interval = interval
+        self.max_items = max_items
+
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._counters = {'digests': 0, 'items': 0, 'failed': 0}
+
+    def start(self):
+        """הפעלת תהליכון השליחה (אם עדיין לא הופעל)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='admin-digest', daemon=True)
+            self._thread.start()
+        logger.info(f"שליחת סיכומים למנהל הופעלה (כל {self.interval} שניות)")
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """שליחת כל התמונות הממתינות כעת, בסיכומים של עד max_items תמונות"""
+        while not self._stopping.is_set():
+            digest_id, items = self.db.claim_review_digest(self.max_items)
+            if not items:
+                return
+
+            try:
+                self.send_digest(digest_id, items)
+            except Exception as e:
+                logger.error(f"שגיאה בשליחת סיכום {digest_id} למנהל: {e}")
+                self.db.release_review_digest(digest_id)
+                with self._lock:
+                    self._counters['failed'] += 1
+                return
+
+            with self._lock:
+                self._counters['digests'] += 1
+                self._counters['items'] += len(items)
+
+    def stop(self, timeout=30):
+        """עצירת תהליכון השליחה"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stopping.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self):
+        """מוני הסיכומים שנשלחו"""
+        with self._lock:
+            return {**self._counters, 'running': self._thread is not None}
@@ -0,0 +1,85 @@
+import threading
+import logging
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+# טלגרם מגביל אלבום ל-10 תמונות
+MAX_ALBUM_PHOTOS = 10
+
+
+class AlbumCollector:
+    """
+    איסוף התמונות של אלבום לעיבוד אחד
+
+    טלגרם שולח כל תמונה באלבום כעדכון נפרד עם אותו media_group_id. התמונה
+    הראשונה פותחת חלון של window שניות, ובסופו (או כשהאלבום מלא) כל
+    התמונות שהגיעו מועברות יחד ל-on_album, ממוינות לפי סדר השליחה, יחד עם
+    מזהי העדכונים שלהן בתור העדכונים.
+    """
+
+    def __init__(self, on_album, window=1.0, max_photos=MAX_ALBUM_PHOTOS):
+        """
+        Args:
+            on_album: פונקציה המקבלת את הודעות התמונה של האלבום ואת מזהי העדכונים שלהן
+            window: שניות לאיסוף התמונות מהתמונה הראשונה
+            max_photos: מספר התמונות שבו האלבום נשלח לעיבוד מיד
+        """
+        self.on_album = on_album
+        self.window = window
+        self.max_photos = max_photos
+
+        self._lock = threading.Lock()
+        self._albums = {}  # (chat_id, media_group_id) -> (רשימת הודעות, מזהי עדכונים, טיימר)
+        self._counters = {'albums': 0, 'photos': 0}
+
+    def add(self, message, update_id=None):
+        """
+        הוספת תמונה לאלבום שלה (האלבום נשלח לעיבוד בסוף החלון)
+
+        Args:
+            update_id: מזהה העדכון בתור העדכונים, אם התמונה הגיעה ממנו
+        """
+        key = (message.chat.id, message.media_group_id)
+        with self._lock:
+            if key not in self._albums:
+                timer = threading.Timer(self.window, self._flush, (key,))
+                timer.daemon = True
+                self._albums[key] = ([], [], timer)
+                timer.start()
+            messages, update_ids, _ = self._albums[key]
+            messages.append(message)
+            if update_id is not None:
+                update_ids.append(update_id)
+            full = len(messages) >= self.max_photos
+
+        if full:
+            self._flush(key)
+
+    def _flush(self, key):
+        with self._lock:
+            album = self._albums.pop(key, None)
+            if album is None:
+                return
+            messages, update_ids, timer = album
+            timer.cancel()
+            self._counters['albums'] += 1
+            self._counters['photos'] += len(messages)
+
+        messages.sort(key=lambda message: message.message_id)
+        try:
+            self.on_album(messages, update_ids)
+        except Exception as e:
+            logger.error(f"שגיאה בטיפול באלבום {key[1]}: {e}")
+
+    def flush_all(self):
+        """שליחת כל האלבומים שעדיין נאספים לעיבוד מיד (בעת כיבוי)"""
+        with self._lock:
+            keys = list(self._albums)
+        for key in keys:
+            self._flush(key)
+
+    def stats(self):
+        """מספר האלבומים והתמונות שעובדו והאלבומים שנאספים כעת"""
+        with self._lock:
+            return {**self._counters, 'collecting': len(self._albums)}
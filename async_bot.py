@@ -0,0 +1,677 @@
+"""
+הרצת הבוט על asyncio באמצעות AsyncTeleBot (BOT_RUNTIME=async)
+
+עיבוד תמונה ממתין לרשת (טלגרם, API זיהוי הלוחיות) בלי להחזיק תהליכון,
+כך שתהליך אחד מחזיק אלפי עיבודים במקביל. מעברי המצב, טקסטי התשובה,
+שמירת התמונות ופעולות המנהל הם אותם של הבוט הסינכרוני (game_flow), והם
+רצים במאגר תהליכונים חסום דרך AsyncDBManager. איסוף האלבומים ושליחת
+הסיכומים למנהל משתמשים באותם רכיבים, שקוראים לבוט דרך לולאת האירועים.
+
+תור העדכונים הקבוע (WEBHOOK_QUEUE_ENABLED) אינו נתמך במצב זה.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from aiohttp import web, ClientSession
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+from config import (
+    ADMIN_ID, TELEGRAM_TOKEN, IS_RENDER, PORT, WEBHOOK_URL, WEBHOOK_SECRET_TOKEN,
+    ASYNC_MAX_PHOTO_JOBS, ASYNC_DB_WORKERS, IMAGE_STORAGE_MODE, IMAGE_STORE_MAX_BYTES,
+    OCR_CACHE_PERSISTENT, OCR_CACHE_TTL, OCR_MIN_CONFIDENCE, MATCH_STATS_DAYS, MULTI_FIND_ENABLED,
+    OCR_PREPROCESS_ENABLED, OCR_MIN_PHOTO_SIDE, OCR_MAX_UPLOAD_SIDE, OCR_JPEG_QUALITY,
+    OCR_HOLD_MAX_SECONDS, OCR_HOLD_MAX_ATTEMPTS, ALBUM_BATCH_ENABLED, ALBUM_COLLECT_SECONDS,
+    ADMIN_REVIEW_MODE, ADMIN_DIGEST_INTERVAL, ADMIN_DIGEST_MAX_ITEMS, WEBHOOK_QUEUE_ENABLED,
+    UPDATE_DEDUP_ENABLED, UPDATE_DEDUP_WINDOW, PROCESSED_MESSAGES_RETENTION_HOURS
+)
+from db_manager import DBManager
+from async_db import AsyncDBManager
+from ocr_service import OCRService, AsyncOCRService
+from ocr_backends import OCRUnavailableError
+from image_store import ImageStore
+from image_prep import ImagePreprocessor
+from photo_workers import StageTimer
+from update_dedup import UpdateDeduplicator
+from group_scheduler import GroupScheduler
+from album_collector import AlbumCollector
+from admin_digest import AdminDigestSender
+from game_flow import GameFlow
+from bot_messages import (
+    WELCOME_TEXT, GROUP_ONLY_TEXT, GAME_OVER_TEXT, NO_CURRENT_TEXT, LOADING_TEXT, BUSY_TEXT, OCR_HELD_TEXT,
+    game_started_text, current_number_text, stats_text, stats_alert_text, processing_error_text,
+    digest_item_caption, digest_text, digest_markup, digest_done_text
+)
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+# יצירת מופע הבוט
+bot = AsyncTeleBot(TELEGRAM_TOKEN)
+
+# יצירת מופעי השירותים
+db = DBManager()
+adb = AsyncDBManager(db, max_workers=ASYNC_DB_WORKERS)
+ocr_service = AsyncOCRService(OCRService(db=db), adb.run)
+image_preprocessor = ImagePreprocessor(
+    enabled=OCR_PREPROCESS_ENABLED,
+    min_side=OCR_MIN_PHOTO_SIDE,
+    max_side=OCR_MAX_UPLOAD_SIDE,
+    quality=OCR_JPEG_QUALITY
+)
+image_store = ImageStore(max_bytes=IMAGE_STORE_MAX_BYTES)
+
+# זיהוי עדכונים והודעות תמונה שטלגרם שלח שוב
+update_dedup = UpdateDeduplicator(db, window=UPDATE_DEDUP_WINDOW) if UPDATE_DEDUP_ENABLED else None
+
+# מעברי המצב, טקסטי התשובה ושמירת התמונות - משותפים עם הבוט הסינכרוני
+group_scheduler = GroupScheduler()
+flow = GameFlow(
+    db, group_scheduler, image_store,
+    storage_mode=IMAGE_STORAGE_MODE,
+    min_confidence=OCR_MIN_CONFIDENCE,
+    multi_find=MULTI_FIND_ENABLED,
+    review_mode=ADMIN_REVIEW_MODE
+)
+
+# הגבלת מספר עיבודי התמונה המקבילים
+photo_slots = asyncio.Semaphore(ASYNC_MAX_PHOTO_JOBS)
+photo_jobs = {'in_flight': 0, 'processed': 0, 'rejected': 0}
+
+# משימות רקע פעילות (שמירת הפניה מונעת את איסופן לפני סיומן)
+background_tasks = set()
+
+# לולאת האירועים של הבוט - איסוף האלבומים ושליחת הסיכומים רצים בתהליכונים
+# ומעבירים אליה את הקריאות לטלגרם (נקבעת ב-run_async_bot)
+event_loop = None
+
+
+def spawn(coro):
+    """הפעלת משימת רקע ושמירת הפניה אליה עד לסיומה"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+async def reply_or_send(message, text, reply_markup=None):
+    """ננסה לשלוח כתגובה, אם נכשל נשלח הודעה רגילה"""
+    try:
+        return await bot.reply_to(message, text, reply_markup=reply_markup)
+    except Exception as reply_error:
+        logger.warning(f"לא ניתן לשלוח תגובה: {reply_error}")
+        return await bot.send_message(message.chat.id, text, reply_markup=reply_markup)
+
+
+@bot.message_handler(commands=['start', 'help'])
+async def send_welcome(message):
+    """טיפול בפקודות התחלה ועזרה"""
+    await bot.reply_to(message, WELCOME_TEXT)
+
+
+@bot.message_handler(commands=['start_game'])
+async def start_game(message):
+    """התחלת משחק חדש"""
+    # בדיקה שההודעה נשלחה בקבוצה
+    if message.chat.type not in ['group', 'supergroup']:
+        await bot.reply_to(message, GROUP_ONLY_TEXT)
+        return
+
+    group_id = message.chat.id
+
+    # בחירת מספר ראשון לחיפוש
+    number, markup = await adb.run(flow.start_game, group_id)
+    if number is None:
+        await bot.reply_to(message, GAME_OVER_TEXT)
+        return
+
+    await bot.send_message(group_id, game_started_text(number), reply_markup=markup)
+
+
+@bot.message_handler(commands=['current_number'])
+async def show_current_number(message):
+    """הצגת המספר הנוכחי לחיפוש"""
+    number, markup = await adb.run(flow.current_number, message.chat.id)
+    if number is None:
+        await bot.reply_to(message, GAME_OVER_TEXT)
+        return
+
+    await bot.reply_to(message, current_number_text(number), reply_markup=markup)
+
+
+@bot.message_handler(commands=['stats'])
+async def show_stats(message):
+    """הצגת סטטיסטיקות משחק"""
+    stats = await adb.get_stats(message.chat.id)
+    await bot.reply_to(message, stats_text(stats))
+
+
+@bot.message_handler(content_types=['photo'])
+async def handle_photo(message):
+    """טיפול בתמונות - העיבוד עצמו רץ כמשימת רקע"""
+    # תמונה שכבר עובדה (עדכון שטלגרם שלח שוב) - ללא OCR וללא סימון מציאה נוסף
+    if update_dedup is not None and not await adb.run(update_dedup.first_message, message):
+        return
+
+    # תמונה מאלבום - ממתינה לשאר התמונות ומעובדת יחד איתן
+    if ALBUM_BATCH_ENABLED and message.media_group_id:
+        album_collector.add(message)
+        return
+
+    await start_photo([message])
+
+
+def collect_album(messages, update_ids):
+    """העברת אלבום שנאסף (מתהליכון האיסוף) ללולאת האירועים"""
+    asyncio.run_coroutine_threadsafe(start_photo(messages), event_loop)
+
+
+async def finish_photo_messages(messages):
+    """רישום הודעות התמונה כמעובדות, לאחר שהטיפול בהן הסתיים"""
+    if update_dedup is not None:
+        for message in messages:
+            await adb.run(update_dedup.finish_message, message)
+
+
+def release_photo_messages(messages):
+    """שחרור הודעות התמונה שהטיפול בהן נכשל, כדי שעדכון חוזר יעובד"""
+    if update_dedup is not None:
+        for message in messages:
+            update_dedup.release_message(message)
+
+
+async def start_photo(messages):
+    """
+    קבלת המספר הנוכחי והפעלת עיבוד התמונה (או האלבום) ברקע
+
+    משימת העיבוד רושמת את ההודעות כמעובדות בסיומה; אם לא הופעלה משימה
+    הן נרשמות כאן.
+    """
+    message = messages[0]
+    try:
+        current_number, reply = await adb.run(flow.number_for_photo, message.chat.id)
+
+        if current_number is None:
+            # אין מספר נוכחי - נבחר מספר חדש (או שהמשחק הסתיים) והתמונה אינה נבדקת
+            await reply_or_send(message, reply)
+        elif photo_slots.locked():
+            # כל המקומות לעיבוד תפוסים
+            photo_jobs['rejected'] += 1
+            logger.warning("מגבלת עיבודי התמונה המקבילים הושגה, התמונה נדחתה")
+            await reply_or_send(message, BUSY_TEXT)
+        else:
+            spawn(process_photo(messages, current_number))
+            return
+    except Exception:
+        release_photo_messages(messages)
+        raise
+
+    await finish_photo_messages(messages)
+
+
+async def send_admin_photo(file_id, image_data, caption, reply_markup=None):
+    """שליחת תמונה למנהל לפי file_id, ואם נכשל - העלאה מחדש של התמונה השמורה"""
+    try:
+        return await bot.send_photo(ADMIN_ID, file_id, caption=caption, reply_markup=reply_markup)
+    except Exception as file_id_error:
+        image_bytes = await adb.run(flow.load_stored_image, image_data)
+        if image_bytes is None:
+            raise
+        logger.warning(f"לא ניתן לשלוח תמונה למנהל לפי file_id, מעלה את התמונה מחדש: {file_id_error}")
+        return await bot.send_photo(ADMIN_ID, image_bytes, caption=caption, reply_markup=reply_markup)
+
+
+async def recognize_or_hold(image_bytes, loading_task):
+    """
+    זיהוי הלוחית, ובזמן שהשירות אינו זמין - המתנה לחזרתו במקום לדווח "לא נמצא"
+
+    ההמתנה מסתיימת כשהמפסק נסגר (או שקריאת ניסיון מצליחה), לאחר
+    OCR_HOLD_MAX_ATTEMPTS כשלים בפועל או לאחר OCR_HOLD_MAX_SECONDS.
+    """
+    held_since = None
+    failures = 0
+    while True:
+        try:
+            return await ocr_service.recognize_plate(image_bytes)
+        except OCRUnavailableError as e:
+            breaker = ocr_service.breaker
+            failures += not e.fail_fast
+            if held_since is None:
+                held_since = time.monotonic()
+                try:
+                    loading_message = await loading_task
+                    await bot.edit_message_text(OCR_HELD_TEXT, loading_message.chat.id, loading_message.message_id)
+                except Exception as edit_error:
+                    logger.warning(f"לא ניתן לערוך הודעת טעינה: {edit_error}")
+
+            if breaker is None or failures >= OCR_HOLD_MAX_ATTEMPTS or \
+                    time.monotonic() - held_since > OCR_HOLD_MAX_SECONDS:
+                logger.warning("התמונה לא זוהתה גם לאחר המתנה לשירות - מועברת למנהל")
+                return None
+
+            await asyncio.sleep(breaker.reset_timeout / 4)
+
+
+async def download_photo(message):
+    """
+    הורדת תמונה לזיהוי
+
+    Returns:
+        tuple: (ה-file_id של הגודל הגדול ביותר - נשלח למנהל ללא הורדה, תוכן הגודל שהורד)
+    """
+    file_info = await bot.get_file(image_preprocessor.select_size(message.photo).file_id)
+    return message.photo[-1].file_id, await bot.download_file(file_info.file_path)
+
+
+async def recognize_photo(image_bytes, loading_task):
+    """הכנת תמונה (Pillow חוסם - רץ במאגר התהליכונים) וזיהוי הלוחיות בה"""
+    ocr_image = await adb.run(image_preprocessor.prepare, image_bytes)
+    ocr_result = await recognize_or_hold(ocr_image, loading_task)
+    return ocr_service.match_plates(ocr_result)
+
+
+async def process_photo(messages, current_number):
+    """
+    צינור עיבוד תמונה או אלבום: הורדה, זיהוי לוחית ותשובה אחת למשתמש
+
+    הודעת הטעינה נשלחת במקביל להורדה, תמונות אלבום מורדות ומזוהות
+    במקביל, והשמירה וההודעה למנהל רצות ברקע לאחר התשובה למשתמש.
+    """
+    async with photo_slots:
+        photo_jobs['in_flight'] += 1
+        timer = StageTimer()
+        message = messages[0]
+        group_id = message.chat.id
+        loading_task = spawn(reply_or_send(message, LOADING_TEXT))
+        loading_message = None
+
+        try:
+            with timer.stage('download'):
+                downloads = await asyncio.gather(*(download_photo(photo) for photo in messages))
+
+            with timer.stage('ocr'):
+                matches = await asyncio.gather(*(
+                    recognize_photo(image_bytes, loading_task) for _, image_bytes in downloads
+                ))
+
+            # בדיקת ההתאמה, סימון המציאה ובחירת מספר חדש (תחת המתזמן של הקבוצה)
+            with timer.stage('db'):
+                outcome = await adb.run(flow.judge_photos, messages, current_number, matches)
+
+            with timer.stage('loading_wait'):
+                loading_message = await loading_task
+
+            if outcome.claimed:
+                try:
+                    await bot.delete_message(group_id, loading_message.message_id)
+                except Exception as delete_error:
+                    logger.warning(f"לא ניתן למחוק הודעת טעינה: {delete_error}")
+
+                # תשובה לתמונה שבה המספר זוהה
+                with timer.stage('reply'):
+                    await reply_or_send(messages[outcome.credited], outcome.text, outcome.markup)
+            else:
+                with timer.stage('reply'):
+                    try:
+                        await bot.edit_message_text(outcome.text, group_id, loading_message.message_id)
+                    except Exception as edit_error:
+                        logger.warning(f"לא ניתן לערוך הודעת טעינה: {edit_error}")
+                        await reply_or_send(message, outcome.text)
+
+            # שמירה במסד הנתונים והודעה למנהל - לאחר שהמשתמש קיבל תשובה
+            if len(messages) > 1:
+                spawn(persist_album(messages, current_number, downloads, matches, outcome))
+            else:
+                file_id, image_bytes = downloads[0]
+                spawn(persist_submission(message, current_number, file_id, image_bytes, outcome))
+
+        except Exception as e:
+            logger.error(f"Error processing image: {e}")
+            try:
+                if loading_message is None and not loading_task.cancelled():
+                    loading_message = await loading_task
+                if loading_message is not None:
+                    try:
+                        await bot.edit_message_text(processing_error_text(e), group_id, loading_message.message_id)
+                    except Exception:
+                        pass
+                await reply_or_send(message, processing_error_text(e))
+            except Exception as final_error:
+                logger.error(f"שגיאה חמורה בטיפול בתמונה: {final_error}")
+
+        finally:
+            photo_jobs['in_flight'] -= 1
+            photo_jobs['processed'] += 1
+            logger.info(f"עיבוד תמונה הסתיים: {timer.format_timings()}")
+            await finish_photo_messages(messages)
+
+
+async def persist_submission(message, current_number, file_id, image_bytes, outcome):
+    """שמירת התמונה ונתוני הזיהוי ושליחת ההודעה למנהל"""
+    timer = StageTimer()
+    try:
+        with timer.stage('db'):
+            image_data = await adb.run(
+                flow.persist_photo, message, current_number, file_id, image_bytes, outcome,
+                preprocessed=image_preprocessor.enabled
+            )
+
+        # שליחת ההודעה למנהל (במצב סיכומים התמונה ממתינה לסיכום הבא)
+        if image_data is not None:
+            with timer.stage('notify'):
+                try:
+                    await send_admin_photo(
+                        file_id, image_data, caption=outcome.admin_caption, reply_markup=outcome.admin_markup
+                    )
+                except Exception as admin_error:
+                    logger.error(f"שגיאה בשליחת הודעה למנהל: {admin_error}")
+
+    except Exception as e:
+        logger.error(f"שגיאה בשמירת נתוני התמונה: {e}")
+
+    logger.info(f"שמירת תמונה והודעה למנהל הסתיימו: {timer.format_timings()}")
+
+
+async def persist_album(messages, current_number, downloads, matches, outcome):
+    """שמירת תמונות האלבום בטרנזקציה אחת ושליחתן למנהל כסיכום אחד"""
+    timer = StageTimer()
+    try:
+        with timer.stage('db'):
+            digest_id, items = await adb.run(
+                flow.persist_album, messages, current_number, downloads, matches, outcome,
+                preprocessed=image_preprocessor.enabled
+            )
+
+        if digest_id is not None and items:
+            with timer.stage('notify'):
+                try:
+                    await send_review_digest(digest_id, items)
+                except Exception as admin_error:
+                    logger.error(f"שגיאה בשליחת האלבום למנהל: {admin_error}")
+
+    except Exception as e:
+        logger.error(f"שגיאה בשמירת נתוני האלבום: {e}")
+
+    logger.info(f"שמירת אלבום של {len(messages)} תמונות והודעה למנהל הסתיימו: {timer.format_timings()}")
+
+
+async def send_digest_photos(items, photos):
+    """שליחת תמונות הסיכום למנהל (photos - התמונה של כל פריט לפי הסדר)"""
+    if len(items) == 1:
+        await bot.send_photo(ADMIN_ID, photos[0], caption=digest_item_caption(items[0]))
+    else:
+        await bot.send_media_group(ADMIN_ID, [
+            types.InputMediaPhoto(photo, caption=digest_item_caption(item))
+            for item, photo in zip(items, photos)
+        ])
+
+
+async def send_review_digest(digest_id, items):
+    """
+    שליחת סיכום בדיקה למנהל: קבוצת מדיה של התמונות והודעה עם הכפתורים
+
+    אם השליחה לפי file_id נכשלת, התמונות השמורות מועלות מחדש.
+    """
+    try:
+        await send_digest_photos(items, [item['file_id'] for item in items])
+    except Exception as file_id_error:
+        logger.warning(f"לא ניתן לשלוח את תמונות הסיכום {digest_id} לפי file_id, מעלה אותן מחדש: {file_id_error}")
+        stored = await asyncio.gather(*(adb.run(flow.load_stored_image, item) for item in items))
+        await send_digest_photos(items, [data or item['file_id'] for item, data in zip(items, stored)])
+
+    await bot.send_message(ADMIN_ID, digest_text(items), reply_markup=digest_markup(digest_id, items))
+    logger.info(f"נשלח למנהל סיכום {digest_id} עם {len(items)} תמונות")
+
+
+def send_review_digest_from_thread(digest_id, items):
+    """שליחת סיכום מתהליכון הסיכומים דרך לולאת האירועים (שגיאה מחזירה את התמונות לתור)"""
+    asyncio.run_coroutine_threadsafe(send_review_digest(digest_id, items), event_loop).result()
+
+
+# איסוף תמונות של אלבום לעיבוד אחד
+album_collector = AlbumCollector(collect_album, window=ALBUM_COLLECT_SECONDS)
+
+# שליחת סיכומי בדיקה תקופתיים למנהל (מצב ADMIN_REVIEW_MODE=digest)
+admin_digest = AdminDigestSender(
+    db, send_review_digest_from_thread, interval=ADMIN_DIGEST_INTERVAL, max_items=ADMIN_DIGEST_MAX_ITEMS
+)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith(('approve_', 'reject_')))
+async def handle_admin_actions(call):
+    """טיפול בפעולות מנהל"""
+    if call.from_user.id != ADMIN_ID:
+        await bot.answer_callback_query(call.id, "אין לך הרשאות מנהל!")
+        return
+
+    action, message_id = call.data.split('_')
+    message_id = int(message_id)
+
+    # סימון המספר (או החזרתו למאגר), ניקוי נתוני התמונה וטקסטי ההודעות
+    result = await adb.run(flow.apply_admin_action, action, message_id)
+    if result is None:
+        await bot.answer_callback_query(call.id, "הנתונים על התמונה הזו כבר לא זמינים.")
+        return
+
+    await bot.send_message(result['group_id'], result['text'], reply_markup=result['markup'])
+    await bot.answer_callback_query(call.id, "הפעולה בוצעה בהצלחה!")
+
+    if result['digest_id'] is not None:
+        # תמונה מסיכום - הסרת הכפתור שלה מהודעת הסיכום
+        markup = digest_markup(result['digest_id'], result['remaining']) if result['remaining'] else None
+        await bot.edit_message_reply_markup(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            reply_markup=markup
+        )
+    else:
+        # עדכון הודעת המנהל ומחיקת המקלדת
+        await bot.edit_message_caption(
+            caption=result['caption'],
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id
+        )
+        await bot.edit_message_reply_markup(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            reply_markup=None
+        )
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith(('digest_approve_', 'digest_reject_')))
+async def handle_digest_actions(call):
+    """אישור או פסילה של כל התמונות שנותרו בסיכום"""
+    if call.from_user.id != ADMIN_ID:
+        await bot.answer_callback_query(call.id, "אין לך הרשאות מנהל!")
+        return
+
+    _, action, digest_id = call.data.split('_')
+    digest_id = int(digest_id)
+
+    # כל שינויי המצב מתבצעים בטרנזקציה אחת
+    items, notifications = await adb.run(flow.apply_digest_action, digest_id, action)
+    if notifications is None:
+        await bot.answer_callback_query(call.id, "שגיאה בביצוע הפעולה, נסו שוב.")
+        return
+    if not items:
+        await bot.answer_callback_query(call.id, "התמונות בסיכום הזה כבר טופלו.")
+        return
+
+    await bot.answer_callback_query(call.id, "הפעולה בוצעה בהצלחה!")
+    await bot.edit_message_text(
+        digest_done_text(len(items), action),
+        chat_id=call.message.chat.id,
+        message_id=call.message.message_id,
+        reply_markup=None
+    )
+
+    # הודעות לקבוצות על השינויים
+    for notification in notifications:
+        try:
+            await bot.send_message(notification['group_id'], notification['text'], reply_markup=notification['markup'])
+        except Exception as e:
+            logger.error(f"שגיאה בשליחת הודעה לקבוצה {notification['group_id']}: {e}")
+
+
+@bot.callback_query_handler(func=lambda call: call.data in ["current", "stats"])
+async def handle_inline_buttons(call):
+    """טיפול בלחיצות על כפתורים אינליין"""
+    group_id = call.message.chat.id
+
+    if call.data == "current":
+        current_number = await adb.get_current_number(group_id)
+        if current_number is None:
+            await bot.answer_callback_query(call.id, NO_CURRENT_TEXT)
+        else:
+            await bot.answer_callback_query(call.id, current_number_text(current_number))
+
+    elif call.data == "stats":
+        stats = await adb.get_stats(group_id)
+        await bot.answer_callback_query(call.id, stats_alert_text(stats), show_alert=True)
+
+
+def collect_metrics():
+    """איסוף מדדי הביצועים של שירותי הבוט"""
+    return {
+        'runtime': 'async',
+        'db_pool': db.pool.stats(),
+        'game_state_cache': db.state_cache.stats(),
+        'ocr_cache': ocr_service.cache_stats(),
+        'ocr_backends': ocr_service.backend_stats(),
+        'image_preprocessor': image_preprocessor.stats(),
+        'photo_jobs': {**photo_jobs, 'limit': ASYNC_MAX_PHOTO_JOBS, 'background_tasks': len(background_tasks)},
+        'albums': album_collector.stats() if ALBUM_BATCH_ENABLED else {'enabled': False},
+        'image_store': image_store.stats(),
+        'group_scheduler': group_scheduler.stats(),
+        'admin_digest': admin_digest.stats() if ADMIN_REVIEW_MODE == 'digest' else {'enabled': False},
+        'update_dedup': update_dedup.stats() if update_dedup is not None else {'enabled': False}
+    }
+
+
+async def collect_metrics_async():
+    """מדדי הביצועים כולל נתוני ההתאמה ממסד הנתונים"""
+    return {**collect_metrics(), 'match_outcomes': await adb.match_outcome_stats(MATCH_STATS_DAYS)}
+
+
+def create_web_app():
+    """אפליקציית aiohttp עבור webhook"""
+
+    async def index(request):
+        return web.Response(text="בוט צייד לוחיות רישוי פעיל!")
+
+    async def metrics(request):
+        return web.json_response(await collect_metrics_async())
+
+    async def webhook(request):
+        # אימות שהבקשה הגיעה מטלגרם
+        if WEBHOOK_SECRET_TOKEN and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET_TOKEN:
+            logger.warning("התקבלה בקשת webhook עם טוקן סודי שגוי")
+            return web.Response(status=403, text='forbidden')
+
+        try:
+            update = types.Update.de_json(await request.text())
+            if update_dedup is not None and not update_dedup.first_update(update.update_id):
+                return web.Response(text='')
+            spawn(bot.process_new_updates([update]))
+            return web.Response(text='')
+        except Exception as e:
+            logger.error(f"שגיאה בטיפול בעדכון: {e}")
+            return web.Response(text='error')
+
+    app = web.Application()
+    app.router.add_get('/', index)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_post('/' + TELEGRAM_TOKEN, webhook)
+    return app
+
+
+async def keep_alive(app_url):
+    """פינג לשרת כל 10 דקות כדי שלא יירדם"""
+    async with ClientSession() as session:
+        while True:
+            try:
+                logger.info("[Keep-Alive] מבצע פעולת שמירה על עירנות...")
+                async with session.get(app_url) as response:
+                    logger.info(f"[Keep-Alive] סטטוס תגובה: {response.status}")
+            except Exception as e:
+                logger.error(f"[Keep-Alive] שגיאה בביצוע פעולת שמירה על עירנות: {str(e)}")
+            await asyncio.sleep(600)
+
+
+async def run_async_bot():
+    """הפעלת הבוט האסינכרוני (webhook ב-Render או polling מקומי)"""
+    global event_loop
+
+    # העדכונים מעובדים ישירות בלולאת האירועים - אין צרכני תור עדכונים
+    if WEBHOOK_QUEUE_ENABLED:
+        logger.error("הבוט לא הופעל: WEBHOOK_QUEUE_ENABLED אינו נתמך במצב BOT_RUNTIME=async")
+        return
+
+    event_loop = asyncio.get_running_loop()
+    if IMAGE_STORAGE_MODE != 'memory':
+        os.makedirs('data', exist_ok=True)
+
+    # ניקוי תמונות זמניות ישנות
+    await adb.clean_old_temp_images(hours=24)
+    await adb.clean_old_processed_messages(hours=PROCESSED_MESSAGES_RETENTION_HOURS)
+    if OCR_CACHE_PERSISTENT:
+        await adb.clean_old_ocr_cache(OCR_CACHE_TTL)
+
+    # בדיקת סטטוס הבוט
+    try:
+        db_ok = await adb.test_connection()
+        bot_info = await bot.get_me()
+        logger.info(f"בדיקת סטטוס בוט: מסד נתונים - {'תקין' if db_ok else 'שגיאה'}, בוט - תקין")
+        logger.info(f"פרטי הבוט: @{bot_info.username} (ID: {bot_info.id})")
+    except Exception as e:
+        logger.error(f"הבוט לא הופעל עקב שגיאה בבדיקת סטטוס: {e}")
+        return
+    if not db_ok:
+        logger.error("הבוט לא הופעל עקב שגיאה בחיבור למסד הנתונים")
+        return
+
+    if ADMIN_REVIEW_MODE == 'digest':
+        admin_digest.start()
+
+    try:
+        if IS_RENDER:
+            logger.info("מפעיל במצב webhook אסינכרוני עבור Render")
+            if WEBHOOK_URL:
+                webhook_url = WEBHOOK_URL
+            else:
+                logger.warning("אזהרה: WEBHOOK_URL לא מוגדר. ייתכן שהבוט לא יעבוד כראוי.")
+                service_name = os.environ.get('RENDER_SERVICE_NAME', 'app')
+                webhook_url = f"https://{service_name}.onrender.com/{TELEGRAM_TOKEN}"
+
+            base_url = webhook_url.split('/' + TELEGRAM_TOKEN)[0] if TELEGRAM_TOKEN in webhook_url else webhook_url
+            spawn(keep_alive(base_url))
+
+            await bot.remove_webhook()
+            await asyncio.sleep(1)
+            await bot.set_webhook(url=webhook_url, secret_token=WEBHOOK_SECRET_TOKEN)
+
+            runner = web.AppRunner(create_web_app())
+            await runner.setup()
+            await web.TCPSite(runner, '0.0.0.0', PORT).start()
+            logger.info(f"מפעיל שרת על פורט {PORT}")
+            await asyncio.Event().wait()
+        else:
+            logger.info("מפעיל במצב polling אסינכרוני מקומי")
+            await bot.remove_webhook()
+            await asyncio.sleep(1)
+            await bot.infinity_polling(timeout=60, request_timeout=90)
+    finally:
+        album_collector.flush_all()
+        await adb.run(admin_digest.stop)
+        await ocr_service.close()
+        await bot.close_session()
+        adb.close()
+
+
+def run():
+    """נקודת כניסה למצב async"""
+    try:
+        asyncio.run(run_async_bot())
+    except KeyboardInterrupt:
+        logger.info("הבוט הופסק על ידי המשתמש.")
@@ -0,0 +1,50 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+class AsyncDBManager:
+    """
+    גישה אסינכרונית למסד הנתונים מעל DBManager
+
+    כל קריאה למתודה של DBManager רצה במאגר תהליכונים חסום (בגודל מאגר
+    החיבורים), כך שלולאת האירועים לא נחסמת ונשמרת בדיוק אותה התנהגות:
+    אותן טרנזקציות, נעילות ומטמון מצב המשחק.
+
+    שימוש: await adb.mark_number_as_found(group_id, number, user_id)
+    """
+
+    def __init__(self, db, max_workers=10):
+        """
+        Args:
+            db: מופע DBManager
+            max_workers: מספר הפניות המקבילות המרבי למסד הנתונים
+        """
+        self.db = db
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='async-db')
+
+    async def run(self, func, *args, **kwargs):
+        """הרצת פונקציה חוסמת במאגר התהליכונים של מסד הנתונים"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self.db, name)
+        if not callable(method):
+            return method
+
+        async def call(*args, **kwargs):
+            return await self.run(method, *args, **kwargs)
+
+        call.__name__ = name
+        call.__doc__ = method.__doc__
+        return call
+
+    def close(self):
+        """עצירת מאגר התהליכונים וסגירת החיבורים"""
+        self.executor.shutdown(wait=True)
+        self.db.close()
@@ -0,0 +1,103 @@
+"""
+מדידת ביצועים של מנוע ההתאמה (plate_matcher) על תשובות OCR סינתטיות גדולות
+
+משווה בין הבדיקה הישנה (חילוץ קטעים ובדיקת any על כל מחרוזת) לבין בניית
+קבוצת החלונות פעם אחת ובדיקה במילון.
+
+    python benchmark_matcher.py --results 50 --candidates 10 --checks 1000
+"""
+
+import argparse
+import random
+import string
+import time
+from plate_matcher import PlateMatch
+
+
+def synthetic_ocr_result(num_results, num_candidates, rng):
+    """תשובת OCR סינתטית במבנה של PlateRecognizer"""
+    def random_plate():
+        length = rng.choice((7, 8))
+        plate = ''.join(rng.choice(string.digits) for _ in range(length))
+        # חלק מהלוחיות מכילות אות באמצע
+        if rng.random() < 0.2:
+            index = rng.randrange(1, length - 1)
+            plate = plate[:index] + rng.choice(string.ascii_lowercase) + plate[index + 1:]
+        return plate
+
+    results = []
+    for _ in range(num_results):
+        score = round(rng.uniform(0.5, 1.0), 3)
+        candidates = [{'plate': random_plate(), 'score': round(rng.uniform(0.1, score), 3)} for _ in range(num_candidates)]
+        plate = random_plate()
+        candidates.insert(0, {'plate': plate, 'score': score})
+        results.append({'plate': plate, 'score': score, 'candidates': candidates})
+    return {'results': results}
+
+
+def legacy_extract(ocr_result):
+    """החילוץ הקודם של OCRService.extract_plate_numbers (לוחית מלאה וקטעי 3 ספרות)"""
+    plates = []
+    if not ocr_result or 'results' not in ocr_result:
+        return plates
+    for result in ocr_result['results']:
+        plate_text = result.get('plate', '').replace('-', '').replace(' ', '')
+        if plate_text:
+            plates.append(plate_text)
+        if len(plate_text) >= 3:
+            if len(plate_text) % 2 == 1:
+                mid_index = len(plate_text) // 2
+                plates.append(plate_text[mid_index-1:mid_index+2])
+            else:
+                plates.append(plate_text[:3])
+                plates.append(plate_text[-3:])
+    return plates
+
+
+def measure(label, func, repeat):
+    """הרצת func מספר פעמים והדפסת הזמן הממוצע"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {elapsed / repeat * 1e6:>10.1f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the plate matching engine")
+    parser.add_argument('--results', type=int, default=50, help="plates per OCR payload")
+    parser.add_argument('--candidates', type=int, default=10, help="candidates per plate")
+    parser.add_argument('--checks', type=int, default=1000, help="target numbers checked per payload")
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    ocr_result = synthetic_ocr_result(args.results, args.candidates, rng)
+    targets = [rng.randrange(1000) for _ in range(args.checks)]
+    found_numbers = set(rng.sample(range(1000), 500))
+
+    print(f"Payload: {args.results} results x {args.candidates + 1} candidates, {args.checks} checks")
+
+    def legacy():
+        plates = legacy_extract(ocr_result)
+        for number in targets:
+            number_str = str(number).zfill(3)
+            any(number_str in plate for plate in plates)
+
+    def matcher():
+        match = PlateMatch.from_ocr_result(ocr_result)
+        for number in targets:
+            number in match
+
+    match = PlateMatch.from_ocr_result(ocr_result)
+
+    measure("legacy extract + any() per check", legacy, args.repeat)
+    measure("PlateMatch build + lookup per check", matcher, args.repeat)
+    measure("PlateMatch build only", lambda: PlateMatch.from_ocr_result(ocr_result), args.repeat)
+    measure("covered() against 500 found numbers", lambda: match.covered(found_numbers, 1000), args.repeat)
+    print(f"Windows indexed: {len(match.windows)}")
+
+
+if __name__ == "__main__":
+    main()
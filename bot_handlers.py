@@ -1,7 +1,19 @@
-import os
+import time
 import telebot
-from telebot import types
-from config import ADMIN_ID, TELEGRAM_TOKEN
+from telebot import util
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    ADMIN_ID, TELEGRAM_TOKEN, PHOTO_WORKERS, PHOTO_QUEUE_SIZE, IO_WORKERS, BOT_HANDLER_THREADS,
+    IMAGE_STORAGE_MODE, IMAGE_STORE_MAX_BYTES, WEBHOOK_QUEUE_ENABLED,
+    UPDATE_QUEUE_WORKERS, UPDATE_QUEUE_BATCH_SIZE, UPDATE_QUEUE_POLL_INTERVAL,
+    UPDATE_QUEUE_STALE_AFTER, UPDATE_QUEUE_MAX_ATTEMPTS, TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE,
+    TELEGRAM_GROUP_RATE_PER_MINUTE, TELEGRAM_CHAT_BURST, TELEGRAM_MAX_RETRIES,
+    ADMIN_REVIEW_MODE, ADMIN_DIGEST_INTERVAL, ADMIN_DIGEST_MAX_ITEMS, MULTI_FIND_ENABLED,
+    OCR_MIN_CONFIDENCE, MATCH_STATS_DAYS,
+    OCR_PREPROCESS_ENABLED, OCR_MIN_PHOTO_SIDE, OCR_MAX_UPLOAD_SIDE, OCR_JPEG_QUALITY,
+    OCR_HOLD_MAX_JOBS, OCR_HOLD_MAX_SECONDS, OCR_HOLD_MAX_ATTEMPTS,
+    ALBUM_BATCH_ENABLED, ALBUM_COLLECT_SECONDS, UPDATE_DEDUP_ENABLED, UPDATE_DEDUP_WINDOW
+)
 import logging
 
 # הגדרת לוגר
@@ -12,83 +24,110 @@ logging.basicConfig(
 )
 
 # יצירת מופע הבוט
-bot = telebot.TeleBot(TELEGRAM_TOKEN)
+# במצב תור עדכונים המטפלים רצים ישירות בתהליכוני הצרכן, כדי שעדכון יסומן
+# כמעובד רק לאחר שהמטפל שלו הסתיים בהצלחה
+bot = telebot.TeleBot(TELEGRAM_TOKEN, threaded=not WEBHOOK_QUEUE_ENABLED, num_threads=BOT_HANDLER_THREADS)
 
 # טעינת שירותים מודולים אחרים
 from ocr_service import OCRService
+from ocr_backends import OCRUnavailableError
+from ocr_guard import HeldJobs
 from db_manager import DBManager
+from photo_workers import PhotoJob, PhotoWorkerPool, StageTimer
+from image_store import ImageStore
+from update_queue import UpdateQueueConsumer
+from group_scheduler import GroupScheduler
+from telegram_dispatcher import TelegramDispatcher
+from admin_digest import AdminDigestSender
+from image_prep import ImagePreprocessor
+from album_collector import AlbumCollector
+from update_dedup import UpdateDeduplicator
+from game_flow import GameFlow
+from telebot import types
+from bot_messages import (
+    WELCOME_TEXT, GROUP_ONLY_TEXT, GAME_OVER_TEXT, NO_CURRENT_TEXT, LOADING_TEXT, BUSY_TEXT, OCR_HELD_TEXT,
+    game_started_text, current_number_text, stats_text, stats_alert_text, processing_error_text,
+    digest_item_caption, digest_text, digest_markup, digest_done_text
+)
 
 # יצירת מופעי השירותים
+outbox = TelegramDispatcher(
+    bot,
+    global_rate=TELEGRAM_GLOBAL_RATE,
+    chat_rate=TELEGRAM_CHAT_RATE,
+    group_rate_per_minute=TELEGRAM_GROUP_RATE_PER_MINUTE,
+    chat_burst=TELEGRAM_CHAT_BURST,
+    max_retries=TELEGRAM_MAX_RETRIES
+)
 db = DBManager()
-ocr_service = OCRService()
+ocr_service = OCRService(db=db)
+image_preprocessor = ImagePreprocessor(
+    enabled=OCR_PREPROCESS_ENABLED,
+    min_side=OCR_MIN_PHOTO_SIDE,
+    max_side=OCR_MAX_UPLOAD_SIDE,
+    quality=OCR_JPEG_QUALITY
+)
+image_store = ImageStore(max_bytes=IMAGE_STORE_MAX_BYTES)
+
+# זיהוי עדכונים והודעות תמונה שטלגרם שלח שוב (הודעה נרשמת כמעובדת רק בסיום
+# הטיפול בה, כך שניסיון חוזר מתור העדכונים אינו נדחה)
+update_dedup = UpdateDeduplicator(db, window=UPDATE_DEDUP_WINDOW) if UPDATE_DEDUP_ENABLED else None
+
+# מעברי מצב המשחק מתבצעים אחד בכל פעם לכל קבוצה, וקבוצות שונות רצות במקביל
+group_scheduler = GroupScheduler()
+
+# מעברי המצב, טקסטי התשובה ושמירת התמונות - משותפים למצב async (async_bot)
+flow = GameFlow(
+    db, group_scheduler, image_store,
+    storage_mode=IMAGE_STORAGE_MODE,
+    min_confidence=OCR_MIN_CONFIDENCE,
+    multi_find=MULTI_FIND_ENABLED,
+    review_mode=ADMIN_REVIEW_MODE
+)
+
+# מאגר תהליכונים לקריאות רשת עצמאיות שרצות במקביל (הודעות טעינה, שמירה והודעות למנהל)
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='io')
 
 @bot.message_handler(commands=['start', 'help'])
 def send_welcome(message):
     """טיפול בפקודות התחלה ועזרה"""
-    bot.reply_to(
-        message,
-        "ברוכים הבאים לבוט צייד לוחיות הרישוי! 🚗\n\n"
-        "במשחק זה תצטרכו למצוא לוחיות רישוי עם מספרים מסוימים.\n"
-        "כדי להתחיל משחק חדש, שלחו /start_game בקבוצה.\n"
-        "לצפייה במספר הנוכחי לחיפוש, שלחו /current_number.\n\n"
-        "בהצלחה!"
-    )
+    outbox.reply_to(message, WELCOME_TEXT)
 
 @bot.message_handler(commands=['start_game'])
 def start_game(message):
     """התחלת משחק חדש"""
     # בדיקה שההודעה נשלחה בקבוצה
     if message.chat.type not in ['group', 'supergroup']:
-        bot.reply_to(message, "ניתן להתחיל משחק רק בקבוצה!")
+        outbox.reply_to(message, GROUP_ONLY_TEXT)
         return
     
     # אתחול המשחק
     group_id = message.chat.id
     
-    # בחירת מספר ראשון לחיפוש
-    number = db.select_next_number(group_id)
+    # בחירת מספר ראשון לחיפוש והכנת מקלדת אינליין
+    number, markup = flow.start_game(group_id)
     
     if number is None:
-        bot.reply_to(message, "כל המספרים כבר נמצאו! המשחק הסתיים 🎉")
+        outbox.reply_to(message, GAME_OVER_TEXT)
         return
     
-    # הכנת מקלדת אינליין
-    markup = get_game_markup(group_id)
-    
     # שליחת הודעת התחלה
-    bot.send_message(
-        group_id,
-        f"המשחק התחיל! 🎮\n\n"
-        f"המספר הראשון לחיפוש: {number}\n\n"
-        f"צלמו לוחית רישוי עם המספר הזה ושלחו לכאן.",
-        reply_markup=markup
-    )
+    outbox.send_message(group_id, game_started_text(number), reply_markup=markup)
 
 @bot.message_handler(commands=['current_number'])
 def show_current_number(message):
     """הצגת המספר הנוכחי לחיפוש"""
     group_id = message.chat.id
     
-    # קבלת המספר הנוכחי
-    number = db.get_current_number(group_id)
+    # קבלת המספר הנוכחי (או בחירת מספר חדש) ומקלדת אינליין
+    number, markup = flow.current_number(group_id)
     
     if number is None:
-        # אין מספר נוכחי, בחירת מספר חדש
-        number = db.select_next_number(group_id)
-        
-        if number is None:
-            bot.reply_to(message, "כל המספרים כבר נמצאו! המשחק הסתיים 🎉")
-            return
-    
-    # הכנת מקלדת אינליין
-    markup = get_game_markup(group_id)
+        outbox.reply_to(message, GAME_OVER_TEXT)
+        return
     
     # שליחת הודעה עם המספר הנוכחי
-    bot.reply_to(
-        message,
-        f"המספר הנוכחי לחיפוש: {number}",
-        reply_markup=markup
-    )
+    outbox.reply_to(message, current_number_text(number), reply_markup=markup)
 
 @bot.message_handler(commands=['stats'])
 def show_stats(message):
@@ -99,212 +138,281 @@ def show_stats(message):
     stats = db.get_stats(group_id)
     
     # שליחת הודעה עם הסטטיסטיקות
-    bot.reply_to(
-        message,
-        f"📊 סטטיסטיקות משחק:\n\n"
-        f"מספרים שנמצאו: {stats['found']}/{stats['total']} ({stats['percentage']}%)\n"
-        f"מספרים שנותרו: {stats['remaining']}"
-    )
+    outbox.reply_to(message, stats_text(stats))
 
 @bot.message_handler(content_types=['photo'])
 def handle_photo(message):
     """טיפול בתמונות"""
+    # תמונה שכבר עובדה (עדכון שטלגרם שלח שוב) - ללא OCR וללא סימון מציאה נוסף
+    if update_dedup is not None and not update_dedup.first_message(message):
+        return
+    
+    # במצב תור עדכונים העדכון מסומן כמעובד רק כשעיבוד התמונה ברקע מסתיים
+    update_id = update_queue.defer() if WEBHOOK_QUEUE_ENABLED else None
+    
+    # תמונה מאלבום - ממתינה לשאר התמונות ומעובדת יחד איתן
+    if ALBUM_BATCH_ENABLED and message.media_group_id:
+        album_collector.add(message, update_id)
+        return
+    
+    update_ids = [update_id] if update_id is not None else []
+    try:
+        start_photo_job(message, update_ids=update_ids)
+    except Exception as e:
+        fail_photo_updates([message], update_ids, e)
+        raise
+
+def handle_album(messages, update_ids):
+    """טיפול באלבום שנאסף: הודעת טעינה, זיהוי ותשובה אחת לכל התמונות"""
+    try:
+        start_photo_job(messages[0], messages if len(messages) > 1 else None, update_ids)
+    except Exception as e:
+        fail_photo_updates(messages, update_ids, e)
+        raise
+
+def complete_photo_updates(messages, update_ids):
+    """סימון הודעות התמונה ועדכוני התור שלהן כמעובדים, לאחר שהטיפול בהן הסתיים"""
+    if update_dedup is not None:
+        for message in messages:
+            update_dedup.finish_message(message)
+    for update_id in update_ids:
+        update_queue.complete(update_id)
+
+def fail_photo_updates(messages, update_ids, error):
+    """שחרור הודעות התמונה שהטיפול בהן נכשל והחזרת עדכוני התור שלהן לתור"""
+    if update_dedup is not None:
+        for message in messages:
+            update_dedup.release_message(message)
+    for update_id in update_ids:
+        update_queue.fail(update_id, error)
+
+def start_photo_job(message, album=None, update_ids=()):
+    """
+    קבלת המספר הנוכחי, שליחת הודעת הטעינה והעברת התמונה (או האלבום) לעיבוד
+    
+    Args:
+        message: הודעת התמונה (באלבום - התמונה הראשונה, שאליה נשלחות התשובות)
+        album: כל הודעות התמונה של האלבום
+        update_ids: עדכוני תור העדכונים של התמונות, שיסומנו כמעובדים בסיום
+    """
     group_id = message.chat.id
+    messages = album or [message]
     
     # קבלת המספר הנוכחי לחיפוש
-    current_number = db.get_current_number(group_id)
+    current_number, reply = flow.number_for_photo(group_id)
     
     if current_number is None:
-        # אין מספר נוכחי, בחירת מספר חדש
-        current_number = db.select_next_number(group_id)
-        
-        if current_number is None:
-            try:
-                bot.reply_to(message, "כל המספרים כבר נמצאו! המשחק הסתיים 🎉")
-            except Exception as e:
-                logger.error(f"שגיאה בשליחת תגובה: {e}")
-                bot.send_message(group_id, "כל המספרים כבר נמצאו! המשחק הסתיים 🎉")
-            return
-        
+        # אין מספר נוכחי - נבחר מספר חדש (או שהמשחק הסתיים) והתמונה אינה נבדקת
         try:
-            bot.reply_to(message, f"המספר הנוכחי לחיפוש: {current_number}")
+            outbox.reply_to(message, reply)
         except Exception as e:
             logger.error(f"שגיאה בשליחת תגובה: {e}")
-            bot.send_message(group_id, f"המספר הנוכחי לחיפוש: {current_number}")
+            outbox.send_message(group_id, reply)
+        complete_photo_updates(messages, update_ids)
         return
     
-    try:
-        # שליחת הודעת טעינה - ננסה כתגובה, אם נכשל נשלח כהודעה רגילה
+    # שליחת הודעת טעינה במקביל להורדת התמונה ולזיהוי
+    loading_message = io_executor.submit(send_loading_message, message)
+    
+    job = PhotoJob(message, loading_message, current_number, album, update_ids)
+    
+    # ללא תהליכוני עבודה - עיבוד ישיר בתוך המטפל
+    if PHOTO_WORKERS <= 0:
+        process_photo_job(job)
+        return
+    
+    # העברת התמונה לעיבוד ברקע
+    if not photo_workers.submit(job):
         try:
-            loading_message = bot.reply_to(message, "🔍 מעבד את התמונה... אנא המתן")
-        except Exception as reply_error:
-            logger.warning(f"לא ניתן לשלוח תגובה: {reply_error}")
-            loading_message = bot.send_message(group_id, "🔍 מעבד את התמונה... אנא המתן")
-        
-        # קבלת התמונה הגדולה ביותר
-        file_id = message.photo[-1].file_id
-        file_info = bot.get_file(file_id)
-        
-        # הורדת התמונה
-        downloaded_file = bot.download_file(file_info.file_path)
-        
-        # וידוא שתיקיית הנתונים קיימת
-        os.makedirs('data', exist_ok=True)
-        
-        # שמירת התמונה בזיכרון זמני
-        image_path = f"data/temp_{message.message_id}.jpg"
-        with open(image_path, 'wb') as new_file:
-            new_file.write(downloaded_file)
+            outbox.edit_message_text(BUSY_TEXT, group_id, job.loading_message.message_id)
+        except Exception as edit_error:
+            logger.warning(f"לא ניתן לערוך הודעת טעינה: {edit_error}")
+            outbox.send_message(group_id, BUSY_TEXT)
+        complete_photo_updates(messages, update_ids)
+
+def hold_photo_job(job, error):
+    """
+    העברת תמונה להמתנה עד שירות הזיהוי יחזור לפעול
+
+    Returns:
+        bool: False אם אין המתנה (ללא מפסק זרם, חריגה ממגבלות ההמתנה או תור מלא)
+    """
+    if ocr_holds is None:
+        return False
+    
+    if not error.fail_fast:
+        job.ocr_failures += 1
+    first_hold = job.held_since is None
+    if first_hold:
+        job.held_since = time.monotonic()
+    
+    if job.ocr_failures >= OCR_HOLD_MAX_ATTEMPTS or time.monotonic() - job.held_since > OCR_HOLD_MAX_SECONDS:
+        logger.warning(f"התמונה {job.message.message_id} לא זוהתה גם לאחר המתנה לשירות - מועברת למנהל")
+        return False
+    if not ocr_holds.hold(job):
+        return False
+    
+    if first_hold and job.loading_message is not None:
+        try:
+            outbox.edit_message_text(OCR_HELD_TEXT, job.message.chat.id, job.loading_message.message_id)
+        except Exception as edit_error:
+            logger.warning(f"לא ניתן לערוך הודעת טעינה: {edit_error}")
+    return True
+
+def resubmit_photo_job(job):
+    """החזרת תמונה שהמתינה לתור העיבוד"""
+    job.enqueued_at = time.monotonic()
+    return photo_workers.submit(job)
+
+def send_loading_message(message):
+    """שליחת הודעת טעינה - ננסה כתגובה, אם נכשל נשלח כהודעה רגילה"""
+    try:
+        return outbox.reply_to(message, LOADING_TEXT)
+    except Exception as reply_error:
+        logger.warning(f"לא ניתן לשלוח תגובה: {reply_error}")
+        return outbox.send_message(message.chat.id, LOADING_TEXT)
+
+def send_admin_photo(file_id, image_data, caption, reply_markup=None):
+    """
+    שליחת תמונה למנהל לפי ה-file_id של טלגרם (ללא העלאה מחדש של התמונה)
+    
+    אם השליחה לפי file_id נכשלת והתמונה השמורה זמינה, היא מועלית מחדש.
+    """
+    try:
+        return outbox.send_photo(ADMIN_ID, file_id, caption=caption, reply_markup=reply_markup)
+    except Exception as file_id_error:
+        image_bytes = flow.load_stored_image(image_data)
+        if image_bytes is None:
+            raise
+        logger.warning(f"לא ניתן לשלוח תמונה למנהל לפי file_id, מעלה את התמונה מחדש: {file_id_error}")
+        return outbox.send_photo(ADMIN_ID, image_bytes, caption=caption, reply_markup=reply_markup)
+
+def download_photo(message):
+    """
+    הורדת תמונה לזיהוי
+    
+    Returns:
+        tuple: (ה-file_id של הגודל הגדול ביותר - נשלח למנהל ללא הורדה, תוכן הגודל שהורד)
+    """
+    file_id = message.photo[-1].file_id
+    
+    # הורדת הגודל הקטן ביותר שמספיק לזיהוי
+    file_info = bot.get_file(image_preprocessor.select_size(message.photo).file_id)
+    return file_id, bot.download_file(file_info.file_path)
+
+def process_photo_job(job):
+    """
+    עיבוד משימת תמונה או אלבום, וסימון ההודעות ועדכוני התור שלה כמעובדים בסיום
+    
+    משימה שממתינה לחזרת שירות הזיהוי עדיין לא הסתיימה - ההודעות והעדכונים
+    שלה יסומנו כשהיא תעובד שוב.
+    """
+    held = False
+    try:
+        if len(job.messages) > 1:
+            held = process_album_job(job)
+        else:
+            held = process_single_photo_job(job)
+    finally:
+        if not held:
+            complete_photo_updates(job.messages, job.update_ids)
+
+def process_single_photo_job(job):
+    """
+    צינור עיבוד תמונה: הורדה, זיהוי לוחית ותשובה למשתמש
+    
+    השמירה במסד הנתונים וההודעה למנהל מתבצעות ברקע לאחר התשובה למשתמש.
+    
+    Returns:
+        bool: True אם התמונה הועברה להמתנה לחזרת שירות הזיהוי
+    """
+    message = job.message
+    current_number = job.current_number
+    group_id = message.chat.id
+    loading_message = None
+    
+    try:
+        with job.stage('download'):
+            file_id, downloaded_file = download_photo(message)
         
-        # זיהוי לוחית רישוי
-        with open(image_path, 'rb') as image_file:
-            ocr_result = ocr_service.recognize_plate(image_file)
+        with job.stage('prepare'):
+            # הקטנה ודחיסה מחדש לפני השליחה ל-API
+            ocr_image = image_preprocessor.prepare(downloaded_file)
         
-        # חילוץ מספרי לוחיות
-        plate_numbers = ocr_service.extract_plate_numbers(ocr_result)
+        with job.stage('ocr'):
+            # זיהוי לוחית רישוי מהתמונה שהוכנה
+            try:
+                ocr_result = ocr_service.recognize_plate(ocr_image)
+            except OCRUnavailableError as ocr_error:
+                # השירות אינו זמין - התמונה ממתינה לחזרתו במקום להיחשב "לא נמצא"
+                if hold_photo_job(job, ocr_error):
+                    return True
+                ocr_result = None
+            
+            # חילוץ מספרי לוחיות וכל החלונות של 3 ספרות שבהן
+            match = ocr_service.match_plates(ocr_result)
         
-        # שמירת התמונה ונתוני הזיהוי במסד הנתונים
-        db.save_temp_image(
-            message_id=message.message_id,
-            image_path=image_path,
-            user_id=message.from_user.id,
-            username=message.from_user.first_name,
-            current_number=current_number,
-            group_id=group_id,
-            plate_numbers=plate_numbers
-        )
+        # בדיקת ההתאמה, סימון המציאה ובחירת מספר חדש - אחד בכל פעם לכל קבוצה,
+        # כדי ששתי תמונות של אותו מספר לא יזוכו שתיהן
+        with job.stage('db'):
+            outcome = flow.judge_photos([message], current_number, [match])
         
-        # בדיקה אם המספר המבוקש נמצא
-        current_number_str = str(current_number).zfill(3)
-        found = any(current_number_str in plate for plate in plate_numbers)
+        # הודעת הטעינה נשלחה במקביל להורדה ולזיהוי
+        with job.stage('loading_wait'):
+            loading_message = job.loading_message
         
-        if found:
+        if outcome.claimed:
             # המספר נמצא!
             try:
                 # מחיקת הודעת הטעינה - עטוף בtry-except למניעת שגיאות
-                bot.delete_message(group_id, loading_message.message_id)
+                outbox.delete_message(group_id, loading_message.message_id)
             except Exception as delete_error:
                 logger.warning(f"לא ניתן למחוק הודעת טעינה: {delete_error}")
             
-            # סימון המספר כנמצא ובחירת מספר חדש
-            next_number = db.mark_number_as_found(group_id, current_number, message.from_user.id)
-            
-            # שליחת הודעת הצלחה
-            success_message = (
-                f"🎉 מצוין! {message.from_user.first_name} מצא את המספר {current_number}!\n\n"
-            )
-            
-            # יצירת כפתורים למנהל
-            markup = types.InlineKeyboardMarkup()
-            markup.add(types.InlineKeyboardButton(
-                "❌ פסול מציאה זו",
-                callback_data=f"reject_{message.message_id}"
-            ))
-            
-            # שליחת ההודעה למנהל
-            try:
-                bot.send_photo(
-                    ADMIN_ID,
-                    open(image_path, 'rb'),
-                    caption=f"מציאה חדשה אושרה!\n\n"
-                            f"משתמש: {message.from_user.first_name}\n"
-                            f"מספר: {current_number}\n"
-                            f"מספרי לוחית שזוהו: {', '.join(plate_numbers)}",
-                    reply_markup=markup
-                )
-            except Exception as admin_error:
-                logger.error(f"שגיאה בשליחת הודעה למנהל: {admin_error}")
-            
             # שליחת הודעת הצלחה לקבוצה
-            if next_number is not None:
-                success_message += f"המספר הבא לחיפוש: {next_number}"
-                
-                # הכנת מקלדת אינליין
-                markup = get_game_markup(group_id)
-                
+            with job.stage('reply'):
                 # ננסה להשתמש בתגובה, אם נכשל נשלח הודעה רגילה
                 try:
-                    bot.reply_to(message, success_message, reply_markup=markup)
+                    outbox.reply_to(message, outcome.text, reply_markup=outcome.markup)
                 except Exception as reply_error:
                     logger.warning(f"לא ניתן לשלוח תגובה: {reply_error}")
-                    bot.send_message(group_id, success_message, reply_markup=markup)
-            else:
-                success_message += "כל המספרים נמצאו! המשחק הסתיים 🎉"
-                try:
-                    bot.reply_to(message, success_message)
-                except Exception as reply_error:
-                    logger.warning(f"לא ניתן לשלוח תגובה: {reply_error}")
-                    bot.send_message(group_id, success_message)
+                    outbox.send_message(group_id, outcome.text, reply_markup=outcome.markup)
         else:
-            logger.info(f"Plate numbers found: {plate_numbers}")
-
-            # המספר לא נמצא
-            try:
-                # עדכון הודעת הטעינה - עטוף בtry-except למניעת שגיאות
-                bot.edit_message_text(
-                    f"❌ המספר {current_number} לא זוהה בתמונה.\n\n"
-                    f"מספרי לוחית שזוהו: {', '.join(plate_numbers or ['לא זוהו מספרים'])}",
-                    group_id,
-                    loading_message.message_id
-                )
-            except Exception as edit_error:
-                logger.warning(f"לא ניתן לערוך הודעת טעינה: {edit_error}")
-                # ננסה לשלוח תגובה, אם נכשל נשלח הודעה רגילה
+            # המספר לא נמצא, או שמשתתף אחר מצא אותו בזמן העיבוד
+            with job.stage('reply'):
                 try:
-                    bot.reply_to(
-                        message,
-                        f"❌ המספר {current_number} לא זוהה בתמונה.\n\n"
-                        f"מספרי לוחית שזוהו: {', '.join(plate_numbers or ['לא זוהו מספרים'])}"
-                    )
-                except Exception as reply_error:
-                    logger.warning(f"לא ניתן לשלוח תגובה: {reply_error}")
-                    bot.send_message(
-                        group_id,
-                        f"❌ המספר {current_number} לא זוהה בתמונה.\n\n"
-                        f"מספרי לוחית שזוהו: {', '.join(plate_numbers or ['לא זוהו מספרים'])}"
-                    )
-            
-            # יצירת כפתורים למנהל
-            markup = types.InlineKeyboardMarkup()
-            markup.add(types.InlineKeyboardButton(
-                "✅ אשר למרות הכל",
-                callback_data=f"approve_{message.message_id}"
-            ))
-            
-            # שליחת ההודעה למנהל
-            try:
-                bot.send_photo(
-                    ADMIN_ID,
-                    open(image_path, 'rb'),
-                    caption=f"תמונה שלא אושרה אוטומטית:\n\n"
-                            f"משתמש: {message.from_user.first_name}\n"
-                            f"מספר לחיפוש: {current_number}\n"
-                            f"מספרי לוחית שזוהו: {', '.join(plate_numbers or ['לא זוהו מספרים'])}",
-                    reply_markup=markup
-                )
-            except Exception as admin_error:
-                logger.error(f"שגיאה בשליחת הודעה למנהל: {admin_error}")
+                    # עדכון הודעת הטעינה - עטוף בtry-except למניעת שגיאות
+                    outbox.edit_message_text(outcome.text, group_id, loading_message.message_id)
+                except Exception as edit_error:
+                    logger.warning(f"לא ניתן לערוך הודעת טעינה: {edit_error}")
+                    # ננסה לשלוח תגובה, אם נכשל נשלח הודעה רגילה
+                    try:
+                        outbox.reply_to(message, outcome.text)
+                    except Exception as reply_error:
+                        logger.warning(f"לא ניתן לשלוח תגובה: {reply_error}")
+                        outbox.send_message(group_id, outcome.text)
+        
+        # שמירה במסד הנתונים והודעה למנהל - לאחר שהמשתמש קיבל תשובה
+        io_executor.submit(persist_submission, message, current_number, file_id, downloaded_file, outcome)
     
     except Exception as e:
         # שגיאה בעיבוד התמונה
         try:
             # עדכון הודעת הטעינה אם היא קיימת
-            if 'loading_message' in locals():
+            if loading_message is None:
+                loading_message = job.loading_message
+            if loading_message is not None:
                 try:
-                    bot.edit_message_text(
-                        f"❌ שגיאה בעיבוד התמונה: {str(e)}",
-                        group_id,
-                        loading_message.message_id
-                    )
+                    outbox.edit_message_text(processing_error_text(e), group_id, loading_message.message_id)
                 except:
                     pass
             
             # ננסה לשלוח תגובה, אם נכשל נשלח הודעה רגילה
             try:
-                bot.reply_to(message, f"❌ שגיאה בעיבוד התמונה: {str(e)}")
+                outbox.reply_to(message, processing_error_text(e))
             except Exception as reply_error:
                 logger.warning(f"לא ניתן לשלוח תגובה: {reply_error}")
-                bot.send_message(group_id, f"❌ שגיאה בעיבוד התמונה: {str(e)}")
+                outbox.send_message(group_id, processing_error_text(e))
         except Exception as final_error:
             logger.error(f"שגיאה חמורה בטיפול בתמונה: {final_error}")
                 
@@ -313,107 +421,264 @@ def handle_photo(message):
     finally:
         # ניקוי קבצים זמניים (יתבצע במנגנון ניקוי נפרד במערכת מלאה)
         pass
+
+def persist_submission(message, current_number, file_id, image_bytes, outcome):
+    """שמירת התמונה ונתוני הזיהוי ושליחת ההודעה למנהל (לאחר התשובה למשתמש)"""
+    timer = StageTimer()
+    try:
+        with timer.stage('db'):
+            image_data = flow.persist_photo(
+                message, current_number, file_id, image_bytes, outcome, preprocessed=image_preprocessor.enabled
+            )
+        
+        # שליחת ההודעה למנהל (במצב סיכומים התמונה ממתינה לסיכום הבא)
+        if image_data is not None:
+            with timer.stage('notify'):
+                try:
+                    send_admin_photo(
+                        file_id, image_data, caption=outcome.admin_caption, reply_markup=outcome.admin_markup
+                    )
+                except Exception as admin_error:
+                    logger.error(f"שגיאה בשליחת הודעה למנהל: {admin_error}")
+    
+    except Exception as e:
+        logger.error(f"שגיאה בשמירת נתוני התמונה: {e}")
+    
+    logger.info(f"שמירת תמונה והודעה למנהל הסתיימו: {timer.format_timings()}")
+
+def recognize_photo(downloaded_file):
+    """הכנת תמונה וזיהוי הלוחיות בה (לזיהוי מקביל של תמונות אלבום)"""
+    return ocr_service.recognize_plate(image_preprocessor.prepare(downloaded_file))
+
+def process_album_job(job):
+    """
+    צינור עיבוד אלבום: הורדה וזיהוי של כל התמונות במקביל ותשובה אחת
+    
+    התמונות נבדקות יחד מול המספר הנוכחי: המציאה נזקפת לתמונה שבה המספר
+    זוהה בביטחון הגבוה ביותר, ובמצב MULTI_FIND מספרים נוספים נאספים מכל
+    התמונות. השמירה וההודעה למנהל (קבוצת מדיה אחת) מתבצעות ברקע.
+    
+    Returns:
+        bool: True אם האלבום הועבר להמתנה לחזרת שירות הזיהוי
+    """
+    message = job.message
+    current_number = job.current_number
+    group_id = message.chat.id
+    loading_message = None
+    
+    try:
+        with job.stage('download'):
+            downloads = list(io_executor.map(download_photo, job.messages))
+        
+        with job.stage('ocr'):
+            # הכנה וזיהוי של כל התמונות במקביל
+            try:
+                ocr_results = list(io_executor.map(recognize_photo, [data for _, data in downloads]))
+            except OCRUnavailableError as ocr_error:
+                # השירות אינו זמין - האלבום כולו ממתין לחזרתו
+                if hold_photo_job(job, ocr_error):
+                    return True
+                ocr_results = [None] * len(downloads)
+            
+            matches = [ocr_service.match_plates(ocr_result) for ocr_result in ocr_results]
+        
+        # בדיקת כל התמונות יחד וסימון המציאה לתמונה שבה המספר זוהה בביטחון הגבוה ביותר
+        with job.stage('db'):
+            outcome = flow.judge_photos(job.messages, current_number, matches)
+        
+        with job.stage('loading_wait'):
+            loading_message = job.loading_message
+        
+        if outcome.claimed:
+            try:
+                outbox.delete_message(group_id, loading_message.message_id)
+            except Exception as delete_error:
+                logger.warning(f"לא ניתן למחוק הודעת טעינה: {delete_error}")
+            
+            # תשובה לתמונה שבה המספר זוהה
+            credited_message = job.messages[outcome.credited]
+            with job.stage('reply'):
+                try:
+                    outbox.reply_to(credited_message, outcome.text, reply_markup=outcome.markup)
+                except Exception as reply_error:
+                    logger.warning(f"לא ניתן לשלוח תגובה: {reply_error}")
+                    outbox.send_message(group_id, outcome.text, reply_markup=outcome.markup)
+        else:
+            with job.stage('reply'):
+                try:
+                    outbox.edit_message_text(outcome.text, group_id, loading_message.message_id)
+                except Exception as edit_error:
+                    logger.warning(f"לא ניתן לערוך הודעת טעינה: {edit_error}")
+                    try:
+                        outbox.reply_to(message, outcome.text)
+                    except Exception as reply_error:
+                        logger.warning(f"לא ניתן לשלוח תגובה: {reply_error}")
+                        outbox.send_message(group_id, outcome.text)
+        
+        # שמירה במסד הנתונים והודעה למנהל - לאחר שהמשתמש קיבל תשובה
+        io_executor.submit(persist_album, job.messages, current_number, downloads, matches, outcome)
+    
+    except Exception as e:
+        try:
+            if loading_message is None:
+                loading_message = job.loading_message
+            if loading_message is not None:
+                try:
+                    outbox.edit_message_text(processing_error_text(e), group_id, loading_message.message_id)
+                except:
+                    pass
+            else:
+                outbox.send_message(group_id, processing_error_text(e))
+        except Exception as final_error:
+            logger.error(f"שגיאה חמורה בטיפול באלבום: {final_error}")
+        
+        logger.error(f"Error processing album: {e}")
+
+def persist_album(messages, current_number, downloads, matches, outcome):
+    """
+    שמירת תמונות האלבום ונתוני הזיהוי בטרנזקציה אחת ושליחתן למנהל כסיכום אחד
+    
+    במצב סיכומים התמונות ממתינות לסיכום התקופתי הבא.
+    """
+    timer = StageTimer()
+    try:
+        with timer.stage('db'):
+            digest_id, items = flow.persist_album(
+                messages, current_number, downloads, matches, outcome, preprocessed=image_preprocessor.enabled
+            )
+        
+        if digest_id is not None and items:
+            with timer.stage('notify'):
+                try:
+                    send_review_digest(digest_id, items)
+                except Exception as admin_error:
+                    logger.error(f"שגיאה בשליחת האלבום למנהל: {admin_error}")
+    
+    except Exception as e:
+        logger.error(f"שגיאה בשמירת נתוני האלבום: {e}")
+    
+    logger.info(f"שמירת אלבום של {len(messages)} תמונות והודעה למנהל הסתיימו: {timer.format_timings()}")
+
+def send_digest_photos(items, photo_of):
+    """שליחת תמונות הסיכום למנהל, כשהתמונה של כל פריט נלקחת מ-photo_of(item)"""
+    if len(items) == 1:
+        outbox.send_photo(ADMIN_ID, photo_of(items[0]), caption=digest_item_caption(items[0]))
+    else:
+        outbox.send_media_group(ADMIN_ID, [
+            types.InputMediaPhoto(photo_of(item), caption=digest_item_caption(item))
+            for item in items
+        ])
+
+def send_review_digest(digest_id, items):
+    """
+    שליחת סיכום בדיקה למנהל: קבוצת מדיה של התמונות והודעה עם הכפתורים
+    
+    אם השליחה לפי file_id נכשלת, התמונות השמורות מועלות מחדש (תמונה שאינה
+    זמינה עוד נשלחת שוב לפי ה-file_id שלה).
+    """
+    try:
+        send_digest_photos(items, lambda item: item['file_id'])
+    except Exception as file_id_error:
+        logger.warning(f"לא ניתן לשלוח את תמונות הסיכום {digest_id} לפי file_id, מעלה אותן מחדש: {file_id_error}")
+        send_digest_photos(items, lambda item: flow.load_stored_image(item) or item['file_id'])
+    
+    outbox.send_message(ADMIN_ID, digest_text(items), reply_markup=digest_markup(digest_id, items))
+    logger.info(f"נשלח למנהל סיכום {digest_id} עם {len(items)} תמונות")
+
+# שליחת סיכומי בדיקה תקופתיים למנהל (מצב ADMIN_REVIEW_MODE=digest)
+admin_digest = AdminDigestSender(
+    db, send_review_digest, interval=ADMIN_DIGEST_INTERVAL, max_items=ADMIN_DIGEST_MAX_ITEMS
+)
+
+# מאגר תהליכוני העבודה לעיבוד תמונות
+photo_workers = PhotoWorkerPool(process_photo_job, num_workers=PHOTO_WORKERS, max_queue=PHOTO_QUEUE_SIZE)
+
+# איסוף תמונות של אלבום לעיבוד אחד
+album_collector = AlbumCollector(handle_album, window=ALBUM_COLLECT_SECONDS)
+
+# תמונות שממתינות לחזרת שירות הזיהוי (רק כשמפסק הזרם מופעל)
+ocr_holds = None
+if ocr_service.breaker is not None:
+    ocr_holds = HeldJobs(ocr_service.breaker, resubmit_photo_job, max_jobs=OCR_HOLD_MAX_JOBS)
     
 @bot.callback_query_handler(func=lambda call: call.data.startswith(('approve_', 'reject_')))
 def handle_admin_actions(call):
     """טיפול בפעולות מנהל"""
     # בדיקה שזה אכן המנהל
     if call.from_user.id != ADMIN_ID:
-        bot.answer_callback_query(call.id, "אין לך הרשאות מנהל!")
+        outbox.answer_callback_query(call.id, "אין לך הרשאות מנהל!")
         return
     
     # חילוץ מזהה ההודעה והפעולה
     action, message_id = call.data.split('_')
     message_id = int(message_id)
     
-    # קבלת נתוני התמונה
-    image_data = db.get_temp_image(message_id)
+    # סימון המספר (או החזרתו למאגר), ניקוי נתוני התמונה וטקסטי ההודעות
+    result = flow.apply_admin_action(action, message_id)
     
     # בדיקה שהנתונים עדיין קיימים
-    if not image_data:
-        bot.answer_callback_query(call.id, "הנתונים על התמונה הזו כבר לא זמינים.")
+    if result is None:
+        outbox.answer_callback_query(call.id, "הנתונים על התמונה הזו כבר לא זמינים.")
         return
     
-    group_id = image_data['group_id']
-    current_number = image_data['current_number']
-    username = image_data['username']
+    # שליחת הודעה לקבוצה
+    outbox.send_message(result['group_id'], result['text'], reply_markup=result['markup'])
     
-    if action == 'approve':
-        # אישור מציאה שלא זוהתה אוטומטית
-        # סימון המספר כנמצא ובחירת מספר חדש
-        next_number = db.mark_number_as_found(group_id, current_number, image_data['user_id'])
-        
-        # שליחת הודעה לקבוצה
-        if next_number is not None:
-            markup = get_game_markup(group_id)
-            
-            bot.send_message(
-                group_id,
-                f"✅ המנהל אישר את המציאה של {username} למספר {current_number}!\n\n"
-                f"המספר הבא לחיפוש: {next_number}",
-                reply_markup=markup
+    # עדכון למנהל
+    outbox.answer_callback_query(call.id, "הפעולה בוצעה בהצלחה!")
+    
+    if result['digest_id'] is not None:
+        # תמונה מסיכום - הסרת הכפתור שלה מהודעת הסיכום
+        if result['remaining']:
+            outbox.edit_message(
+                call.message.chat.id,
+                call.message.message_id,
+                reply_markup=digest_markup(result['digest_id'], result['remaining'])
             )
         else:
-            bot.send_message(
-                group_id,
-                f"✅ המנהל אישר את המציאה של {username} למספר {current_number}!\n\n"
-                f"כל המספרים נמצאו! המשחק הסתיים 🎉"
-            )
-        
-        # עדכון הודעת המנהל
-        bot.edit_message_caption(
-            caption=f"מציאה אושרה ידנית! ✅\n\n"
-                   f"משתמש: {username}\n"
-                   f"מספר: {current_number}",
-            chat_id=call.message.chat.id,
-            message_id=call.message.message_id
-        )
-        
-        # מחיקת המקלדת
-        bot.edit_message_reply_markup(
-            chat_id=call.message.chat.id,
-            message_id=call.message.message_id,
-            reply_markup=None
-        )
-        
-    elif action == 'reject':
-        # פסילת מציאה שאושרה אוטומטית
-        # החזרת המספר למאגר
-        db.revert_found_number(group_id, current_number)
-        
-        # שליחת הודעה לקבוצה
-        markup = get_game_markup(group_id)
-        
-        bot.send_message(
-            group_id,
-            f"❌ המנהל פסל את המציאה של {username} למספר {current_number}.\n\n"
-            f"המספר {current_number} חזר למאגר החיפוש.",
-            reply_markup=markup
-        )
-        
-        # עדכון הודעת המנהל
-        bot.edit_message_caption(
-            caption=f"מציאה נפסלה! ❌\n\n"
-                   f"משתמש: {username}\n"
-                   f"מספר: {current_number}",
-            chat_id=call.message.chat.id,
-            message_id=call.message.message_id
-        )
-        
-        # מחיקת המקלדת
-        bot.edit_message_reply_markup(
-            chat_id=call.message.chat.id,
-            message_id=call.message.message_id,
-            reply_markup=None
+            outbox.edit_message(call.message.chat.id, call.message.message_id, remove_markup=True)
+    else:
+        # עדכון הודעת המנהל ומחיקת המקלדת בקריאה אחת
+        outbox.edit_message(
+            call.message.chat.id,
+            call.message.message_id,
+            caption=result['caption'],
+            remove_markup=True
         )
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith(('digest_approve_', 'digest_reject_')))
+def handle_digest_actions(call):
+    """אישור או פסילה של כל התמונות שנותרו בסיכום"""
+    if call.from_user.id != ADMIN_ID:
+        outbox.answer_callback_query(call.id, "אין לך הרשאות מנהל!")
+        return
     
-    # עדכון למנהל
-    bot.answer_callback_query(call.id, "הפעולה בוצעה בהצלחה!")
+    _, action, digest_id = call.data.split('_')
+    digest_id = int(digest_id)
     
-    # ניקוי נתוני התמונה
-    if os.path.exists(image_data['image_path']):
-        os.remove(image_data['image_path'])
-    db.delete_temp_image(message_id)
+    # כל שינויי המצב מתבצעים בטרנזקציה אחת
+    items, notifications = flow.apply_digest_action(digest_id, action)
+    if notifications is None:
+        outbox.answer_callback_query(call.id, "שגיאה בביצוע הפעולה, נסו שוב.")
+        return
+    if not items:
+        outbox.answer_callback_query(call.id, "התמונות בסיכום הזה כבר טופלו.")
+        return
+    
+    outbox.answer_callback_query(call.id, "הפעולה בוצעה בהצלחה!")
+    outbox.edit_message(
+        call.message.chat.id,
+        call.message.message_id,
+        text=digest_done_text(len(items), action),
+        remove_markup=True
+    )
+    
+    # הודעות לקבוצות על השינויים
+    for notification in notifications:
+        try:
+            outbox.send_message(notification['group_id'], notification['text'], reply_markup=notification['markup'])
+        except Exception as e:
+            logger.error(f"שגיאה בשליחת הודעה לקבוצה {notification['group_id']}: {e}")
 
 @bot.callback_query_handler(func=lambda call: call.data in ["current", "stats"])
 def handle_inline_buttons(call):
@@ -424,36 +689,14 @@ def handle_inline_buttons(call):
         # הצגת המספר הנוכחי
         current_number = db.get_current_number(group_id)
         if current_number is None:
-            bot.answer_callback_query(call.id, "אין מספר נוכחי לחיפוש!")
+            outbox.answer_callback_query(call.id, NO_CURRENT_TEXT)
         else:
-            bot.answer_callback_query(call.id, f"המספר הנוכחי לחיפוש: {current_number}")
+            outbox.answer_callback_query(call.id, current_number_text(current_number))
     
     elif call.data == "stats":
         # הצגת סטטיסטיקות
         stats = db.get_stats(group_id)
-        bot.answer_callback_query(
-            call.id,
-            f"נמצאו: {stats['found']}/{stats['total']} ({stats['percentage']}%)",
-            show_alert=True
-        )
-
-def get_game_markup(group_id):
-    """יצירת מקלדת אינליין למשחק"""
-    markup = types.InlineKeyboardMarkup(row_width=2)
-    
-    # קבלת המספר הנוכחי
-    current_number = db.get_current_number(group_id)
-    
-    # קבלת סטטיסטיקות
-    stats = db.get_stats(group_id)
-    
-    # הוספת כפתורים
-    markup.add(
-        types.InlineKeyboardButton(f"מספר נוכחי: {current_number}", callback_data="current"),
-        types.InlineKeyboardButton(f"נותרו: {stats['remaining']}", callback_data="stats")
-    )
-    
-    return markup
+        outbox.answer_callback_query(call.id, stats_alert_text(stats), show_alert=True)
 
 # פונקציה לבדיקת סטטוס הבוט
 def test_bot():
@@ -476,4 +719,75 @@ def test_bot():
         }
     except Exception as e:
         logger.error(f"שגיאה בבדיקת סטטוס בוט: {e}")
-        return False, {'error': str(e)}
\ No newline at end of file
+        return False, {'error': str(e)}
+
+def process_queued_update(payload):
+    """עיבוד עדכון שנשמר בתור העדכונים"""
+    update = telebot.types.Update.de_json(payload)
+    bot.process_new_updates([update])
+
+# צרכני תור העדכונים הקבוע (מצב WEBHOOK_QUEUE_ENABLED)
+update_queue = UpdateQueueConsumer(
+    db,
+    process_queued_update,
+    num_workers=UPDATE_QUEUE_WORKERS,
+    batch_size=UPDATE_QUEUE_BATCH_SIZE,
+    poll_interval=UPDATE_QUEUE_POLL_INTERVAL,
+    stale_after=UPDATE_QUEUE_STALE_AFTER,
+    max_attempts=UPDATE_QUEUE_MAX_ATTEMPTS
+)
+
+# פונקציה להפעלת שירותי הרקע (בכל תהליך, לאחר fork)
+def reset_bot_after_fork():
+    """
+    בניית מאגר התהליכונים של המטפלים מחדש בתהליך עבודה של gunicorn
+    
+    המאגר נוצר בטעינת המודול בתהליך הראשי (preload), ותהליכונים לא שורדים
+    fork - בלי מאגר חדש עדכונים היו נכנסים לתור שאף תהליכון לא מרוקן.
+    """
+    if bot.threaded:
+        bot.worker_pool = util.ThreadPool(bot, num_threads=BOT_HANDLER_THREADS)
+
+def start_background_services():
+    """הפעלת צרכני תור העדכונים ושליחת הסיכומים למנהל לפי ההגדרות"""
+    if WEBHOOK_QUEUE_ENABLED:
+        update_queue.start()
+    if ADMIN_REVIEW_MODE == 'digest':
+        admin_digest.start()
+
+# פונקציה לכיבוי מסודר של השירותים
+def shutdown_services(timeout=30):
+    """סיום העבודה שבתור וסגירת החיבורים למסד הנתונים"""
+    try:
+        if WEBHOOK_QUEUE_ENABLED:
+            update_queue.stop(timeout=timeout)
+        admin_digest.stop(timeout=timeout)
+        album_collector.flush_all()
+        if ocr_holds is not None:
+            ocr_holds.stop()
+        photo_workers.stop(timeout=timeout)
+        io_executor.shutdown(wait=True)
+        db.close()
+    except Exception as e:
+        logger.error(f"שגיאה בכיבוי השירותים: {e}")
+
+# פונקציה לאיסוף מדדי ביצועים
+def collect_metrics():
+    """איסוף מדדי הביצועים של שירותי הבוט"""
+    return {
+        'db_pool': db.pool.stats(),
+        'game_state_cache': db.state_cache.stats(),
+        'ocr_cache': ocr_service.cache_stats(),
+        'ocr_backends': ocr_service.backend_stats(),
+        'image_preprocessor': image_preprocessor.stats(),
+        'photo_workers': photo_workers.stats(),
+        'albums': album_collector.stats() if ALBUM_BATCH_ENABLED else {'enabled': False},
+        'ocr_held_jobs': ocr_holds.stats() if ocr_holds is not None else {'enabled': False},
+        'image_store': image_store.stats(),
+        'group_scheduler': group_scheduler.stats(),
+        'telegram_outbox': outbox.stats(),
+        'match_outcomes': db.match_outcome_stats(MATCH_STATS_DAYS),
+        'admin_digest': admin_digest.stats() if ADMIN_REVIEW_MODE == 'digest' else {'enabled': False},
+        'update_queue': update_queue.stats() if WEBHOOK_QUEUE_ENABLED else {'enabled': False},
+        'update_dedup': update_dedup.stats() if update_dedup is not None else {'enabled': False}
+    }
@@ -0,0 +1,230 @@
+"""
+טקסטים ומקלדות של הבוט
+
+משותפים לבוט הסינכרוני (bot_handlers) ולבוט האסינכרוני (async_bot), כך ששני
+מצבי ההרצה מציגים למשתמשים בדיוק את אותן הודעות.
+"""
+
+from telebot import types
+
+WELCOME_TEXT = (
+    "ברוכים הבאים לבוט צייד לוחיות הרישוי! 🚗\n\n"
+    "במשחק זה תצטרכו למצוא לוחיות רישוי עם מספרים מסוימים.\n"
+    "כדי להתחיל משחק חדש, שלחו /start_game בקבוצה.\n"
+    "לצפייה במספר הנוכחי לחיפוש, שלחו /current_number.\n\n"
+    "בהצלחה!"
+)
+GROUP_ONLY_TEXT = "ניתן להתחיל משחק רק בקבוצה!"
+GAME_OVER_TEXT = "כל המספרים כבר נמצאו! המשחק הסתיים 🎉"
+NO_CURRENT_TEXT = "אין מספר נוכחי לחיפוש!"
+LOADING_TEXT = "🔍 מעבד את התמונה... אנא המתן"
+BUSY_TEXT = "⏳ יש עומס בעיבוד תמונות כרגע, אנא שלחו את התמונה שוב בעוד מספר דקות"
+OCR_HELD_TEXT = "⏳ שירות זיהוי הלוחיות אינו זמין כרגע. התמונה נשמרה ותיבדק אוטומטית כשהשירות יחזור"
+
+
+def game_started_text(number):
+    """הודעת התחלת משחק"""
+    return (
+        f"המשחק התחיל! 🎮\n\n"
+        f"המספר הראשון לחיפוש: {number}\n\n"
+        f"צלמו לוחית רישוי עם המספר הזה ושלחו לכאן."
+    )
+
+
+def current_number_text(number):
+    """הודעת המספר הנוכחי לחיפוש"""
+    return f"המספר הנוכחי לחיפוש: {number}"
+
+
+def stats_text(stats):
+    """הודעת סטטיסטיקות המשחק"""
+    return (
+        f"📊 סטטיסטיקות משחק:\n\n"
+        f"מספרים שנמצאו: {stats['found']}/{stats['total']} ({stats['percentage']}%)\n"
+        f"מספרים שנותרו: {stats['remaining']}"
+    )
+
+
+def stats_alert_text(stats):
+    """התראת הסטטיסטיקות המקוצרת לכפתור האינליין"""
+    return f"נמצאו: {stats['found']}/{stats['total']} ({stats['percentage']}%)"
+
+
+def found_text(first_name, number, next_number, extra_numbers=()):
+    """הודעת הצלחה לקבוצה לאחר מציאה"""
+    text = f"🎉 מצוין! {first_name} מצא את המספר {number}!\n\n"
+    if extra_numbers:
+        text += f"באותה תמונה נמצאו גם המספרים: {', '.join(map(str, extra_numbers))}\n\n"
+    if next_number is not None:
+        return text + f"המספר הבא לחיפוש: {next_number}"
+    return text + "כל המספרים נמצאו! המשחק הסתיים 🎉"
+
+
+def plates_text(plate_numbers):
+    """רשימת מספרי הלוחיות שזוהו להצגה"""
+    return ', '.join(plate_numbers or ['לא זוהו מספרים'])
+
+
+def not_found_text(number, plate_numbers):
+    """הודעה לקבוצה כשהמספר לא זוהה בתמונה"""
+    return (
+        f"❌ המספר {number} לא זוהה בתמונה.\n\n"
+        f"מספרי לוחית שזוהו: {plates_text(plate_numbers)}"
+    )
+
+
+def album_not_found_text(number, photo_count, plate_numbers):
+    """הודעה לקבוצה כשהמספר לא זוהה באף תמונה באלבום"""
+    return (
+        f"❌ המספר {number} לא זוהה באף אחת מ-{photo_count} התמונות.\n\n"
+        f"מספרי לוחית שזוהו: {plates_text(plate_numbers)}"
+    )
+
+
+def already_found_text(number, current_number):
+    """הודעה לקבוצה כשהמספר נמצא על ידי משתתף אחר בזמן עיבוד התמונה"""
+    text = f"⏱ המספר {number} כבר נמצא על ידי משתתף אחר."
+    if current_number is not None:
+        text += f"\n\n{current_number_text(current_number)}"
+    return text
+
+
+def processing_error_text(error):
+    """הודעת שגיאה בעיבוד תמונה"""
+    return f"❌ שגיאה בעיבוד התמונה: {str(error)}"
+
+
+def admin_found_caption(first_name, number, plate_numbers, extra_numbers=()):
+    """כיתוב התמונה למנהל על מציאה שאושרה אוטומטית"""
+    caption = (
+        f"מציאה חדשה אושרה!\n\n"
+        f"משתמש: {first_name}\n"
+        f"מספר: {number}\n"
+        f"מספרי לוחית שזוהו: {', '.join(plate_numbers)}"
+    )
+    if extra_numbers:
+        caption += f"\nמספרים נוספים שסומנו: {', '.join(map(str, extra_numbers))}"
+    return caption
+
+
+def admin_not_found_caption(first_name, number, plate_numbers):
+    """כיתוב התמונה למנהל על תמונה שלא אושרה אוטומטית"""
+    return (
+        f"תמונה שלא אושרה אוטומטית:\n\n"
+        f"משתמש: {first_name}\n"
+        f"מספר לחיפוש: {number}\n"
+        f"מספרי לוחית שזוהו: {plates_text(plate_numbers)}"
+    )
+
+
+def approved_text(username, number, next_number):
+    """הודעה לקבוצה על מציאה שהמנהל אישר"""
+    text = f"✅ המנהל אישר את המציאה של {username} למספר {number}!\n\n"
+    if next_number is not None:
+        return text + f"המספר הבא לחיפוש: {next_number}"
+    return text + "כל המספרים נמצאו! המשחק הסתיים 🎉"
+
+
+def rejected_text(username, number):
+    """הודעה לקבוצה על מציאה שהמנהל פסל"""
+    return (
+        f"❌ המנהל פסל את המציאה של {username} למספר {number}.\n\n"
+        f"המספר {number} חזר למאגר החיפוש."
+    )
+
+
+def approved_caption(username, number):
+    """כיתוב הודעת המנהל לאחר אישור ידני"""
+    return (
+        f"מציאה אושרה ידנית! ✅\n\n"
+        f"משתמש: {username}\n"
+        f"מספר: {number}"
+    )
+
+
+def rejected_caption(username, number):
+    """כיתוב הודעת המנהל לאחר פסילה"""
+    return (
+        f"מציאה נפסלה! ❌\n\n"
+        f"משתמש: {username}\n"
+        f"מספר: {number}"
+    )
+
+
+def game_markup(snapshot):
+    """
+    מקלדת אינליין למשחק
+
+    Args:
+        snapshot: תמונת מצב של הקבוצה מ-db.get_group_snapshot
+    """
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    markup.add(
+        types.InlineKeyboardButton(f"מספר נוכחי: {snapshot['current_number']}", callback_data="current"),
+        types.InlineKeyboardButton(f"נותרו: {snapshot['remaining']}", callback_data="stats")
+    )
+    return markup
+
+
+def admin_markup(found, message_id):
+    """
+    כפתור המנהל לתמונה: פסילה למציאה שאושרה, אישור לתמונה שלא אושרה
+
+    Args:
+        found: האם המציאה אושרה אוטומטית
+        message_id: מזהה הודעת התמונה
+    """
+    markup = types.InlineKeyboardMarkup()
+    if found:
+        markup.add(types.InlineKeyboardButton("❌ פסול מציאה זו", callback_data=f"reject_{message_id}"))
+    else:
+        markup.add(types.InlineKeyboardButton("✅ אשר למרות הכל", callback_data=f"approve_{message_id}"))
+    return markup
+
+
+def digest_item_caption(item):
+    """כיתוב תמונה בסיכום המנהל"""
+    if item['auto_found']:
+        caption = admin_found_caption(item['username'], item['current_number'], item['plate_numbers'] or [])
+    else:
+        caption = admin_not_found_caption(item['username'], item['current_number'], item['plate_numbers'])
+    return f"#{item['digest_position']}\n{caption}"
+
+
+def digest_text(items):
+    """הודעת הסיכום למנהל (מעל הכפתורים)"""
+    auto_found = sum(1 for item in items if item['auto_found'])
+    return (
+        f"📋 {len(items)} תמונות לבדיקה\n\n"
+        f"אושרו אוטומטית: {auto_found}\n"
+        f"לא אושרו אוטומטית: {len(items) - auto_found}"
+    )
+
+
+def digest_markup(digest_id, items):
+    """
+    כפתורי הסיכום: כפתור לכל תמונה וכפתורי אישור ופסילה לכל הסיכום
+
+    Args:
+        digest_id: מזהה הסיכום
+        items: התמונות שעדיין לא טופלו
+    """
+    markup = types.InlineKeyboardMarkup(row_width=5)
+    markup.add(*[
+        types.InlineKeyboardButton(
+            f"{'❌' if item['auto_found'] else '✅'} #{item['digest_position']}",
+            callback_data=f"{'reject' if item['auto_found'] else 'approve'}_{item['message_id']}"
+        )
+        for item in items
+    ])
+    markup.row(
+        types.InlineKeyboardButton("✅ אשר הכל", callback_data=f"digest_approve_{digest_id}"),
+        types.InlineKeyboardButton("❌ פסול הכל", callback_data=f"digest_reject_{digest_id}")
+    )
+    return markup
+
+
+def digest_done_text(count, action):
+    """הודעת הסיכום לאחר טיפול בכל התמונות שנותרו בו"""
+    done = "אושרו" if action == 'approve' else "נפסלו"
+    return f"📋 סיכום בדיקה\n\n{done} {count} התמונות שנותרו בסיכום ✔️"
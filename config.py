@@ -56,6 +56,52 @@ if not PLATE_RECOGNIZER_TOKEN:
 
 PLATE_RECOGNIZER_API_URL = os.environ.get('PLATE_RECOGNIZER_API_URL', 'https://api.platerecognizer.com/v1/plate-reader/')
 
+# הגדרות חיבור ל-API זיהוי הלוחיות
+OCR_CONNECT_TIMEOUT = float(os.environ.get('OCR_CONNECT_TIMEOUT', 5))  # שניות
+OCR_READ_TIMEOUT = float(os.environ.get('OCR_READ_TIMEOUT', 30))  # שניות
+OCR_MAX_RETRIES = int(os.environ.get('OCR_MAX_RETRIES', 3))
+OCR_RETRY_BACKOFF = float(os.environ.get('OCR_RETRY_BACKOFF', 0.5))  # מקדם המתנה בין ניסיונות חוזרים
+OCR_POOL_SIZE = int(os.environ.get('OCR_POOL_SIZE', 10))  # חיבורים פתוחים מרביים ל-API
+
+# מנוע הזיהוי: 'cloud' (PlateRecognizer), 'local' (Tesseract, מעבד בלבד) או 'cascade' (מקומי ואז ענן)
+OCR_BACKEND = os.environ.get('OCR_BACKEND', 'cloud').lower()
+OCR_LOCAL_TIMEOUT = float(os.environ.get('OCR_LOCAL_TIMEOUT', 10))  # שניות להרצת Tesseract על תמונה
+OCR_CASCADE_MIN_CONFIDENCE = float(os.environ.get('OCR_CASCADE_MIN_CONFIDENCE', 0.8))  # מתחת לזה - פנייה לענן
+OCR_CASCADE_AUDIT_RATE = float(os.environ.get('OCR_CASCADE_AUDIT_RATE', 0.0))  # חלק התשובות המקומיות שנבדקות מול הענן
+
+# הגנה על שירות הזיהוי בענן: מפסק זרם ומגבלת קצב ומקביליות מסתגלת
+OCR_CIRCUIT_ENABLED = os.environ.get('OCR_CIRCUIT_ENABLED', 'true').lower() in ['true', '1', 'yes']
+OCR_CIRCUIT_FAILURES = int(os.environ.get('OCR_CIRCUIT_FAILURES', 5))  # כשלים רצופים לפתיחת המפסק
+OCR_CIRCUIT_SLOW_CALL = float(os.environ.get('OCR_CIRCUIT_SLOW_CALL', 15))  # שניות - קריאה איטית יותר נחשבת כשל
+OCR_CIRCUIT_RESET = float(os.environ.get('OCR_CIRCUIT_RESET', 30))  # שניות במצב פתוח לפני קריאת ניסיון
+OCR_RATE_LIMIT = float(os.environ.get('OCR_RATE_LIMIT', 0))  # קריאות לשנייה לפי מכסת התוכנית (0 = ללא מגבלה)
+OCR_MAX_CONCURRENCY = int(os.environ.get('OCR_MAX_CONCURRENCY', 16))  # מגבלת המקביליות המרבית
+
+# תמונות שממתינות לחזרת שירות הזיהוי
+OCR_HOLD_MAX_JOBS = int(os.environ.get('OCR_HOLD_MAX_JOBS', 200))
+OCR_HOLD_MAX_SECONDS = int(os.environ.get('OCR_HOLD_MAX_SECONDS', 600))  # לאחר מכן התמונה עוברת לבדיקת המנהל
+OCR_HOLD_MAX_ATTEMPTS = int(os.environ.get('OCR_HOLD_MAX_ATTEMPTS', 3))  # ניסיונות שנכשלו בפועל
+
+# הכנת התמונה לפני הזיהוי: בחירת גודל קטן יותר מטלגרם, הקטנה ודחיסה מחדש (Pillow)
+OCR_PREPROCESS_ENABLED = os.environ.get('OCR_PREPROCESS_ENABLED', 'false').lower() in ['true', '1', 'yes']
+OCR_MIN_PHOTO_SIDE = int(os.environ.get('OCR_MIN_PHOTO_SIDE', 720))  # פיקסלים, הצלע הקצרה של הגודל שנבחר
+OCR_MAX_UPLOAD_SIDE = int(os.environ.get('OCR_MAX_UPLOAD_SIDE', 1280))  # פיקסלים, הצלע הארוכה לאחר הקטנה
+OCR_JPEG_QUALITY = int(os.environ.get('OCR_JPEG_QUALITY', 85))
+
+# ביטחון הזיהוי המינימלי (0-1) לאישור אוטומטי של מספר
+OCR_MIN_CONFIDENCE = float(os.environ.get('OCR_MIN_CONFIDENCE', 0.0))
+# ביטחון מינימלי של מועמד חלופי של ה-API כדי שייבדק בכלל (הלוחית הראשית נבדקת תמיד)
+OCR_CANDIDATE_MIN_CONFIDENCE = float(os.environ.get('OCR_CANDIDATE_MIN_CONFIDENCE', 0.8))
+MATCH_STATS_DAYS = int(os.environ.get('MATCH_STATS_DAYS', 30))  # חלון הימים לחישוב שיעורי האישור והפסילה
+
+# מטמון תוצאות OCR לפי תוכן התמונה
+OCR_CACHE_ENABLED = os.environ.get('OCR_CACHE_ENABLED', 'true').lower() in ['true', '1', 'yes']
+OCR_CACHE_MAX_ENTRIES = int(os.environ.get('OCR_CACHE_MAX_ENTRIES', 1000))
+OCR_CACHE_TTL = int(os.environ.get('OCR_CACHE_TTL', 86400))  # שניות
+OCR_CACHE_PERSISTENT = os.environ.get('OCR_CACHE_PERSISTENT', 'false').lower() in ['true', '1', 'yes']
+OCR_CACHE_PERCEPTUAL = os.environ.get('OCR_CACHE_PERCEPTUAL', 'false').lower() in ['true', '1', 'yes']
+OCR_CACHE_PHASH_DISTANCE = int(os.environ.get('OCR_CACHE_PHASH_DISTANCE', 4))  # מרחק Hamming מרבי לתמונה כמעט זהה
+
 # מזהה של המנהל
 try:
     ADMIN_ID = int(os.environ.get('ADMIN_ID', '0'))
@@ -76,6 +122,52 @@ DB_PASSWORD = os.environ.get('DB_PASSWORD')
 if not all([DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD]):
     print("אזהרה: חלק מפרטי ההתחברות למסד הנתונים חסרים!")
 
+# הגדרות מאגר החיבורים למסד הנתונים
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))  # שניות המתנה לחיבור פנוי
+DB_POOL_HEALTH_CHECK_INTERVAL = int(os.environ.get('DB_POOL_HEALTH_CHECK_INTERVAL', 30))  # שניות מנוחה לפני בדיקת חיבור
+
+# עיבוד תמונות ברקע: מספר תהליכוני עבודה (0 = עיבוד ישיר במטפל) וגודל התור המרבי
+PHOTO_WORKERS = int(os.environ.get('PHOTO_WORKERS', 4))
+PHOTO_QUEUE_SIZE = int(os.environ.get('PHOTO_QUEUE_SIZE', 100))
+IO_WORKERS = int(os.environ.get('IO_WORKERS', 8))  # תהליכונים לקריאות רשת שרצות במקביל לעיבוד
+BOT_HANDLER_THREADS = int(os.environ.get('BOT_HANDLER_THREADS', 2))  # תהליכוני המטפלים של TeleBot
+
+# מגבלות קצב לשליחת הודעות לטלגרם
+TELEGRAM_GLOBAL_RATE = float(os.environ.get('TELEGRAM_GLOBAL_RATE', 30))  # קריאות לשנייה לכל הבוט
+TELEGRAM_CHAT_RATE = float(os.environ.get('TELEGRAM_CHAT_RATE', 1))  # הודעות לשנייה לצ'אט פרטי
+TELEGRAM_GROUP_RATE_PER_MINUTE = float(os.environ.get('TELEGRAM_GROUP_RATE_PER_MINUTE', 20))  # הודעות לדקה לקבוצה
+TELEGRAM_CHAT_BURST = int(os.environ.get('TELEGRAM_CHAT_BURST', 3))  # הודעות רצופות לצ'אט לפני האטה
+TELEGRAM_MAX_RETRIES = int(os.environ.get('TELEGRAM_MAX_RETRIES', 3))  # ניסיונות חוזרים לאחר 429
+
+# מצב הרצת הבוט: 'threaded' (TeleBot עם תהליכונים) או 'async' (AsyncTeleBot על asyncio)
+BOT_RUNTIME = os.environ.get('BOT_RUNTIME', 'threaded').lower()
+ASYNC_MAX_PHOTO_JOBS = int(os.environ.get('ASYNC_MAX_PHOTO_JOBS', 1000))  # עיבודי תמונה מקבילים מרביים במצב async
+ASYNC_DB_WORKERS = int(os.environ.get('ASYNC_DB_WORKERS', DB_POOL_MAX_SIZE))  # תהליכונים לפניות למסד הנתונים במצב async
+
+# אחסון תמונות לבדיקת המנהל: 'disk' (קבצים בתיקיית data) או 'memory' (מאגר חסום בזיכרון)
+IMAGE_STORAGE_MODE = os.environ.get('IMAGE_STORAGE_MODE', 'disk').lower()
+IMAGE_STORE_MAX_BYTES = int(os.environ.get('IMAGE_STORE_MAX_BYTES', 50 * 1024 * 1024))
+
+# מטמון מצב המשחק בזיכרון (מספר נוכחי וסטטיסטיקות ללא פנייה למסד הנתונים)
+GAME_STATE_CACHE_ENABLED = os.environ.get('GAME_STATE_CACHE_ENABLED', 'true').lower() in ['true', '1', 'yes']
+
+# סימון כל המספרים שעדיין לא נמצאו ומופיעים בתמונה (ולא רק המספר הנוכחי)
+MULTI_FIND_ENABLED = os.environ.get('MULTI_FIND_ENABLED', 'false').lower() in ['true', '1', 'yes']
+
+# איסוף תמונות של אלבום (media_group_id) לעיבוד אחד: תשובה אחת לקבוצה והודעה אחת למנהל
+ALBUM_BATCH_ENABLED = os.environ.get('ALBUM_BATCH_ENABLED', 'true').lower() in ['true', '1', 'yes']
+ALBUM_COLLECT_SECONDS = float(os.environ.get('ALBUM_COLLECT_SECONDS', 1.0))  # זמן איסוף התמונות מהתמונה הראשונה
+
+# מצב אחסון מאגר המספרים לקבוצות חדשות: 'rows' (שורה לכל מספר) או 'bitmap' (125 בתים לקבוצה)
+NUMBERS_STORAGE_MODE = os.environ.get('NUMBERS_STORAGE_MODE', 'rows').lower()
+
+# בדיקת המנהל: 'instant' (הודעה על כל תמונה) או 'digest' (סיכומים תקופתיים של עד 10 תמונות)
+ADMIN_REVIEW_MODE = os.environ.get('ADMIN_REVIEW_MODE', 'instant').lower()
+ADMIN_DIGEST_INTERVAL = int(os.environ.get('ADMIN_DIGEST_INTERVAL', 120))  # שניות בין סיכומים
+ADMIN_DIGEST_MAX_ITEMS = min(int(os.environ.get('ADMIN_DIGEST_MAX_ITEMS', 10)), 10)  # טלגרם מגביל קבוצת מדיה ל-10
+
 # הגדרות לוחיות רישוי
 REGIONS = ["il"]  # קוד מדינה לישראל
 
@@ -83,6 +175,28 @@ REGIONS = ["il"]  # קוד מדינה לישראל
 PORT = int(os.environ.get('PORT', 10000))  # ברירת מחדל לפורט 10000
 WEBHOOK_URL = os.environ.get('WEBHOOK_URL')
 
+# תור עדכונים קבוע: ה-webhook שומר את העדכון במסד הנתונים ומחזיר תשובה מיד
+WEBHOOK_QUEUE_ENABLED = os.environ.get('WEBHOOK_QUEUE_ENABLED', 'false').lower() in ['true', '1', 'yes']
+WEBHOOK_SECRET_TOKEN = os.environ.get('WEBHOOK_SECRET_TOKEN')  # נבדק מול הכותרת X-Telegram-Bot-Api-Secret-Token
+UPDATE_QUEUE_WORKERS = int(os.environ.get('UPDATE_QUEUE_WORKERS', 4))
+UPDATE_QUEUE_BATCH_SIZE = int(os.environ.get('UPDATE_QUEUE_BATCH_SIZE', 10))
+UPDATE_QUEUE_POLL_INTERVAL = float(os.environ.get('UPDATE_QUEUE_POLL_INTERVAL', 1.0))  # שניות
+UPDATE_QUEUE_STALE_AFTER = int(os.environ.get('UPDATE_QUEUE_STALE_AFTER', 300))  # שניות עד לתפיסה מחדש
+UPDATE_QUEUE_MAX_ATTEMPTS = int(os.environ.get('UPDATE_QUEUE_MAX_ATTEMPTS', 5))
+UPDATE_QUEUE_RETENTION_HOURS = int(os.environ.get('UPDATE_QUEUE_RETENTION_HOURS', 24))  # זמן שמירה לזיהוי כפילויות
+
+# זיהוי עדכונים והודעות תמונה שטלגרם שלח שוב (חלון בזיכרון ומפתח ייחודי במסד הנתונים)
+UPDATE_DEDUP_ENABLED = os.environ.get('UPDATE_DEDUP_ENABLED', 'true').lower() in ['true', '1', 'yes']
+UPDATE_DEDUP_WINDOW = int(os.environ.get('UPDATE_DEDUP_WINDOW', 10000))  # מפתחות אחרונים שנשמרים בזיכרון
+PROCESSED_MESSAGES_RETENTION_HOURS = int(os.environ.get('PROCESSED_MESSAGES_RETENTION_HOURS', 48))
+
+# שרת ה-webhook: 'gunicorn' (שרת ייצור עם מספר תהליכים) או 'dev' (שרת הפיתוח של Flask)
+WEB_SERVER = os.environ.get('WEB_SERVER', 'gunicorn').lower()
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', 1))  # תהליכי gunicorn
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 8))  # תהליכונים לכל תהליך
+WEB_TIMEOUT = int(os.environ.get('WEB_TIMEOUT', 30))  # שניות עד שתהליך תקוע מופעל מחדש
+WEB_GRACEFUL_TIMEOUT = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))  # שניות לסיום עבודה בכיבוי
+
 # פונקצית דיאגנוסטיקה - הדפסת פרטי התצורה ללא חשיפת מידע רגיש
 def print_config_info():
     """הדפסת פרטי תצורה למטרות דיאגנוסטיקה"""
@@ -92,7 +206,10 @@ def print_config_info():
     print(f"PLATE_RECOGNIZER_TOKEN: {'מוגדר' if PLATE_RECOGNIZER_TOKEN else 'לא מוגדר'}")
     print(f"ADMIN_ID: {ADMIN_ID if ADMIN_ID != 0 else 'לא מוגדר'}")
     print(f"פרטי התחברות למסד נתונים: {'מוגדרים' if all([DB_HOST, DB_PORT, DB_NAME, DB_USER]) else 'חסרים'}")
+    print(f"מאגר חיבורים: {DB_POOL_MIN_SIZE}-{DB_POOL_MAX_SIZE}")
+    print(f"מצב הרצה: {BOT_RUNTIME}")
     print(f"פורט: {PORT}")
     print(f"WEBHOOK_URL: {'מוגדר' if WEBHOOK_URL else 'לא מוגדר'}")
+    print(f"שרת webhook: {WEB_SERVER} ({WEB_WORKERS} תהליכים, {WEB_THREADS} תהליכונים)")
     print(f"REGIONS: {REGIONS}")
     print(f"========================")
\ No newline at end of file
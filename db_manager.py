@@ -1,7 +1,13 @@
-import psycopg2
-import random
-from psycopg2.extras import DictCursor
-from config import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD
+from contextlib import contextmanager, ExitStack
+from psycopg2.extras import DictCursor, Json, execute_values
+from config import (
+    DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD,
+    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_POOL_HEALTH_CHECK_INTERVAL,
+    GAME_STATE_CACHE_ENABLED, NUMBERS_STORAGE_MODE
+)
+from db_pool import ConnectionPool
+from game_state import GameStateCache, GroupState
+import number_bitmap
 import logging
 from datetime import datetime, timedelta
 
@@ -12,11 +18,18 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
+# מספר המספרים במאגר של כל קבוצה (0-999)
+NUMBERS_PER_GROUP = 1000
+
+# מצבי אחסון של מאגר המספרים: שורה לכל מספר, או מפת סיביות אחת לקבוצה
+STORAGE_ROWS = 'rows'
+STORAGE_BITMAP = 'bitmap'
+
 class DBManager:
     """
     מנהל מסד נתונים PostgreSQL
     """
-    
+
     def __init__(self):
         """אתחול מנהל מסד הנתונים"""
         # פרטי התחברות למסד הנתונים
@@ -27,394 +40,1447 @@ class DBManager:
             'user': DB_USER,
             'password': DB_PASSWORD
         }
-        
+
+        # מאגר חיבורים משותף לכל הפעולות
+        self.pool = ConnectionPool(
+            self.db_params,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL,
+            timeout=DB_POOL_TIMEOUT
+        )
+
+        # קבוצות שכבר אותחלו במסד הנתונים ומצב האחסון שלהן (חוסך בדיקת קיום בכל בקשה)
+        self._known_groups = {}
+
+        # מצב המשחק של כל קבוצה בזיכרון (נטען פעם אחת ומתעדכן בכל כתיבה)
+        self.state_cache = GameStateCache(self._load_group_state, enabled=GAME_STATE_CACHE_ENABLED)
+
         # יצירת טבלאות אם לא קיימות
         self._create_tables()
-    
-    def _get_connection(self):
-        """יצירת חיבור למסד הנתונים"""
-        return psycopg2.connect(**self.db_params)
-    
+
+    @contextmanager
+    def _cursor(self, cursor_factory=None):
+        """
+        קבלת סמן (cursor) על חיבור מהמאגר
+
+        בסיום הבלוק מתבצע commit, ובמקרה של חריגה מתבצע rollback.
+        """
+        with self.pool.connection() as conn:
+            cur = conn.cursor(cursor_factory=cursor_factory)
+            try:
+                yield cur
+            finally:
+                cur.close()
+
+    def close(self):
+        """סגירת החיבורים הפנויים במאגר"""
+        self.pool.close()
+
     def test_connection(self):
         """בדיקת חיבור למסד הנתונים"""
         try:
-            conn = self._get_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT 1")
-            result = cur.fetchone()
-            cur.close()
-            conn.close()
+            with self._cursor() as cur:
+                cur.execute("SELECT 1")
+                cur.fetchone()
             logger.info("חיבור למסד הנתונים תקין!")
             return True
         except Exception as e:
             logger.error(f"שגיאה בחיבור למסד הנתונים: {e}")
             return False
-    
+
     def _create_tables(self):
         """יצירת טבלאות במסד הנתונים אם לא קיימות"""
-        # יצירת חיבור
-        conn = self._get_connection()
-        cur = conn.cursor()
-        
-        try:
-            # טבלת קבוצות
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS groups (
-                    group_id BIGINT PRIMARY KEY,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # טבלת מספרים לקבוצה
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS numbers (
-                    id SERIAL PRIMARY KEY,
-                    group_id BIGINT REFERENCES groups(group_id),
-                    number INTEGER NOT NULL,
-                    is_current BOOLEAN DEFAULT FALSE,
-                    is_found BOOLEAN DEFAULT FALSE,
-                    found_by BIGINT,
-                    found_at TIMESTAMP,
-                    UNIQUE(group_id, number)
-                )
-            """)
-            
-            # טבלת תמונות זמניות
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS temp_images (
-                    message_id BIGINT PRIMARY KEY,
-                    image_path TEXT,
-                    user_id BIGINT,
-                    username TEXT,
-                    group_id BIGINT,
-                    current_number INTEGER,
-                    plate_numbers TEXT[],
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        try:
+            with self._cursor() as cur:
+                # טבלת קבוצות
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS groups (
+                        group_id BIGINT PRIMARY KEY,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+
+                # טבלת מספרים לקבוצה
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS numbers (
+                        id SERIAL PRIMARY KEY,
+                        group_id BIGINT REFERENCES groups(group_id),
+                        number INTEGER NOT NULL,
+                        is_current BOOLEAN DEFAULT FALSE,
+                        is_found BOOLEAN DEFAULT FALSE,
+                        found_by BIGINT,
+                        found_at TIMESTAMP,
+                        UNIQUE(group_id, number)
+                    )
+                """)
+
+                # מפת סיביות של המספרים שנמצאו (מצב אחסון bitmap)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS number_bitmaps (
+                        group_id BIGINT PRIMARY KEY REFERENCES groups(group_id),
+                        found_bitmap BYTEA NOT NULL,
+                        current_number INTEGER,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+
+                # יומן מציאות (append-only) עבור קבוצות במצב bitmap
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS finds (
+                        id BIGSERIAL PRIMARY KEY,
+                        group_id BIGINT NOT NULL,
+                        number INTEGER NOT NULL,
+                        action TEXT NOT NULL,
+                        user_id BIGINT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                cur.execute("CREATE INDEX IF NOT EXISTS finds_group_idx ON finds (group_id, number)")
+
+                # טבלת תמונות זמניות
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS temp_images (
+                        message_id BIGINT PRIMARY KEY,
+                        image_path TEXT,
+                        user_id BIGINT,
+                        username TEXT,
+                        group_id BIGINT,
+                        current_number INTEGER,
+                        plate_numbers TEXT[],
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+
+                # מזהה הקובץ בטלגרם, לשליחת התמונה למנהל ללא העלאה מחדש
+                cur.execute("ALTER TABLE temp_images ADD COLUMN IF NOT EXISTS file_id TEXT")
+
+                # תור בדיקת המנהל: האם המציאה אושרה אוטומטית, מצב הבדיקה ומזהה הסיכום שבו נשלחה
+                cur.execute("""
+                    ALTER TABLE temp_images ADD COLUMN IF NOT EXISTS auto_found BOOLEAN DEFAULT FALSE;
+                    ALTER TABLE temp_images ADD COLUMN IF NOT EXISTS review_status TEXT DEFAULT 'pending';
+                    ALTER TABLE temp_images ADD COLUMN IF NOT EXISTS digest_id BIGINT;
+                    ALTER TABLE temp_images ADD COLUMN IF NOT EXISTS digest_position INTEGER;
+                    ALTER TABLE temp_images ADD COLUMN IF NOT EXISTS extra_numbers INTEGER[] DEFAULT '{}';
+                    CREATE INDEX IF NOT EXISTS temp_images_review_idx ON temp_images (review_status, created_at);
+                    CREATE SEQUENCE IF NOT EXISTS admin_digest_seq
+                """)
+
+                # מטמון קבוע של תוצאות OCR לפי גיבוב תוכן התמונה
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS ocr_cache (
+                        image_hash TEXT PRIMARY KEY,
+                        result JSONB NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+
+                # תור עדכונים קבוע מה-webhook (מפתח ראשי update_id מונע עיבוד כפול)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS update_queue (
+                        update_id BIGINT PRIMARY KEY,
+                        payload JSONB NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'pending',
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        claimed_at TIMESTAMP,
+                        processed_at TIMESTAMP,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                cur.execute("CREATE INDEX IF NOT EXISTS update_queue_status_idx ON update_queue (status, update_id)")
+
+                # הודעות תמונה שכבר עובדו (מפתח ראשי מונע עיבוד כפול של עדכון שנשלח שוב)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS processed_messages (
+                        chat_id BIGINT NOT NULL,
+                        message_id BIGINT NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (chat_id, message_id)
+                    )
+                """)
+                cur.execute(
+                    "CREATE INDEX IF NOT EXISTS processed_messages_created_idx ON processed_messages (created_at)"
                 )
-            """)
-            
-            # שמירת השינויים
-            conn.commit()
+
+                # תוצאות ההתאמה והבדיקה של כל תמונה, לכיול סף הביטחון של האישור האוטומטי
+                # (מזהה הודעה ייחודי רק בתוך צ'אט, ולכן המפתח כולל את הקבוצה)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS match_outcomes (
+                        message_id BIGINT NOT NULL,
+                        group_id BIGINT NOT NULL,
+                        number INTEGER,
+                        confidence REAL,
+                        threshold REAL NOT NULL,
+                        auto_found BOOLEAN NOT NULL,
+                        review TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (group_id, message_id)
+                    )
+                """)
+                cur.execute("CREATE INDEX IF NOT EXISTS match_outcomes_created_idx ON match_outcomes (created_at)")
+                cur.execute("ALTER TABLE match_outcomes ADD COLUMN IF NOT EXISTS preprocessed BOOLEAN DEFAULT FALSE")
+
+                # טבלה קיימת עם מפתח על message_id בלבד - מעבר למפתח (group_id, message_id)
+                cur.execute("""
+                    DO $$
+                    BEGIN
+                        IF NOT EXISTS (
+                            SELECT 1 FROM information_schema.key_column_usage
+                            WHERE table_name = 'match_outcomes'
+                            AND constraint_name = 'match_outcomes_pkey'
+                            AND column_name = 'group_id'
+                        ) THEN
+                            ALTER TABLE match_outcomes DROP CONSTRAINT IF EXISTS match_outcomes_pkey;
+                            ALTER TABLE match_outcomes ADD PRIMARY KEY (group_id, message_id);
+                        END IF;
+                    END $$
+                """)
+
             logger.info("טבלאות המסד נוצרו/אומתו בהצלחה")
-            
+
         except Exception as e:
             logger.error(f"שגיאה ביצירת טבלאות: {e}")
-            conn.rollback()
-            
-        finally:
-            # סגירת החיבור
-            cur.close()
-            conn.close()
-    
+
     def init_group(self, group_id):
         """אתחול מאגר מספרים חדש לקבוצה"""
-        conn = self._get_connection()
-        cur = conn.cursor()
-        
-        try:
-            # בדיקה אם הקבוצה כבר קיימת
-            cur.execute("SELECT group_id FROM groups WHERE group_id = %s", (group_id,))
-            if cur.fetchone() is None:
-                # יצירת רשומת קבוצה חדשה
-                cur.execute("INSERT INTO groups (group_id) VALUES (%s)", (group_id,))
-                logger.info(f"הקבוצה {group_id} נוצרה במסד הנתונים")
-                
-                # יצירת מאגר מספרים (0-999)
-                for number in range(1000):
-                    cur.execute(
-                        "INSERT INTO numbers (group_id, number, is_found, is_current) VALUES (%s, %s, %s, %s)",
-                        (group_id, number, False, False)
-                    )
-                logger.info(f"מאגר מספרים נוצר עבור הקבוצה {group_id}")
-            
-            conn.commit()
+        # קבוצה שכבר אותחלה בתהליך הנוכחי אינה דורשת פנייה למסד הנתונים
+        if group_id in self._known_groups:
             return True
-            
+
+        try:
+            with self._cursor() as cur:
+                # יצירת רשומת קבוצה (אם עדיין לא קיימת)
+                cur.execute(
+                    "INSERT INTO groups (group_id) VALUES (%s) ON CONFLICT (group_id) DO NOTHING RETURNING group_id",
+                    (group_id,)
+                )
+                if cur.fetchone() is not None:
+                    logger.info(f"הקבוצה {group_id} נוצרה במסד הנתונים")
+                    storage_mode = NUMBERS_STORAGE_MODE
+
+                    if storage_mode == STORAGE_BITMAP:
+                        # יצירת מפת סיביות ריקה (אף מספר עדיין לא נמצא)
+                        cur.execute(
+                            "INSERT INTO number_bitmaps (group_id, found_bitmap) VALUES (%s, %s)",
+                            (group_id, number_bitmap.empty_bitmap(NUMBERS_PER_GROUP))
+                        )
+                    else:
+                        # יצירת מאגר מספרים (0-999) בפקודה אחת
+                        cur.execute(
+                            """
+                            INSERT INTO numbers (group_id, number, is_found, is_current)
+                            SELECT %s, n, FALSE, FALSE FROM generate_series(0, %s) AS n
+                            ON CONFLICT (group_id, number) DO NOTHING
+                            """,
+                            (group_id, NUMBERS_PER_GROUP - 1)
+                        )
+                    logger.info(f"מאגר מספרים נוצר עבור הקבוצה {group_id} (מצב אחסון: {storage_mode})")
+                else:
+                    # קבוצה קיימת - בדיקת מצב האחסון שלה
+                    cur.execute("SELECT 1 FROM number_bitmaps WHERE group_id = %s", (group_id,))
+                    storage_mode = STORAGE_BITMAP if cur.fetchone() else STORAGE_ROWS
+
+            self._known_groups[group_id] = storage_mode
+            return True
+
         except Exception as e:
             logger.error(f"שגיאה באתחול קבוצה: {e}")
-            conn.rollback()
             return False
-            
-        finally:
-            cur.close()
-            conn.close()
-    
-    def select_next_number(self, group_id):
-        """בחירת המספר הבא לחיפוש"""
-        conn = self._get_connection()
-        cur = conn.cursor()
-        
-        try:
-            # וידוא שהקבוצה מאותחלת
-            self.init_group(group_id)
-            
-            # איפוס כל המספרים הנוכחיים
+
+    def _storage_mode(self, group_id):
+        """מצב האחסון של מאגר המספרים של הקבוצה (שורות או מפת סיביות)"""
+        self.init_group(group_id)
+        return self._known_groups.get(group_id, STORAGE_ROWS)
+
+    def _pick_next_number(self, cur, group_id):
+        """
+        בחירת מספר אקראי שלא נמצא והעברת הסימון "נוכחי" אליו בפקודה אחת
+
+        הפקודה נוגעת רק בשתי שורות (המספר הנוכחי הקודם והמספר החדש).
+        נעילת advisory ברמת הטרנזקציה לפי מזהה הקבוצה מבטיחה ששתי בחירות
+        במקביל באותה קבוצה לא ייצרו שני מספרים נוכחיים. הבחירה האקראית
+        נמצאת ב-CTE מסוג MATERIALIZED כדי שתחושב פעם אחת בלבד - בלי זה
+        המתכנן רשאי לשלב אותה ב-join ולהעריך את random() יותר מפעם אחת.
+        """
+        cur.execute(
+            """
+            SELECT pg_advisory_xact_lock(%(group_id)s);
+            WITH pick AS MATERIALIZED (
+                SELECT number FROM numbers
+                WHERE group_id = %(group_id)s AND is_found = FALSE
+                ORDER BY random()
+                LIMIT 1
+            )
+            UPDATE numbers AS n
+            SET is_current = (n.number = pick.number)
+            FROM pick
+            WHERE n.group_id = %(group_id)s
+              AND (n.is_current OR n.number = pick.number)
+            RETURNING n.number, n.is_current
+            """,
+            {'group_id': group_id}
+        )
+        for number, is_current in cur.fetchall():
+            if is_current:
+                return number
+        return None
+
+    def _lock_bitmap(self, cur, group_id):
+        """נעילת שורת מפת הסיביות של הקבוצה עד סוף הטרנזקציה והחזרת המפה"""
+        cur.execute(
+            "SELECT found_bitmap FROM number_bitmaps WHERE group_id = %s FOR UPDATE",
+            (group_id,)
+        )
+        return bytes(cur.fetchone()[0])
+
+    def _pick_next_number_bitmap(self, cur, group_id):
+        """בחירת מספר אקראי שלא נמצא במצב מפת סיביות"""
+        found_bitmap = self._lock_bitmap(cur, group_id)
+        next_number = number_bitmap.random_unset(found_bitmap, NUMBERS_PER_GROUP)
+        if next_number is not None:
             cur.execute(
-                "UPDATE numbers SET is_current = FALSE WHERE group_id = %s",
-                (group_id,)
+                "UPDATE number_bitmaps SET current_number = %s, updated_at = CURRENT_TIMESTAMP WHERE group_id = %s",
+                (next_number, group_id)
             )
-            
-            # בחירת מספר אקראי שעדיין לא נמצא
+        return next_number
+
+    def _mark_found_rows(self, cur, group_id, number, user_id):
+        """
+        סימון מספר כנמצא ובחירת המספר הבא במצב שורות
+
+        מספר שכבר נמצא אינו מסומן שוב, והמספר הנוכחי נשאר (סימון כפול לא מדלג על מספר).
+        """
+        cur.execute(
+            """
+            SELECT pg_advisory_xact_lock(%(group_id)s);
+            UPDATE numbers
+            SET is_found = TRUE, is_current = FALSE, found_by = %(user_id)s, found_at = CURRENT_TIMESTAMP
+            WHERE group_id = %(group_id)s AND number = %(number)s AND NOT is_found
+            RETURNING number
+            """,
+            {'group_id': group_id, 'number': number, 'user_id': user_id}
+        )
+        if cur.fetchone() is None:
+            logger.info(f"המספר {number} כבר סומן כנמצא בקבוצה {group_id} - המספר הנוכחי נשאר")
+            cur.execute("SELECT number FROM numbers WHERE group_id = %s AND is_current", (group_id,))
+            row = cur.fetchone()
+            return row[0] if row else None
+        return self._pick_next_number(cur, group_id)
+
+    def _mark_found_bitmap(self, cur, group_id, number, user_id):
+        """סימון מספר כנמצא ובחירת המספר הבא במצב מפת סיביות (מספר שכבר נמצא אינו מסומן שוב)"""
+        found_bitmap = self._lock_bitmap(cur, group_id)
+        if number_bitmap.is_set(found_bitmap, number):
+            logger.info(f"המספר {number} כבר סומן כנמצא בקבוצה {group_id} - המספר הנוכחי נשאר")
+            cur.execute("SELECT current_number FROM number_bitmaps WHERE group_id = %s", (group_id,))
+            return cur.fetchone()[0]
+        found_bitmap = number_bitmap.set_bit(found_bitmap, number)
+        next_number = number_bitmap.random_unset(found_bitmap, NUMBERS_PER_GROUP)
+        cur.execute(
+            """
+            UPDATE number_bitmaps
+            SET found_bitmap = %s, current_number = %s, updated_at = CURRENT_TIMESTAMP
+            WHERE group_id = %s;
+            INSERT INTO finds (group_id, number, action, user_id) VALUES (%s, %s, 'found', %s)
+            """,
+            (found_bitmap, next_number, group_id, group_id, number, user_id)
+        )
+        return next_number
+
+    def _revert_rows(self, cur, group_id, number):
+        """החזרת מספר למאגר כמספר הנוכחי במצב שורות"""
+        cur.execute(
+            """
+            SELECT pg_advisory_xact_lock(%(group_id)s);
+            UPDATE numbers SET is_current = FALSE
+            WHERE group_id = %(group_id)s AND is_current AND number <> %(number)s;
+            UPDATE numbers
+            SET is_found = FALSE, is_current = TRUE, found_by = NULL, found_at = NULL
+            WHERE group_id = %(group_id)s AND number = %(number)s
+            """,
+            {'group_id': group_id, 'number': number}
+        )
+
+    def _revert_bitmap(self, cur, group_id, number):
+        """החזרת מספר למאגר כמספר הנוכחי במצב מפת סיביות"""
+        found_bitmap = number_bitmap.clear_bit(self._lock_bitmap(cur, group_id), number)
+        cur.execute(
+            """
+            UPDATE number_bitmaps
+            SET found_bitmap = %s, current_number = %s, updated_at = CURRENT_TIMESTAMP
+            WHERE group_id = %s;
+            INSERT INTO finds (group_id, number, action) VALUES (%s, %s, 'reverted')
+            """,
+            (found_bitmap, number, group_id, group_id, number)
+        )
+
+    def _mark_extra_found(self, cur, group_id, storage_mode, numbers, user_id):
+        """
+        סימון מספרים נוספים שהופיעו בתמונה כנמצאו, בלי לשנות את המספר הנוכחי
+
+        Returns:
+            list: המספרים שסומנו בפועל (מספרים שכבר נמצאו או שהם הנוכחי מדולגים)
+        """
+        if storage_mode == STORAGE_BITMAP:
             cur.execute(
-                "SELECT number FROM numbers WHERE group_id = %s AND is_found = FALSE",
+                "SELECT found_bitmap, current_number FROM number_bitmaps WHERE group_id = %s FOR UPDATE",
                 (group_id,)
             )
-            available_numbers = [row[0] for row in cur.fetchall()]
-            
-            if not available_numbers:
-                logger.info(f"אין מספרים זמינים עבור הקבוצה {group_id}")
-                return None
-            
-            # בחירת מספר אקראי מהזמינים
-            current_number = random.choice(available_numbers)
-            
-            # עדכון המספר הנוכחי
+            found_bitmap, current_number = cur.fetchone()
+            found_bitmap = bytes(found_bitmap)
+            marked = [
+                number for number in sorted(set(numbers))
+                if 0 <= number < NUMBERS_PER_GROUP and number != current_number
+                and not number_bitmap.is_set(found_bitmap, number)
+            ]
+            if marked:
+                for number in marked:
+                    found_bitmap = number_bitmap.set_bit(found_bitmap, number)
+                cur.execute(
+                    "UPDATE number_bitmaps SET found_bitmap = %s, updated_at = CURRENT_TIMESTAMP WHERE group_id = %s",
+                    (found_bitmap, group_id)
+                )
+                execute_values(
+                    cur,
+                    "INSERT INTO finds (group_id, number, action, user_id) VALUES %s",
+                    [(group_id, number, 'found', user_id) for number in marked]
+                )
+            return marked
+
+        cur.execute(
+            """
+            UPDATE numbers
+            SET is_found = TRUE, found_by = %s, found_at = CURRENT_TIMESTAMP
+            WHERE group_id = %s AND number = ANY(%s) AND NOT is_found AND NOT is_current
+            RETURNING number
+            """,
+            (user_id, group_id, list(numbers))
+        )
+        return sorted(row[0] for row in cur.fetchall())
+
+    def _release_extra_found(self, cur, group_id, storage_mode, numbers):
+        """החזרת מספרים נוספים שסומנו מאותה תמונה למאגר (בלי לשנות את המספר הנוכחי)"""
+        if not numbers:
+            return
+        if storage_mode == STORAGE_BITMAP:
+            found_bitmap = self._lock_bitmap(cur, group_id)
+            for number in numbers:
+                found_bitmap = number_bitmap.clear_bit(found_bitmap, number)
             cur.execute(
-                "UPDATE numbers SET is_current = TRUE WHERE group_id = %s AND number = %s",
-                (group_id, current_number)
+                "UPDATE number_bitmaps SET found_bitmap = %s, updated_at = CURRENT_TIMESTAMP WHERE group_id = %s",
+                (found_bitmap, group_id)
+            )
+            execute_values(
+                cur,
+                "INSERT INTO finds (group_id, number, action) VALUES %s",
+                [(group_id, number, 'reverted') for number in numbers]
             )
-            
-            conn.commit()
+        else:
+            cur.execute(
+                """
+                UPDATE numbers SET is_found = FALSE, found_by = NULL, found_at = NULL
+                WHERE group_id = %s AND number = ANY(%s)
+                """,
+                (group_id, list(numbers))
+            )
+
+    def select_next_number(self, group_id):
+        """בחירת המספר הבא לחיפוש"""
+        try:
+            # וידוא שהקבוצה מאותחלת
+            storage_mode = self._storage_mode(group_id)
+
+            with self.state_cache.group_lock(group_id):
+                with self._cursor() as cur:
+                    if storage_mode == STORAGE_BITMAP:
+                        current_number = self._pick_next_number_bitmap(cur, group_id)
+                    else:
+                        current_number = self._pick_next_number(cur, group_id)
+
+                if current_number is not None:
+                    self.state_cache.update(group_id, 'set_current', current_number)
+
+            if current_number is None:
+                logger.info(f"אין מספרים זמינים עבור הקבוצה {group_id}")
+                return None
+
             logger.info(f"המספר {current_number} נבחר כמספר הנוכחי לקבוצה {group_id}")
             return current_number
-            
+
         except Exception as e:
             logger.error(f"שגיאה בבחירת מספר הבא: {e}")
-            conn.rollback()
+            self.state_cache.invalidate(group_id)
             return None
-            
-        finally:
-            cur.close()
-            conn.close()
-    
+
+    def _load_group_state(self, group_id):
+        """טעינת מצב המשחק של קבוצה ממסד הנתונים בשאילתה אחת"""
+        # וידוא שהקבוצה מאותחלת
+        storage_mode = self._storage_mode(group_id)
+
+        with self._cursor() as cur:
+            if storage_mode == STORAGE_BITMAP:
+                cur.execute(
+                    "SELECT found_bitmap, current_number FROM number_bitmaps WHERE group_id = %s",
+                    (group_id,)
+                )
+                found_bitmap, current_number = cur.fetchone()
+                found_numbers = number_bitmap.to_numbers(bytes(found_bitmap))
+                total = NUMBERS_PER_GROUP
+            else:
+                cur.execute(
+                    """
+                    SELECT
+                        COUNT(*),
+                        MAX(number) FILTER (WHERE is_current),
+                        COALESCE(ARRAY_AGG(number) FILTER (WHERE is_found), '{}')
+                    FROM numbers
+                    WHERE group_id = %s
+                    """,
+                    (group_id,)
+                )
+                total, current_number, found_numbers = cur.fetchone()
+
+        logger.info(f"מצב המשחק של הקבוצה {group_id} נטען ממסד הנתונים")
+        return GroupState(group_id, current_number, found_numbers, total)
+
+    def invalidate_game_state(self, group_id=None):
+        """ניקוי מצב המשחק מהזיכרון (של קבוצה אחת או של כל הקבוצות)"""
+        self.state_cache.invalidate(group_id)
+
     def get_current_number(self, group_id):
         """קבלת המספר הנוכחי לחיפוש"""
-        conn = self._get_connection()
-        cur = conn.cursor()
-        
         try:
-            # וידוא שהקבוצה מאותחלת
-            self.init_group(group_id)
-            
-            # קבלת המספר הנוכחי
-            cur.execute(
-                "SELECT number FROM numbers WHERE group_id = %s AND is_current = TRUE",
-                (group_id,)
-            )
-            result = cur.fetchone()
-            
-            return result[0] if result else None
-            
+            return self.state_cache.get(group_id).current_number
+
         except Exception as e:
             logger.error(f"שגיאה בקבלת מספר נוכחי: {e}")
             return None
-            
-        finally:
-            cur.close()
-            conn.close()
-    
+
     def mark_number_as_found(self, group_id, number, user_id=None):
         """סימון מספר כנמצא"""
-        conn = self._get_connection()
-        cur = conn.cursor()
-        
         try:
-            # עדכון המספר כנמצא
-            cur.execute(
-                """
-                UPDATE numbers 
-                SET is_found = TRUE, is_current = FALSE, found_by = %s, found_at = CURRENT_TIMESTAMP
-                WHERE group_id = %s AND number = %s
-                """,
-                (user_id, group_id, number)
-            )
-            
-            conn.commit()
+            storage_mode = self._storage_mode(group_id)
+
+            with self.state_cache.group_lock(group_id):
+                with self._cursor() as cur:
+                    # עדכון המספר כנמצא ובחירת מספר חדש באותה טרנזקציה
+                    if storage_mode == STORAGE_BITMAP:
+                        next_number = self._mark_found_bitmap(cur, group_id, number, user_id)
+                    else:
+                        next_number = self._mark_found_rows(cur, group_id, number, user_id)
+
+                self.state_cache.update(group_id, 'mark_found', number, next_number)
+
             logger.info(f"המספר {number} סומן כנמצא על ידי המשתמש {user_id} בקבוצה {group_id}")
-            
-            # בחירת מספר חדש
-            return self.select_next_number(group_id)
-            
+            if next_number is None:
+                logger.info(f"אין מספרים זמינים עבור הקבוצה {group_id}")
+            else:
+                logger.info(f"המספר {next_number} נבחר כמספר הנוכחי לקבוצה {group_id}")
+            return next_number
+
         except Exception as e:
             logger.error(f"שגיאה בסימון מספר כנמצא: {e}")
-            conn.rollback()
+            self.state_cache.invalidate(group_id)
             return None
-            
-        finally:
-            cur.close()
-            conn.close()
-    
-    def revert_found_number(self, group_id, number):
-        """החזרת מספר למאגר (פסילת מציאה)"""
-        conn = self._get_connection()
-        cur = conn.cursor()
-        
-        try:
-            # איפוס כל המספרים הנוכחיים
+
+    def _lock_current_number(self, cur, group_id, storage_mode):
+        """נעילת מצב הקבוצה עד סוף הטרנזקציה והחזרת המספר הנוכחי לפי מסד הנתונים"""
+        if storage_mode == STORAGE_BITMAP:
             cur.execute(
-                "UPDATE numbers SET is_current = FALSE WHERE group_id = %s",
+                "SELECT current_number FROM number_bitmaps WHERE group_id = %s FOR UPDATE",
                 (group_id,)
             )
-            
-            # החזרת המספר למאגר
-            cur.execute(
-                """
-                UPDATE numbers 
-                SET is_found = FALSE, is_current = TRUE, found_by = NULL, found_at = NULL
-                WHERE group_id = %s AND number = %s
-                """,
-                (group_id, number)
-            )
-            
-            conn.commit()
+            row = cur.fetchone()
+            return row[0] if row else None
+
+        cur.execute(
+            """
+            SELECT pg_advisory_xact_lock(%(group_id)s);
+            SELECT number FROM numbers WHERE group_id = %(group_id)s AND is_current
+            """,
+            {'group_id': group_id}
+        )
+        row = cur.fetchone()
+        return row[0] if row else None
+
+    def claim_current_number(self, group_id, number, user_id=None):
+        """
+        סימון מספר כנמצא רק אם הוא עדיין המספר הנוכחי
+
+        הבדיקה והסימון מתבצעים באותה טרנזקציה תחת נעילת הקבוצה, כך שמתוך
+        כמה תמונות של אותו מספר שמעובדות במקביל רק הראשונה מזוכה - גם בין
+        תהליכים שונים.
+
+        Returns:
+            tuple: (האם המציאה נרשמה, המספר הנוכחי לאחר הפעולה), או (False, None) בשגיאה
+        """
+        claimed, next_number, _ = self.claim_numbers(group_id, number, user_id=user_id)
+        return claimed, next_number
+
+    def claim_numbers(self, group_id, number, extra_numbers=(), user_id=None):
+        """
+        כמו claim_current_number, ובנוסף סימון מספרים נוספים שהופיעו באותה תמונה
+
+        המספרים הנוספים מסומנים רק אם המספר הנוכחי נתפס, באותה טרנזקציה,
+        ולפני בחירת המספר הבא (כך שהמספר הבא לא יהיה אחד מהם).
+
+        Returns:
+            tuple: (האם המציאה נרשמה, המספר הנוכחי לאחר הפעולה, המספרים הנוספים שסומנו),
+                   או (False, None, []) בשגיאה
+        """
+        try:
+            storage_mode = self._storage_mode(group_id)
+
+            with self.state_cache.group_lock(group_id):
+                with self._cursor() as cur:
+                    current_number = self._lock_current_number(cur, group_id, storage_mode)
+                    extras = []
+                    if current_number != number:
+                        claimed, next_number = False, current_number
+                    else:
+                        if extra_numbers:
+                            extras = self._mark_extra_found(cur, group_id, storage_mode, extra_numbers, user_id)
+                        if storage_mode == STORAGE_BITMAP:
+                            claimed, next_number = True, self._mark_found_bitmap(cur, group_id, number, user_id)
+                        else:
+                            claimed, next_number = True, self._mark_found_rows(cur, group_id, number, user_id)
+
+                if claimed:
+                    self.state_cache.update(group_id, 'add_found', extras)
+                    self.state_cache.update(group_id, 'mark_found', number, next_number)
+                else:
+                    # המצב השתנה מאז שהתמונה התקבלה - טעינה מחדש מבטיחה התאמה למסד הנתונים
+                    self.state_cache.invalidate(group_id)
+
+            if claimed:
+                logger.info(f"המספר {number} סומן כנמצא על ידי המשתמש {user_id} בקבוצה {group_id}")
+                if extras:
+                    logger.info(f"סומנו כנמצאו גם המספרים {extras} מאותה תמונה בקבוצה {group_id}")
+            else:
+                logger.info(f"המספר {number} כבר אינו המספר הנוכחי בקבוצה {group_id} (נוכחי: {next_number})")
+            return claimed, next_number, extras
+
+        except Exception as e:
+            logger.error(f"שגיאה בסימון מספר כנמצא: {e}")
+            self.state_cache.invalidate(group_id)
+            return False, None, []
+
+    def revert_found_number(self, group_id, number, extra_numbers=()):
+        """החזרת מספר למאגר (פסילת מציאה), יחד עם המספרים הנוספים שסומנו מאותה תמונה"""
+        try:
+            storage_mode = self._storage_mode(group_id)
+
+            with self.state_cache.group_lock(group_id):
+                with self._cursor() as cur:
+                    if storage_mode == STORAGE_BITMAP:
+                        self._revert_bitmap(cur, group_id, number)
+                    else:
+                        self._revert_rows(cur, group_id, number)
+                    self._release_extra_found(cur, group_id, storage_mode, extra_numbers)
+
+                self.state_cache.update(group_id, 'remove_found', extra_numbers)
+                self.state_cache.update(group_id, 'revert', number)
+
             logger.info(f"המספר {number} הוחזר למאגר בקבוצה {group_id}")
             return number
-            
+
         except Exception as e:
             logger.error(f"שגיאה בהחזרת מספר למאגר: {e}")
-            conn.rollback()
+            self.state_cache.invalidate(group_id)
             return None
-            
-        finally:
-            cur.close()
-            conn.close()
-    
+
+    def migrate_group_to_bitmap(self, group_id):
+        """
+        העברת קבוצה קיימת ממצב שורות למצב מפת סיביות
+
+        מצב המספרים נדחס למפת סיביות, פרטי המציאות (found_by, found_at)
+        מועתקים לטבלת finds, והשורות של הקבוצה נמחקות מטבלת numbers.
+        """
+        try:
+            if self._storage_mode(group_id) == STORAGE_BITMAP:
+                return True
+
+            with self.state_cache.group_lock(group_id):
+                with self._cursor() as cur:
+                    cur.execute(
+                        """
+                        SELECT pg_advisory_xact_lock(%s);
+                        SELECT number, is_current, is_found, found_by, found_at
+                        FROM numbers WHERE group_id = %s
+                        """,
+                        (group_id, group_id)
+                    )
+                    rows = cur.fetchall()
+
+                    found_rows = [row for row in rows if row[2]]
+                    current_number = next((row[0] for row in rows if row[1]), None)
+                    found_bitmap = number_bitmap.from_numbers([row[0] for row in found_rows], NUMBERS_PER_GROUP)
+
+                    cur.execute(
+                        "INSERT INTO number_bitmaps (group_id, found_bitmap, current_number) VALUES (%s, %s, %s)",
+                        (group_id, found_bitmap, current_number)
+                    )
+                    if found_rows:
+                        execute_values(
+                            cur,
+                            "INSERT INTO finds (group_id, number, action, user_id, created_at) VALUES %s",
+                            [(group_id, number, 'found', found_by, found_at or datetime.now())
+                             for number, _, _, found_by, found_at in found_rows]
+                        )
+                    cur.execute("DELETE FROM numbers WHERE group_id = %s", (group_id,))
+
+                self._known_groups[group_id] = STORAGE_BITMAP
+                self.state_cache.invalidate(group_id)
+
+            logger.info(f"הקבוצה {group_id} הועברה למצב מפת סיביות ({len(found_rows)} מספרים שנמצאו)")
+            return True
+
+        except Exception as e:
+            logger.error(f"שגיאה בהעברת קבוצה למצב מפת סיביות: {e}")
+            return False
+
+    def migrate_all_groups_to_bitmap(self):
+        """העברת כל הקבוצות שעדיין במצב שורות למצב מפת סיביות"""
+        try:
+            with self._cursor() as cur:
+                cur.execute("""
+                    SELECT group_id FROM groups
+                    WHERE group_id NOT IN (SELECT group_id FROM number_bitmaps)
+                """)
+                group_ids = [row[0] for row in cur.fetchall()]
+
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת רשימת קבוצות להעברה: {e}")
+            return 0
+
+        migrated = sum(1 for group_id in group_ids if self.migrate_group_to_bitmap(group_id))
+        logger.info(f"הועברו {migrated}/{len(group_ids)} קבוצות למצב מפת סיביות")
+        return migrated
+
     def get_stats(self, group_id):
         """קבלת סטטיסטיקות משחק"""
-        conn = self._get_connection()
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
         try:
-            # וידוא שהקבוצה מאותחלת
-            self.init_group(group_id)
-            
-            # קבלת סטטיסטיקות
-            cur.execute("""
-                SELECT 
-                    COUNT(*) AS total,
-                    SUM(CASE WHEN is_found THEN 1 ELSE 0 END) AS found
-                FROM numbers
-                WHERE group_id = %s
-            """, (group_id,))
-            
-            result = dict(cur.fetchone())
-            result['found'] = int(result['found']) if result['found'] else 0  # המרה ל-int (לפעמים מוחזר כ-Decimal)
-            result['remaining'] = result['total'] - result['found']
-            result['percentage'] = round((result['found'] / result['total']) * 100, 2) if result['total'] > 0 else 0
-            
+            result = self.state_cache.get(group_id).to_stats()
+
             logger.info(f"נקראו סטטיסטיקות עבור קבוצה {group_id}: {result}")
             return result
-            
+
         except Exception as e:
             logger.error(f"שגיאה בקבלת סטטיסטיקות: {e}")
-            return {'total': 1000, 'found': 0, 'remaining': 1000, 'percentage': 0}
-            
-        finally:
-            cur.close()
-            conn.close()
-    
-    def save_temp_image(self, message_id, image_path, user_id, username, group_id, current_number, plate_numbers):
+            return {'total': NUMBERS_PER_GROUP, 'found': 0, 'remaining': NUMBERS_PER_GROUP, 'percentage': 0}
+
+    def get_group_snapshot(self, group_id):
+        """
+        קבלת תמונת מצב של הקבוצה: המספר הנוכחי והסטטיסטיקות בפעולה אחת
+
+        Returns:
+            dict: current_number, total, found, remaining, percentage
+        """
+        try:
+            with self.state_cache.group_lock(group_id):
+                state = self.state_cache.get(group_id)
+                snapshot = state.to_stats()
+                snapshot['current_number'] = state.current_number
+            return snapshot
+
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת תמונת מצב של הקבוצה: {e}")
+            return {
+                'current_number': None,
+                'total': NUMBERS_PER_GROUP, 'found': 0, 'remaining': NUMBERS_PER_GROUP, 'percentage': 0
+            }
+
+    def get_found_numbers(self, group_id):
+        """
+        קבלת המספרים שכבר נמצאו בקבוצה
+
+        Returns:
+            tuple: (קבוצת המספרים שנמצאו, גודל המאגר)
+        """
+        try:
+            with self.state_cache.group_lock(group_id):
+                state = self.state_cache.get(group_id)
+                return set(state.found_numbers), state.total
+
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת המספרים שנמצאו: {e}")
+            return set(), NUMBERS_PER_GROUP
+
+    def save_temp_image(self, message_id, image_path, user_id, username, group_id, current_number, plate_numbers,
+                        file_id=None, auto_found=False, extra_numbers=()):
         """שמירת נתוני תמונה זמנית"""
-        conn = self._get_connection()
-        cur = conn.cursor()
-        
-        try:
-            # הוספת התמונה למסד הנתונים
-            cur.execute("""
-                INSERT INTO temp_images 
-                (message_id, image_path, user_id, username, group_id, current_number, plate_numbers)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (message_id) DO UPDATE
-                SET image_path = EXCLUDED.image_path,
-                    user_id = EXCLUDED.user_id,
-                    username = EXCLUDED.username,
-                    group_id = EXCLUDED.group_id,
-                    current_number = EXCLUDED.current_number,
-                    plate_numbers = EXCLUDED.plate_numbers
-            """, (
-                message_id, image_path, user_id, username, group_id, current_number, plate_numbers
-            ))
-            
-            conn.commit()
+        try:
+            with self._cursor() as cur:
+                # הוספת התמונה למסד הנתונים
+                cur.execute("""
+                    INSERT INTO temp_images
+                    (message_id, image_path, user_id, username, group_id, current_number, plate_numbers, file_id,
+                     auto_found, extra_numbers)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (message_id) DO UPDATE
+                    SET image_path = EXCLUDED.image_path,
+                        user_id = EXCLUDED.user_id,
+                        username = EXCLUDED.username,
+                        group_id = EXCLUDED.group_id,
+                        current_number = EXCLUDED.current_number,
+                        plate_numbers = EXCLUDED.plate_numbers,
+                        file_id = EXCLUDED.file_id,
+                        auto_found = EXCLUDED.auto_found,
+                        extra_numbers = EXCLUDED.extra_numbers
+                """, (
+                    message_id, image_path, user_id, username, group_id, current_number, plate_numbers, file_id,
+                    auto_found, list(extra_numbers)
+                ))
+
             logger.info(f"נשמרה תמונה זמנית למסד הנתונים, message_id={message_id}")
             return True
-            
+
         except Exception as e:
             logger.error(f"שגיאה בשמירת תמונה זמנית: {e}")
-            conn.rollback()
             return False
-            
-        finally:
-            cur.close()
-            conn.close()
-    
+
+    def save_album_images(self, images, threshold, preprocessed=False, create_digest=False):
+        """
+        שמירת נתוני כל התמונות של אלבום ותוצאות ההתאמה שלהן בטרנזקציה אחת
+
+        Args:
+            images: רשימת מילונים עם שדות save_temp_image ו-confidence, לפי סדר האלבום
+            threshold: סף הביטחון שהיה בתוקף
+            preprocessed: האם התמונות הוקטנו לפני הזיהוי
+            create_digest: האם לשייך את התמונות לסיכום חדש, לשליחה מיידית למנהל
+
+        Returns:
+            tuple: (מזהה הסיכום או None, התמונות שנשמרו לפי סדר האלבום), או (None, []) אם נכשל
+        """
+        try:
+            with self._cursor(cursor_factory=DictCursor) as cur:
+                digest_id = None
+                if create_digest:
+                    cur.execute("SELECT nextval('admin_digest_seq')")
+                    digest_id = cur.fetchone()[0]
+
+                rows = execute_values(
+                    cur,
+                    """
+                    INSERT INTO temp_images
+                    (message_id, image_path, user_id, username, group_id, current_number, plate_numbers, file_id,
+                     auto_found, extra_numbers, review_status, digest_id, digest_position)
+                    VALUES %s
+                    ON CONFLICT (message_id) DO UPDATE
+                    SET image_path = EXCLUDED.image_path,
+                        user_id = EXCLUDED.user_id,
+                        username = EXCLUDED.username,
+                        group_id = EXCLUDED.group_id,
+                        current_number = EXCLUDED.current_number,
+                        plate_numbers = EXCLUDED.plate_numbers,
+                        file_id = EXCLUDED.file_id,
+                        auto_found = EXCLUDED.auto_found,
+                        extra_numbers = EXCLUDED.extra_numbers,
+                        review_status = EXCLUDED.review_status,
+                        digest_id = EXCLUDED.digest_id,
+                        digest_position = EXCLUDED.digest_position
+                    RETURNING *
+                    """,
+                    [
+                        (
+                            image['message_id'], image['image_path'], image['user_id'], image['username'],
+                            image['group_id'], image['current_number'], image['plate_numbers'], image['file_id'],
+                            image['auto_found'], list(image.get('extra_numbers') or []),
+                            'sent' if create_digest else 'pending', digest_id,
+                            position if create_digest else None
+                        )
+                        for position, image in enumerate(images, start=1)
+                    ],
+                    template="(%s, %s, %s, %s, %s, %s, %s::TEXT[], %s, %s, %s::INTEGER[], %s, %s, %s)",
+                    fetch=True
+                )
+
+                execute_values(
+                    cur,
+                    """
+                    INSERT INTO match_outcomes
+                    (message_id, group_id, number, confidence, threshold, auto_found, preprocessed)
+                    VALUES %s
+                    ON CONFLICT (group_id, message_id) DO NOTHING
+                    """,
+                    [
+                        (
+                            image['message_id'], image['group_id'], image['current_number'], image['confidence'],
+                            threshold, image['auto_found'], preprocessed
+                        )
+                        for image in images
+                    ]
+                )
+
+            items = sorted((dict(row) for row in rows), key=lambda item: item['message_id'])
+            logger.info(f"נשמרו {len(items)} תמונות אלבום למסד הנתונים")
+            return digest_id, items
+
+        except Exception as e:
+            logger.error(f"שגיאה בשמירת תמונות האלבום: {e}")
+            return None, []
+
     def get_temp_image(self, message_id):
         """קבלת נתוני תמונה זמנית"""
-        conn = self._get_connection()
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
         try:
-            cur.execute("SELECT * FROM temp_images WHERE message_id = %s", (message_id,))
-            result = cur.fetchone()
-            
+            with self._cursor(cursor_factory=DictCursor) as cur:
+                cur.execute("SELECT * FROM temp_images WHERE message_id = %s", (message_id,))
+                result = cur.fetchone()
+
             if result:
                 logger.info(f"נמצאו נתוני תמונה זמנית, message_id={message_id}")
                 return dict(result)
             else:
                 logger.warning(f"לא נמצאו נתוני תמונה זמנית, message_id={message_id}")
                 return None
-            
+
         except Exception as e:
             logger.error(f"שגיאה בקבלת תמונה זמנית: {e}")
             return None
-            
-        finally:
-            cur.close()
-            conn.close()
-    
+
     def delete_temp_image(self, message_id):
         """מחיקת נתוני תמונה זמנית"""
-        conn = self._get_connection()
-        cur = conn.cursor()
-        
         try:
-            cur.execute("DELETE FROM temp_images WHERE message_id = %s", (message_id,))
-            conn.commit()
+            with self._cursor() as cur:
+                cur.execute("DELETE FROM temp_images WHERE message_id = %s", (message_id,))
             logger.info(f"נמחקו נתוני תמונה זמנית, message_id={message_id}")
             return True
-            
+
         except Exception as e:
             logger.error(f"שגיאה במחיקת תמונה זמנית: {e}")
-            conn.rollback()
             return False
-            
-        finally:
-            cur.close()
-            conn.close()
-    
+
     def clean_old_temp_images(self, hours=24):
         """ניקוי תמונות זמניות ישנות"""
-        conn = self._get_connection()
-        cur = conn.cursor()
-        
         try:
-            cur.execute(
-                "DELETE FROM temp_images WHERE created_at < NOW() - INTERVAL '%s hours' RETURNING message_id",
-                (hours,)
-            )
-            
-            deleted_rows = cur.fetchall()
-            deleted_count = len(deleted_rows)
-            
-            conn.commit()
+            with self._cursor() as cur:
+                cur.execute(
+                    "DELETE FROM temp_images WHERE created_at < NOW() - INTERVAL '%s hours' RETURNING message_id",
+                    (hours,)
+                )
+
+                deleted_rows = cur.fetchall()
+                deleted_count = len(deleted_rows)
+
             logger.info(f"נוקו {deleted_count} תמונות זמניות ישנות (מלפני {hours} שעות)")
             return True
-            
+
         except Exception as e:
             logger.error(f"שגיאה בניקוי תמונות זמניות: {e}")
-            conn.rollback()
             return False
-            
-        finally:
-            cur.close()
-            conn.close()
\ No newline at end of file
+
+    def claim_review_digest(self, limit=10):
+        """
+        איסוף התמונות הממתינות לבדיקת המנהל לסיכום חדש
+
+        התמונות הוותיקות ביותר מסומנות כנשלחו ומשויכות למזהה סיכום חדש.
+        SKIP LOCKED מונע משני תהליכים לאסוף את אותן תמונות.
+
+        Returns:
+            tuple: (מזהה הסיכום, רשימת התמונות), או (None, []) אם אין תמונות ממתינות
+        """
+        try:
+            with self._cursor(cursor_factory=DictCursor) as cur:
+                cur.execute(
+                    """
+                    WITH digest AS (SELECT nextval('admin_digest_seq') AS digest_id)
+                    UPDATE temp_images AS t
+                    SET review_status = 'sent', digest_id = digest.digest_id
+                    FROM digest, (
+                        SELECT message_id FROM temp_images
+                        WHERE review_status = 'pending'
+                        ORDER BY created_at
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    ) AS pending
+                    WHERE t.message_id = pending.message_id
+                    RETURNING t.*
+                    """,
+                    (limit,)
+                )
+                items = sorted((dict(row) for row in cur.fetchall()), key=lambda item: item['created_at'])
+                if not items:
+                    return None, []
+
+                # מספור התמונות בסיכום (נשמר כדי שהמספור לא ישתנה כשחלק מהתמונות כבר טופלו)
+                for position, item in enumerate(items, start=1):
+                    item['digest_position'] = position
+                cur.execute(
+                    """
+                    UPDATE temp_images AS t SET digest_position = v.position
+                    FROM unnest(%s::BIGINT[], %s::INTEGER[]) AS v(message_id, position)
+                    WHERE t.message_id = v.message_id
+                    """,
+                    ([item['message_id'] for item in items], [item['digest_position'] for item in items])
+                )
+
+            return items[0]['digest_id'], items
+
+        except Exception as e:
+            logger.error(f"שגיאה באיסוף תמונות לסיכום המנהל: {e}")
+            return None, []
+
+    def release_review_digest(self, digest_id):
+        """החזרת תמונות הסיכום לתור (אם שליחתו נכשלה)"""
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    "UPDATE temp_images SET review_status = 'pending', digest_id = NULL WHERE digest_id = %s",
+                    (digest_id,)
+                )
+            return True
+
+        except Exception as e:
+            logger.error(f"שגיאה בהחזרת סיכום לתור: {e}")
+            return False
+
+    def get_digest_items(self, digest_id):
+        """התמונות של סיכום שעדיין לא טופלו"""
+        try:
+            with self._cursor(cursor_factory=DictCursor) as cur:
+                cur.execute(
+                    "SELECT * FROM temp_images WHERE digest_id = %s ORDER BY digest_position",
+                    (digest_id,)
+                )
+                return [dict(row) for row in cur.fetchall()]
+
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת תמונות הסיכום: {e}")
+            return []
+
+    def apply_digest_action(self, digest_id, action):
+        """
+        אישור או פסילה של כל התמונות בסיכום בטרנזקציה אחת
+
+        אישור: תמונות שלא אושרו אוטומטית נרשמות כמציאה. פסילה: מציאות
+        שאושרו אוטומטית חוזרות למאגר. בשני המקרים התמונות נמחקות מהתור -
+        בתחילת הטרנזקציה (DELETE ... RETURNING), והפעולה מתבצעת רק על השורות
+        שנמחקו בה. לחיצה כפולה על הכפתור ממתינה לנעילת השורות ומוצאת אותן
+        מחוקות, כך שאף תמונה אינה מטופלת פעמיים.
+
+        Returns:
+            tuple: (התמונות שטופלו, השינויים שבוצעו - מילונים עם group_id, number,
+                   username, next_number), או (התמונות, None) אם הפעולה נכשלה
+        """
+        # הקבוצות המעורבות - לנעילה לפני הטרנזקציה
+        items = self.get_digest_items(digest_id)
+        if not items:
+            return [], []
+
+        group_ids = sorted({item['group_id'] for item in items})
+        storage_modes = {group_id: self._storage_mode(group_id) for group_id in group_ids}
+
+        try:
+            # נעילת כל הקבוצות המעורבות לפי סדר קבוע (מניעת קיפאון)
+            with ExitStack() as stack:
+                for group_id in group_ids:
+                    stack.enter_context(self.state_cache.group_lock(group_id))
+
+                changes = []
+                reviewed = {}  # group_id -> תמונות שאושרו ידנית או שהמציאה שלהן נפסלה
+                with self._cursor(cursor_factory=DictCursor) as cur:
+                    cur.execute("DELETE FROM temp_images WHERE digest_id = %s RETURNING *", (digest_id,))
+                    items = sorted((dict(row) for row in cur.fetchall()), key=lambda item: item['digest_position'])
+                    if not items:
+                        return [], []
+                    if not {item['group_id'] for item in items} <= set(group_ids):
+                        raise RuntimeError("תמונות הסיכום השתנו מאז שנקראו")
+
+                    for item in items:
+                        group_id, number = item['group_id'], item['current_number']
+                        bitmap_mode = storage_modes[group_id] == STORAGE_BITMAP
+
+                        if action == 'approve' and not item['auto_found']:
+                            if bitmap_mode:
+                                next_number = self._mark_found_bitmap(cur, group_id, number, item['user_id'])
+                            else:
+                                next_number = self._mark_found_rows(cur, group_id, number, item['user_id'])
+                        elif action == 'reject' and item['auto_found']:
+                            if bitmap_mode:
+                                self._revert_bitmap(cur, group_id, number)
+                            else:
+                                self._revert_rows(cur, group_id, number)
+                            self._release_extra_found(
+                                cur, group_id, storage_modes[group_id], item.get('extra_numbers') or []
+                            )
+                            next_number = number
+                        else:
+                            continue
+
+                        reviewed.setdefault(group_id, []).append(item['message_id'])
+                        changes.append({
+                            'group_id': group_id,
+                            'number': number,
+                            'username': item['username'],
+                            'next_number': next_number
+                        })
+
+                    review = 'approved' if action == 'approve' else 'overturned'
+                    for group_id, message_ids in reviewed.items():
+                        self._set_match_review(cur, group_id, message_ids, review)
+
+                # המצב בזיכרון נטען מחדש מהמצב שנשמר
+                for group_id in group_ids:
+                    self.state_cache.invalidate(group_id)
+
+            logger.info(f"הסיכום {digest_id}: בוצעה פעולת {action} על {len(items)} תמונות ({len(changes)} שינויים)")
+            return items, changes
+
+        except Exception as e:
+            logger.error(f"שגיאה בטיפול בסיכום {digest_id}: {e}")
+            for group_id in group_ids:
+                self.state_cache.invalidate(group_id)
+            return items, None
+
+    def record_match_outcome(self, message_id, group_id, number, confidence, threshold, auto_found,
+                             preprocessed=False):
+        """
+        רישום תוצאת ההתאמה של תמונה
+
+        Args:
+            confidence: ביטחון הזיהוי של המספר בתמונה (None אם לא הופיע בה)
+            threshold: סף הביטחון שהיה בתוקף
+            auto_found: האם המציאה אושרה אוטומטית
+            preprocessed: האם התמונה הוקטנה לפני הזיהוי
+        """
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO match_outcomes
+                    (message_id, group_id, number, confidence, threshold, auto_found, preprocessed)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (group_id, message_id) DO NOTHING
+                    """,
+                    (message_id, group_id, number, confidence, threshold, auto_found, preprocessed)
+                )
+            return True
+
+        except Exception as e:
+            logger.error(f"שגיאה ברישום תוצאת ההתאמה: {e}")
+            return False
+
+    def _set_match_review(self, cur, group_id, message_ids, review):
+        cur.execute(
+            "UPDATE match_outcomes SET review = %s WHERE group_id = %s AND message_id = ANY(%s)",
+            (review, group_id, list(message_ids))
+        )
+
+    def set_match_review(self, group_id, message_id, review):
+        """
+        רישום החלטת המנהל על תמונה
+
+        Args:
+            group_id: הקבוצה שבה נשלחה התמונה
+            review: 'approved' (אישור ידני של תמונה שלא אושרה אוטומטית)
+                    או 'overturned' (פסילה של מציאה שאושרה אוטומטית)
+        """
+        try:
+            with self._cursor() as cur:
+                self._set_match_review(cur, group_id, [message_id], review)
+            return True
+
+        except Exception as e:
+            logger.error(f"שגיאה ברישום החלטת המנהל: {e}")
+            return False
+
+    def match_outcome_stats(self, days=30):
+        """
+        שיעורי האישור האוטומטי והפסילה לפי סף הביטחון שהיה בתוקף, ולפי האם
+        התמונה הוקטנה לפני הזיהוי (להשוואת השפעת ההקטנה על הדיוק)
+
+        Returns:
+            list: מילון לכל סף עם מספר התמונות, האישורים האוטומטיים, הפסילות
+                  והאישורים הידניים, והשיעורים שלהם
+        """
+        try:
+            with self._cursor(cursor_factory=DictCursor) as cur:
+                cur.execute(
+                    """
+                    SELECT
+                        threshold,
+                        preprocessed,
+                        COUNT(*) AS submissions,
+                        COUNT(*) FILTER (WHERE auto_found) AS auto_approved,
+                        COUNT(*) FILTER (WHERE review = 'overturned') AS overturned,
+                        COUNT(*) FILTER (WHERE review = 'approved') AS manual_approved,
+                        COUNT(*) FILTER (WHERE NOT auto_found AND confidence IS NOT NULL) AS below_threshold
+                    FROM match_outcomes
+                    WHERE created_at > NOW() - %s * INTERVAL '1 day'
+                    GROUP BY threshold, preprocessed
+                    ORDER BY threshold, preprocessed
+                    """,
+                    (days,)
+                )
+                stats = []
+                for row in cur.fetchall():
+                    row = dict(row)
+                    submissions, auto_approved = row['submissions'], row['auto_approved']
+                    row['auto_approve_rate'] = round(auto_approved / submissions, 4) if submissions else 0
+                    row['overturn_rate'] = round(row['overturned'] / auto_approved, 4) if auto_approved else 0
+                    manual = submissions - auto_approved
+                    row['manual_approve_rate'] = round(row['manual_approved'] / manual, 4) if manual else 0
+                    stats.append(row)
+                return stats
+
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת נתוני ההתאמה: {e}")
+            return []
+
+    def get_cached_ocr_result(self, image_hash, max_age):
+        """קבלת תוצאת OCR שמורה לפי גיבוב התמונה (אם לא פג תוקפה)"""
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT result FROM ocr_cache
+                    WHERE image_hash = %s AND created_at >= NOW() - %s * INTERVAL '1 second'
+                    """,
+                    (image_hash, max_age)
+                )
+                row = cur.fetchone()
+
+            return row[0] if row else None
+
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת תוצאת OCR מהמטמון: {e}")
+            return None
+
+    def save_cached_ocr_result(self, image_hash, result):
+        """שמירת תוצאת OCR במטמון הקבוע"""
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO ocr_cache (image_hash, result) VALUES (%s, %s)
+                    ON CONFLICT (image_hash) DO UPDATE
+                    SET result = EXCLUDED.result, created_at = CURRENT_TIMESTAMP
+                    """,
+                    (image_hash, Json(result))
+                )
+            return True
+
+        except Exception as e:
+            logger.error(f"שגיאה בשמירת תוצאת OCR במטמון: {e}")
+            return False
+
+    def clean_old_ocr_cache(self, max_age):
+        """מחיקת תוצאות OCR שפג תוקפן מהמטמון הקבוע"""
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    "DELETE FROM ocr_cache WHERE created_at < NOW() - %s * INTERVAL '1 second'",
+                    (max_age,)
+                )
+                deleted_count = cur.rowcount
+
+            logger.info(f"נוקו {deleted_count} תוצאות OCR ישנות מהמטמון")
+            return True
+
+        except Exception as e:
+            logger.error(f"שגיאה בניקוי מטמון OCR: {e}")
+            return False
+
+
+    def enqueue_update(self, update_id, payload):
+        """
+        שמירת עדכון מטלגרם בתור הקבוע
+
+        Returns:
+            bool: True אם העדכון נוסף, False אם כבר התקבל בעבר, None אם השמירה נכשלה
+        """
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO update_queue (update_id, payload) VALUES (%s, %s)
+                    ON CONFLICT (update_id) DO NOTHING
+                    RETURNING update_id
+                    """,
+                    (update_id, Json(payload))
+                )
+                return cur.fetchone() is not None
+
+        except Exception as e:
+            logger.error(f"שגיאה בשמירת עדכון בתור: {e}")
+            return None
+
+    def claim_updates(self, limit, stale_after):
+        """
+        תפיסת עדכונים ממתינים לעיבוד
+
+        עדכונים שנתפסו ולא הושלמו תוך stale_after שניות (למשל כי התהליך
+        נפל) נתפסים מחדש. SKIP LOCKED מאפשר לכמה צרכנים לעבוד במקביל.
+
+        Returns:
+            list: זוגות (update_id, payload) לפי סדר הגעתם
+        """
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE update_queue AS q
+                    SET status = 'processing', claimed_at = CURRENT_TIMESTAMP, attempts = q.attempts + 1
+                    FROM (
+                        SELECT update_id FROM update_queue
+                        WHERE status = 'pending'
+                           OR (status = 'processing' AND claimed_at < NOW() - %s * INTERVAL '1 second')
+                        ORDER BY update_id
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    ) AS claimed
+                    WHERE q.update_id = claimed.update_id
+                    RETURNING q.update_id, q.payload
+                    """,
+                    (stale_after, limit)
+                )
+                rows = cur.fetchall()
+
+            return sorted(rows, key=lambda row: row[0])
+
+        except Exception as e:
+            logger.error(f"שגיאה בתפיסת עדכונים מהתור: {e}")
+            return []
+
+    def complete_update(self, update_id):
+        """סימון עדכון כמעובד (הרשומה נשמרת לזיהוי כפילויות עד לניקוי)"""
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    "UPDATE update_queue SET status = 'done', processed_at = CURRENT_TIMESTAMP WHERE update_id = %s",
+                    (update_id,)
+                )
+            return True
+
+        except Exception as e:
+            logger.error(f"שגיאה בסימון עדכון כמעובד: {e}")
+            return False
+
+    def touch_updates(self, update_ids):
+        """חידוש זמן התפיסה של עדכונים שעדיין בטיפול (כדי שלא ייתפסו מחדש)"""
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE update_queue SET claimed_at = CURRENT_TIMESTAMP
+                    WHERE update_id = ANY(%s) AND status = 'processing'
+                    """,
+                    (list(update_ids),)
+                )
+            return True
+
+        except Exception as e:
+            logger.error(f"שגיאה בחידוש תפיסת עדכונים: {e}")
+            return False
+
+    def fail_update(self, update_id, max_attempts):
+        """החזרת עדכון שנכשל לתור, או סימונו ככושל לאחר max_attempts ניסיונות"""
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE update_queue
+                    SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+                        claimed_at = NULL
+                    WHERE update_id = %s
+                    RETURNING status
+                    """,
+                    (max_attempts, update_id)
+                )
+                row = cur.fetchone()
+
+            return row[0] if row else None
+
+        except Exception as e:
+            logger.error(f"שגיאה בהחזרת עדכון לתור: {e}")
+            return None
+
+    def clean_old_updates(self, hours=24):
+        """מחיקת עדכונים שעובדו או נכשלו לפני יותר מ-hours שעות"""
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    """
+                    DELETE FROM update_queue
+                    WHERE status IN ('done', 'failed') AND created_at < NOW() - %s * INTERVAL '1 hour'
+                    """,
+                    (hours,)
+                )
+                deleted_count = cur.rowcount
+
+            logger.info(f"נוקו {deleted_count} עדכונים ישנים מהתור")
+            return True
+
+        except Exception as e:
+            logger.error(f"שגיאה בניקוי תור העדכונים: {e}")
+            return False
+
+    def is_message_processed(self, chat_id, message_id):
+        """
+        בדיקה אם הודעה כבר עובדה
+
+        Returns:
+            bool: האם ההודעה רשומה כמעובדת, או None אם הבדיקה נכשלה
+        """
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    "SELECT 1 FROM processed_messages WHERE chat_id = %s AND message_id = %s",
+                    (chat_id, message_id)
+                )
+                return cur.fetchone() is not None
+
+        except Exception as e:
+            logger.error(f"שגיאה בבדיקת הודעה מעובדת: {e}")
+            return None
+
+    def mark_message_processed(self, chat_id, message_id):
+        """
+        רישום הודעה כמעובדת
+
+        Returns:
+            bool: True אם ההודעה נרשמה עכשיו, False אם כבר נרשמה, None אם הרישום נכשל
+        """
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO processed_messages (chat_id, message_id) VALUES (%s, %s)
+                    ON CONFLICT (chat_id, message_id) DO NOTHING
+                    RETURNING message_id
+                    """,
+                    (chat_id, message_id)
+                )
+                return cur.fetchone() is not None
+
+        except Exception as e:
+            logger.error(f"שגיאה ברישום הודעה כמעובדת: {e}")
+            return None
+
+    def clean_old_processed_messages(self, hours=48):
+        """מחיקת רישומי הודעות מעובדות מלפני יותר מ-hours שעות"""
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    "DELETE FROM processed_messages WHERE created_at < NOW() - %s * INTERVAL '1 hour'",
+                    (hours,)
+                )
+                deleted_count = cur.rowcount
+
+            logger.info(f"נוקו {deleted_count} רישומי הודעות מעובדות ישנים")
+            return True
+
+        except Exception as e:
+            logger.error(f"שגיאה בניקוי רישומי ההודעות המעובדות: {e}")
+            return False
+
+    def update_queue_stats(self):
+        """מספר העדכונים בתור לפי מצב"""
+        try:
+            with self._cursor() as cur:
+                cur.execute("SELECT status, COUNT(*) FROM update_queue GROUP BY status")
+                return dict(cur.fetchall())
+
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת נתוני תור העדכונים: {e}")
+            return {}
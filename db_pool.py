@@ -0,0 +1,224 @@
+import os
+import time
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import extensions
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+# חיבורים שתהליך עבודה ירש מתהליך האב. ההפניות נשמרות לכל חיי התהליך: חיבור
+# psycopg2 שנאסף נסגר (PQfinish), וסגירה הייתה שולחת הודעת סיום על ה-socket
+# המשותף ומנתקת את החיבור של תהליך האב
+_inherited_connections = []
+
+
+class PoolTimeout(Exception):
+    """חריגה הנזרקת כאשר לא התפנה חיבור במאגר בזמן שהוקצב"""
+
+
+class ConnectionPool:
+    """
+    מאגר חיבורים בטוח לתהליכונים (thread-safe) למסד נתונים PostgreSQL
+
+    החיבורים נפתחים בעצלות (בשימוש הראשון), נבדקים לפני כל השאלה
+    ונפתחים מחדש אם החיבור נסגר או שהשרת ניתק אותו.
+    """
+
+    def __init__(self, db_params, min_size=1, max_size=10, health_check_interval=30, timeout=30):
+        """
+        אתחול מאגר החיבורים
+
+        Args:
+            db_params: פרטי ההתחברות ל-psycopg2.connect
+            min_size: מספר החיבורים שנפתחים מראש
+            max_size: מספר החיבורים המרבי הפתוחים בו זמנית
+            health_check_interval: כמה שניות חיבור יכול להיות במנוחה לפני שנבדק מחדש
+            timeout: זמן המתנה מרבי (בשניות) לחיבור פנוי
+        """
+        self.db_params = db_params
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+
+        self._idle = deque()  # זוגות (חיבור, זמן שימוש אחרון)
+        self._size = 0  # מספר החיבורים הפתוחים (פנויים + בשימוש)
+        self._warmed_up = False
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+
+    def _connect(self):
+        """פתיחת חיבור חדש למסד הנתונים"""
+        return psycopg2.connect(**self.db_params)
+
+    def _warm_up(self):
+        """פתיחת מספר החיבורים המינימלי מראש"""
+        with self._cond:
+            if self._warmed_up:
+                return
+            self._warmed_up = True
+            missing = max(self.min_size - self._size, 0)
+            self._size += missing
+
+        for _ in range(missing):
+            try:
+                conn = self._connect()
+            except Exception as e:
+                logger.warning(f"לא ניתן לפתוח חיבור מראש למאגר: {e}")
+                self._release_slot()
+                continue
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def _is_healthy(self, conn, last_used):
+        """בדיקת תקינות חיבור לפני השאלתו"""
+        if conn.closed:
+            return False
+
+        if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+
+        # חיבור שהיה בשימוש ממש לאחרונה נחשב תקין ללא בדיקה נוספת
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close_quietly(self, conn):
+        """סגירת חיבור תוך התעלמות משגיאות"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _release_slot(self):
+        """שחרור מקום במאגר לאחר סגירת חיבור"""
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def reset_after_fork(self):
+        """
+        ניתוק המאגר מהחיבורים שנפתחו בתהליך האב (לאחר fork)
+
+        החיבורים הפנויים של תהליך האב מועברים ל-_inherited_connections ואינם
+        נסגרים או נאספים לעולם בתהליך הנוכחי, כך שהתהליך אינו שולח עליהם
+        דבר והחיבורים של תהליך האב נשארים תקינים. חיבורים שהיו מושאלים בזמן
+        ה-fork מוחזקים על ידי תהליכונים שלא עברו ל-fork ולכן גם הם אינם
+        משוחררים. התהליך הנוכחי פותח חיבורים משלו בעצלות.
+        """
+        # ללא נעילה: ייתכן שתהליכון שלא עבר ל-fork החזיק אותה ברגע ה-fork
+        _inherited_connections.extend(conn for conn, _ in self._idle)
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._size = 0
+        self._warmed_up = False
+        self._pid = os.getpid()
+
+    def _acquire(self):
+        """השאלת חיבור מהמאגר (ממתין אם כל החיבורים בשימוש)"""
+        if self._pid != os.getpid():
+            self.reset_after_fork()
+
+        if not self._warmed_up:
+            self._warm_up()
+
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"לא התפנה חיבור במאגר תוך {self.timeout} שניות")
+                self._cond.wait(remaining)
+
+        if conn is not None:
+            if self._is_healthy(conn, last_used):
+                return conn
+            logger.warning("נמצא חיבור לא תקין במאגר, פותח חיבור חדש")
+            self._close_quietly(conn)
+
+        try:
+            return self._connect()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _release(self, conn, discard=False):
+        """החזרת חיבור למאגר"""
+        if self._pid != os.getpid():
+            return
+
+        if discard or conn.closed or conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            self._close_quietly(conn)
+            self._release_slot()
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        השאלת חיבור מהמאגר כמנהל הקשר
+
+        בסיום תקין מתבצע commit, ובחריגה מתבצע rollback. חיבור שנכשל
+        ברמת הרשת נסגר ולא מוחזר למאגר.
+        """
+        conn = self._acquire()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException as e:
+            broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            raise
+        finally:
+            self._release(conn, discard=broken)
+
+    def close(self):
+        """סגירת כל החיבורים הפנויים (המאגר ייפתח מחדש בשימוש הבא)"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._warmed_up = False
+            self._cond.notify_all()
+
+        for conn, _ in idle:
+            self._close_quietly(conn)
+        logger.info(f"נסגרו {len(idle)} חיבורים פנויים במאגר")
+
+    def stats(self):
+        """נתוני שימוש במאגר"""
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                'size': self._size,
+                'idle': idle,
+                'in_use': self._size - idle,
+                'max_size': self.max_size
+            }
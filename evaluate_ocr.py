@@ -0,0 +1,135 @@
+"""
+הערכה לא מקוונת של השפעת הכנת התמונה (image_prep) על הזיהוי
+
+לכל תמונה בתיקייה נבנות גרסאות: המקור, וגרסה מוקטנת לכל ערך של
+--max-side. כל גרסה "נשלחת" לתחליף שמחזיר תשובות API מוקלטות לפי גיבוב
+התמונה, והתוצאה מושווה למספר המצופה. שם הקובץ מתחיל במספר המצופה
+(למשל 123_street.jpg), או שמצורף קובץ --labels של שם קובץ -> מספר.
+
+הקלטת תשובות (קריאה אמיתית ל-API עבור גרסאות שאין להן תשובה מוקלטת):
+    python evaluate_ocr.py samples/ --responses responses.json --record
+הרצה מול התשובות המוקלטות בלבד:
+    python evaluate_ocr.py samples/ --responses responses.json --max-side 1280 960 640
+"""
+
+import os
+import re
+import json
+import hashlib
+import argparse
+from image_prep import ImagePreprocessor
+from plate_matcher import PlateMatch
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+class RecordedOCR:
+    """
+    תחליף ל-OCRService שמחזיר תשובות מוקלטות לפי גיבוב SHA-256 של התמונה
+
+    אם הוגדר שירות אמיתי (live), תמונות ללא תשובה מוקלטת נשלחות אליו
+    והתשובה נשמרת להרצות הבאות.
+    """
+
+    def __init__(self, path, live=None):
+        self.path = path
+        self.live = live
+        self.responses = {}
+        self.missing = 0
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.responses = json.load(f)
+
+    def recognize_plate(self, image_bytes):
+        key = hashlib.sha256(image_bytes).hexdigest()
+        if key not in self.responses:
+            if self.live is None:
+                self.missing += 1
+                return None
+            self.responses[key] = self.live.recognize_plate(image_bytes)
+        return self.responses[key]
+
+    def save(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.responses, f, ensure_ascii=False, indent=2)
+
+
+def expected_number(filename, labels):
+    """המספר המצופה בתמונה: מקובץ התוויות, או מהספרות בתחילת שם הקובץ"""
+    if filename in labels:
+        return int(labels[filename])
+    found = re.match(r'(\d{1,3})(?!\d)', filename)
+    return int(found.group(1)) if found else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate OCR accuracy of downscaled uploads")
+    parser.add_argument('images', help="directory of sample images")
+    parser.add_argument('--responses', required=True, help="JSON file of recorded API responses")
+    parser.add_argument('--labels', help="JSON file mapping image filename to expected number")
+    parser.add_argument('--max-side', type=int, nargs='*', default=[1280, 960, 640])
+    parser.add_argument('--quality', type=int, default=85)
+    parser.add_argument('--min-confidence', type=float, default=0.0)
+    parser.add_argument('--record', action='store_true', help="call the real API for missing responses")
+    args = parser.parse_args()
+
+    labels = {}
+    if args.labels:
+        with open(args.labels, encoding='utf-8') as f:
+            labels = json.load(f)
+
+    live = None
+    if args.record:
+        from ocr_service import OCRService
+        live = OCRService()
+    ocr = RecordedOCR(args.responses, live=live)
+
+    variants = [('original', None)] + [
+        (f'max_side={max_side}', ImagePreprocessor(enabled=True, max_side=max_side, quality=args.quality))
+        for max_side in args.max_side
+    ]
+    totals = {name: {'images': 0, 'bytes': 0, 'hits': 0, 'confidence': 0.0} for name, _ in variants}
+
+    for filename in sorted(os.listdir(args.images)):
+        if not filename.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        number = expected_number(filename, labels)
+        if number is None:
+            print(f"Skipping {filename}: no expected number")
+            continue
+
+        with open(os.path.join(args.images, filename), 'rb') as f:
+            original = f.read()
+
+        for name, preprocessor in variants:
+            image_bytes = preprocessor.prepare(original) if preprocessor else original
+            match = PlateMatch.from_ocr_result(ocr.recognize_plate(image_bytes))
+            total = totals[name]
+            total['images'] += 1
+            total['bytes'] += len(image_bytes)
+            if match.matches(number, args.min_confidence):
+                total['hits'] += 1
+                total['confidence'] += match.confidence(number)
+
+    if args.record:
+        ocr.save()
+
+    baseline = totals['original']
+    print(f"{'variant':<16} {'images':>7} {'avg KB':>9} {'saved':>7} {'hit rate':>9} {'avg conf':>9}")
+    for name, _ in variants:
+        total = totals[name]
+        if not total['images']:
+            continue
+        saved = 1 - total['bytes'] / baseline['bytes'] if baseline['bytes'] else 0
+        hit_rate = total['hits'] / total['images']
+        avg_confidence = total['confidence'] / total['hits'] if total['hits'] else 0
+        print(
+            f"{name:<16} {total['images']:>7} {total['bytes'] / total['images'] / 1024:>9.1f} "
+            f"{saved:>7.1%} {hit_rate:>9.1%} {avg_confidence:>9.3f}"
+        )
+    if ocr.missing:
+        print(f"{ocr.missing} uploads had no recorded response (run with --record to capture them)")
+
+
+if __name__ == "__main__":
+    main()
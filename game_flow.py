@@ -0,0 +1,392 @@
+"""
+לוגיקת המשחק המשותפת לשני מצבי ההרצה (threaded ו-async)
+
+ההחלטות עצמן - בחירת המספר לתמונה, בדיקת ההתאמה וסימון המציאה (כולל
+מספרים נוספים), טקסטי התשובה, שמירת התמונות ופעולות המנהל - מתבצעות כאן
+בפונקציות סינכרוניות שאינן פונות לטלגרם. כל מצב הרצה מבצע רק את התקשורת
+עם טלגרם: bot_handlers קורא לפונקציות ישירות, ו-async_bot מריץ אותן
+במאגר התהליכונים של AsyncDBManager.
+"""
+
+import os
+import logging
+from bot_messages import (
+    GAME_OVER_TEXT, current_number_text, found_text, not_found_text, album_not_found_text,
+    already_found_text, admin_found_caption, admin_not_found_caption,
+    approved_text, rejected_text, approved_caption, rejected_caption,
+    game_markup, admin_markup
+)
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+class PhotoOutcome:
+    """
+    תוצאת הבדיקה של תמונה או אלבום מול המספר הנוכחי
+    """
+
+    def __init__(self, found, claimed, next_number, extra_numbers, credited, confidences, plate_numbers,
+                 text, markup=None, admin_caption=None, admin_markup=None):
+        """
+        Args:
+            found: האם המספר זוהה בביטחון מספיק
+            claimed: האם המציאה נרשמה (המספר עדיין היה הנוכחי)
+            next_number: המספר הנוכחי לאחר הפעולה
+            extra_numbers: המספרים הנוספים שסומנו מאותה תמונה
+            credited: אינדקס התמונה שהמציאה נזקפת לה
+            confidences: ביטחון הזיהוי של המספר בכל תמונה (None אם לא הופיע)
+            plate_numbers: כל הלוחיות שזוהו, ללא כפילויות
+            text: התשובה לקבוצה
+            markup: מקלדת המשחק לתשובה (רק למציאה כשהמשחק נמשך)
+            admin_caption: כיתוב התמונה למנהל (תמונה בודדת בלבד)
+            admin_markup: כפתור המנהל לתמונה (תמונה בודדת בלבד)
+        """
+        self.found = found
+        self.claimed = claimed
+        self.next_number = next_number
+        self.extra_numbers = extra_numbers
+        self.credited = credited
+        self.confidences = confidences
+        self.plate_numbers = plate_numbers
+        self.text = text
+        self.markup = markup
+        self.admin_caption = admin_caption
+        self.admin_markup = admin_markup
+
+
+class GameFlow:
+    """
+    מעברי המצב של המשחק ושמירת התמונות, ללא תקשורת עם טלגרם
+    """
+
+    def __init__(self, db, scheduler, image_store, storage_mode='disk', min_confidence=0.0,
+                 multi_find=False, review_mode='instant'):
+        """
+        Args:
+            db: מנהל מסד הנתונים
+            scheduler: מתזמן מעברי המצב לפי קבוצה (GroupScheduler)
+            image_store: מאגר התמונות בזיכרון (מצב אחסון memory)
+            storage_mode: 'disk' (תיקיית data) או 'memory'
+            min_confidence: ביטחון הזיהוי המינימלי לאישור אוטומטי
+            multi_find: האם לסמן גם מספרים נוספים שמופיעים באותה תמונה
+            review_mode: 'instant' (הודעה למנהל על כל תמונה) או 'digest' (סיכומים תקופתיים)
+        """
+        self.db = db
+        self.scheduler = scheduler
+        self.image_store = image_store
+        self.storage_mode = storage_mode
+        self.min_confidence = min_confidence
+        self.multi_find = multi_find
+        self.review_mode = review_mode
+
+    def game_markup(self, group_id, snapshot=None):
+        """
+        מקלדת אינליין למשחק
+
+        Args:
+            snapshot: תמונת מצב של הקבוצה מ-db.get_group_snapshot (אם כבר נשלפה)
+        """
+        if snapshot is None:
+            snapshot = self.db.get_group_snapshot(group_id)
+        return game_markup(snapshot)
+
+    def start_game(self, group_id):
+        """
+        בחירת מספר ראשון לחיפוש
+
+        Returns:
+            tuple: (המספר, מקלדת המשחק), או (None, None) אם כל המספרים נמצאו
+        """
+        with self.scheduler.serialized(group_id):
+            number = self.db.select_next_number(group_id)
+        if number is None:
+            return None, None
+        return number, self.game_markup(group_id)
+
+    def current_number(self, group_id):
+        """
+        המספר הנוכחי לחיפוש (נבחר מספר חדש אם אין)
+
+        Returns:
+            tuple: (המספר, מקלדת המשחק), או (None, None) אם כל המספרים נמצאו
+        """
+        with self.scheduler.serialized(group_id):
+            snapshot = self.db.get_group_snapshot(group_id)
+            number = snapshot['current_number']
+            if number is None:
+                number = self.db.select_next_number(group_id)
+                snapshot = None
+        if number is None:
+            return None, None
+        return number, self.game_markup(group_id, snapshot)
+
+    def number_for_photo(self, group_id):
+        """
+        המספר שמולו תיבדק תמונה חדשה
+
+        Returns:
+            tuple: (המספר הנוכחי, None), או (None, תשובה לקבוצה) אם לא היה מספר
+                   נוכחי - אז נבחר מספר חדש והתמונה אינה נבדקת
+        """
+        current_number = self.db.get_current_number(group_id)
+        if current_number is not None:
+            return current_number, None
+
+        # בדיקה חוזרת תחת המתזמן - ייתכן שתהליכון אחר כבר בחר
+        with self.scheduler.serialized(group_id):
+            current_number = self.db.get_current_number(group_id)
+            if current_number is None:
+                current_number = self.db.select_next_number(group_id)
+
+        if current_number is None:
+            return None, GAME_OVER_TEXT
+        return None, current_number_text(current_number)
+
+    def judge_photos(self, messages, current_number, matches):
+        """
+        בדיקת תמונה (או כל תמונות אלבום) מול המספר הנוכחי וסימון המציאה
+
+        המציאה נזקפת לתמונה שבה המספר זוהה בביטחון הגבוה ביותר. הבדיקה
+        החוזרת שהמספר עדיין נוכחי והסימון מתבצעים תחת המתזמן של הקבוצה,
+        כך שמתוך כמה תמונות של אותו מספר רק הראשונה מזוכה.
+
+        Args:
+            messages: הודעות התמונה (הראשונה היא זו שאליה נשלחות התשובות)
+            current_number: המספר הנוכחי בעת קבלת התמונה
+            matches: תוצאת ההתאמה (PlateMatch) של כל תמונה
+
+        Returns:
+            PhotoOutcome: תוצאת הבדיקה והתשובה לקבוצה
+        """
+        message = messages[0]
+        group_id = message.chat.id
+        first_name = message.from_user.first_name
+        single = len(messages) == 1
+
+        # כל הלוחיות שזוהו, ללא כפילויות
+        plate_numbers = list(dict.fromkeys(plate for match in matches for plate in match.plates))
+
+        # בדיקה אם המספר המבוקש נמצא בביטחון מספיק (כולל מועמדים חלופיים)
+        confidences = [match.confidence(current_number) for match in matches]
+        credited = max(range(len(matches)), key=lambda index: confidences[index] or -1.0)
+        found = matches[credited].matches(current_number, self.min_confidence)
+
+        # מספרים נוספים שעדיין לא נמצאו ומופיעים באחת התמונות
+        extra_numbers = []
+        if found and self.multi_find:
+            found_numbers, total = self.db.get_found_numbers(group_id)
+            extra_numbers = sorted({
+                number for match in matches
+                for number in match.covered(found_numbers, total, self.min_confidence)
+                if number != current_number
+            })
+
+        claimed = False
+        next_number = None
+        if found:
+            with self.scheduler.serialized(group_id):
+                claimed, next_number, extra_numbers = self.db.claim_numbers(
+                    group_id, current_number, extra_numbers, message.from_user.id
+                )
+
+        if claimed:
+            markup = self.game_markup(group_id) if next_number is not None else None
+            outcome = PhotoOutcome(
+                found, claimed, next_number, extra_numbers, credited, confidences, plate_numbers,
+                found_text(first_name, current_number, next_number, extra_numbers), markup
+            )
+            if single:
+                outcome.admin_caption = admin_found_caption(first_name, current_number, plate_numbers, extra_numbers)
+                outcome.admin_markup = admin_markup(True, message.message_id)
+            return outcome
+
+        logger.info(f"Plate numbers found: {plate_numbers}")
+        if found:
+            text = already_found_text(current_number, next_number)
+        elif single:
+            text = not_found_text(current_number, plate_numbers)
+        else:
+            text = album_not_found_text(current_number, len(messages), plate_numbers)
+        outcome = PhotoOutcome(found, claimed, next_number, [], credited, confidences, plate_numbers, text)
+        if single:
+            outcome.admin_caption = admin_not_found_caption(first_name, current_number, plate_numbers)
+            outcome.admin_markup = admin_markup(False, message.message_id)
+        return outcome
+
+    def store_image(self, message_id, image_bytes):
+        """
+        שמירת התמונה עד לטיפול המנהל
+
+        Returns:
+            str: נתיב הקובץ, או None אם התמונה נשמרה בזיכרון בלבד
+        """
+        if self.storage_mode == 'memory':
+            self.image_store.put(message_id, image_bytes)
+            return None
+
+        os.makedirs('data', exist_ok=True)
+        image_path = f"data/temp_{message_id}.jpg"
+        with open(image_path, 'wb') as new_file:
+            new_file.write(image_bytes)
+        return image_path
+
+    def load_stored_image(self, image_data):
+        """
+        תוכן התמונה ששמרה store_image (מהקובץ או מהזיכרון)
+
+        Returns:
+            bytes: תוכן התמונה, או None אם הקובץ נמחק או שהתמונה פונתה מהזיכרון
+        """
+        if image_data.get('image_path'):
+            try:
+                with open(image_data['image_path'], 'rb') as image_file:
+                    return image_file.read()
+            except OSError as e:
+                logger.warning(f"לא ניתן לקרוא את התמונה השמורה {image_data['image_path']}: {e}")
+                return None
+        return self.image_store.get(image_data['message_id'])
+
+    def remove_image_files(self, image_data):
+        """ניקוי קובץ התמונה או העותק בזיכרון לאחר טיפול המנהל"""
+        if image_data['image_path'] and os.path.exists(image_data['image_path']):
+            os.remove(image_data['image_path'])
+        self.image_store.pop(image_data['message_id'])
+
+    def persist_photo(self, message, current_number, file_id, image_bytes, outcome, preprocessed=False):
+        """
+        שמירת תמונה בודדת ונתוני הזיהוי שלה
+
+        Returns:
+            dict: נתוני התמונה השמורה (message_id, image_path) לשליחה מיידית
+                  למנהל, או None במצב סיכומים (התמונה ממתינה לסיכום הבא)
+        """
+        image_path = self.store_image(message.message_id, image_bytes)
+        self.db.save_temp_image(
+            message_id=message.message_id,
+            image_path=image_path,
+            user_id=message.from_user.id,
+            username=message.from_user.first_name,
+            current_number=current_number,
+            group_id=message.chat.id,
+            plate_numbers=outcome.plate_numbers,
+            file_id=file_id,
+            auto_found=outcome.claimed,
+            extra_numbers=outcome.extra_numbers
+        )
+        self.db.record_match_outcome(
+            message.message_id, message.chat.id, current_number, outcome.confidences[0], self.min_confidence,
+            outcome.claimed, preprocessed=preprocessed
+        )
+        if self.review_mode == 'digest':
+            return None
+        return {'message_id': message.message_id, 'image_path': image_path}
+
+    def persist_album(self, messages, current_number, downloads, matches, outcome, preprocessed=False):
+        """
+        שמירת תמונות האלבום ונתוני הזיהוי בטרנזקציה אחת
+
+        Args:
+            downloads: זוגות (file_id, תוכן התמונה) לפי סדר האלבום
+            matches: תוצאת ההתאמה של כל תמונה
+
+        Returns:
+            tuple: (מזהה סיכום, התמונות) לשליחה מיידית למנהל, או (None, []) במצב
+                   סיכומים או בשגיאה
+        """
+        images = []
+        for index, (message, (file_id, image_bytes), match) in enumerate(zip(messages, downloads, matches)):
+            auto_found = outcome.claimed and index == outcome.credited
+            images.append({
+                'message_id': message.message_id,
+                'image_path': self.store_image(message.message_id, image_bytes),
+                'user_id': message.from_user.id,
+                'username': message.from_user.first_name,
+                'group_id': message.chat.id,
+                'current_number': current_number,
+                'plate_numbers': match.plates,
+                'file_id': file_id,
+                'auto_found': auto_found,
+                'extra_numbers': outcome.extra_numbers if auto_found else [],
+                'confidence': outcome.confidences[index]
+            })
+        return self.db.save_album_images(
+            images, self.min_confidence, preprocessed=preprocessed, create_digest=self.review_mode != 'digest'
+        )
+
+    def apply_admin_action(self, action, message_id):
+        """
+        אישור או פסילה של תמונה בודדת על ידי המנהל
+
+        Returns:
+            dict: group_id, text ו-markup של ההודעה לקבוצה, caption לעדכון הודעת
+                  המנהל, digest_id ו-remaining (התמונות שנותרו בסיכום) אם התמונה
+                  מסיכום - או None אם נתוני התמונה כבר אינם זמינים
+        """
+        image_data = self.db.get_temp_image(message_id)
+        if not image_data:
+            return None
+
+        group_id = image_data['group_id']
+        current_number = image_data['current_number']
+        username = image_data['username']
+
+        if action == 'approve':
+            # אישור מציאה שלא זוהתה אוטומטית: סימון המספר כנמצא ובחירת מספר חדש
+            with self.scheduler.serialized(group_id):
+                next_number = self.db.mark_number_as_found(group_id, current_number, image_data['user_id'])
+            self.db.set_match_review(group_id, message_id, 'approved')
+            result = {
+                'text': approved_text(username, current_number, next_number),
+                'markup': self.game_markup(group_id) if next_number is not None else None,
+                'caption': approved_caption(username, current_number)
+            }
+        else:
+            # פסילת מציאה שאושרה אוטומטית: החזרת המספר למאגר
+            with self.scheduler.serialized(group_id):
+                self.db.revert_found_number(group_id, current_number, image_data.get('extra_numbers') or [])
+            self.db.set_match_review(group_id, message_id, 'overturned')
+            result = {
+                'text': rejected_text(username, current_number),
+                'markup': self.game_markup(group_id),
+                'caption': rejected_caption(username, current_number)
+            }
+
+        # ניקוי נתוני התמונה
+        self.remove_image_files(image_data)
+        self.db.delete_temp_image(message_id)
+
+        digest_id = image_data.get('digest_id')
+        result.update({
+            'group_id': group_id,
+            'digest_id': digest_id,
+            'remaining': self.db.get_digest_items(digest_id) if digest_id is not None else []
+        })
+        return result
+
+    def apply_digest_action(self, digest_id, action):
+        """
+        אישור או פסילה של כל התמונות שנותרו בסיכום
+
+        Returns:
+            tuple: (התמונות שטופלו, ההודעות לקבוצות - מילונים עם group_id, text
+                   ו-markup), או (התמונות, None) אם הפעולה נכשלה
+        """
+        items, changes = self.db.apply_digest_action(digest_id, action)
+        if changes is None:
+            return items, None
+
+        notifications = []
+        for change in changes:
+            group_id = change['group_id']
+            if action == 'approve':
+                text = approved_text(change['username'], change['number'], change['next_number'])
+                markup = self.game_markup(group_id) if change['next_number'] is not None else None
+            else:
+                text = rejected_text(change['username'], change['number'])
+                markup = self.game_markup(group_id)
+            notifications.append({'group_id': group_id, 'text': text, 'markup': markup})
+
+        for item in items:
+            self.remove_image_files(item)
+        return items, notifications
@@ -0,0 +1,136 @@
+import threading
+import logging
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+class GroupState:
+    """
+    מצב המשחק של קבוצה בזיכרון: המספר הנוכחי וקבוצת המספרים שנמצאו
+    """
+
+    def __init__(self, group_id, current_number, found_numbers, total):
+        self.group_id = group_id
+        self.current_number = current_number
+        self.found_numbers = set(found_numbers)
+        self.total = total
+
+    @property
+    def found_count(self):
+        """מספר המספרים שנמצאו"""
+        return len(self.found_numbers)
+
+    @property
+    def remaining(self):
+        """מספר המספרים שנותרו לחיפוש"""
+        return self.total - self.found_count
+
+    def set_current(self, number):
+        """עדכון המספר הנוכחי"""
+        self.current_number = number
+
+    def mark_found(self, number, next_number):
+        """סימון מספר כנמצא ומעבר למספר הבא"""
+        self.found_numbers.add(number)
+        self.current_number = next_number
+
+    def add_found(self, numbers):
+        """סימון מספרים נוספים כנמצאו (בלי לשנות את המספר הנוכחי)"""
+        self.found_numbers.update(numbers)
+
+    def remove_found(self, numbers):
+        """החזרת מספרים נוספים למאגר (בלי לשנות את המספר הנוכחי)"""
+        self.found_numbers.difference_update(numbers)
+
+    def revert(self, number):
+        """החזרת מספר למאגר כמספר הנוכחי"""
+        self.found_numbers.discard(number)
+        self.current_number = number
+
+    def to_stats(self):
+        """סטטיסטיקות המשחק במבנה של DBManager.get_stats"""
+        found = self.found_count
+        return {
+            'total': self.total,
+            'found': found,
+            'remaining': self.total - found,
+            'percentage': round((found / self.total) * 100, 2) if self.total > 0 else 0
+        }
+
+
+class GameStateCache:
+    """
+    מטמון מצב המשחק של כל הקבוצות
+
+    המצב נטען פעם אחת מטבלת numbers באמצעות הפונקציה loader, ומתעדכן
+    (write-through) בכל כתיבה של DBManager. כתיבות וטעינות של אותה קבוצה
+    מתבצעות תחת נעילת הקבוצה (group_lock) כדי שהמטמון לא יקבל סדר עדכונים
+    שונה ממסד הנתונים. כאשר המטמון כבוי, כל קריאה טוענת את המצב מחדש.
+    """
+
+    def __init__(self, loader, enabled=True):
+        """
+        Args:
+            loader: פונקציה המקבלת group_id ומחזירה GroupState טרי ממסד הנתונים
+            enabled: האם לשמור את המצב בזיכרון
+        """
+        self.loader = loader
+        self.enabled = enabled
+        self._states = {}
+        self._group_locks = {}
+        self._lock = threading.Lock()
+
+    def group_lock(self, group_id):
+        """נעילה של קבוצה, לשימוש סביב כתיבה למסד הנתונים ועדכון המטמון"""
+        with self._lock:
+            lock = self._group_locks.get(group_id)
+            if lock is None:
+                lock = self._group_locks[group_id] = threading.RLock()
+            return lock
+
+    def get(self, group_id):
+        """קבלת מצב הקבוצה (טעינה ממסד הנתונים אם אינו במטמון)"""
+        if not self.enabled:
+            return self.loader(group_id)
+
+        state = self._states.get(group_id)
+        if state is not None:
+            return state
+
+        with self.group_lock(group_id):
+            # ייתכן שתהליכון אחר טען את המצב בזמן שהמתנו לנעילה
+            state = self._states.get(group_id)
+            if state is None:
+                state = self.loader(group_id)
+                self._states[group_id] = state
+            return state
+
+    def update(self, group_id, action, *args):
+        """
+        עדכון מצב קבוצה שכבר נטען (write-through)
+
+        Args:
+            group_id: מזהה הקבוצה
+            action: שם המתודה של GroupState להפעלה (למשל 'mark_found')
+        """
+        if not self.enabled:
+            return
+        with self.group_lock(group_id):
+            state = self._states.get(group_id)
+            if state is not None:
+                getattr(state, action)(*args)
+
+    def invalidate(self, group_id=None):
+        """מחיקת מצב קבוצה מהמטמון (או של כל הקבוצות אם לא צוינה קבוצה)"""
+        if group_id is None:
+            with self._lock:
+                self._states.clear()
+        else:
+            with self.group_lock(group_id):
+                self._states.pop(group_id, None)
+        logger.info(f"מטמון מצב המשחק נוקה עבור {'כל הקבוצות' if group_id is None else f'הקבוצה {group_id}'}")
+
+    def stats(self):
+        """נתוני שימוש במטמון"""
+        return {'enabled': self.enabled, 'groups': len(self._states)}
@@ -0,0 +1,72 @@
+import time
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+class GroupScheduler:
+    """
+    תזמון מעברי מצב לפי קבוצה: אחד בכל פעם ולפי סדר ההגעה
+
+    כל קבוצה מקבלת תור המתנה משלה, כך שמעברי המצב של קבוצה אחת (בדיקת
+    המספר הנוכחי, סימון מציאה ובחירת המספר הבא) מתבצעים זה אחר זה,
+    בעוד שקבוצות שונות רצות במקביל לגמרי. התור של קבוצה נמחק כשהוא מתרוקן.
+
+    הנעילה אינה חוזרת (non-reentrant): אין לקרוא ל-serialized מתוך בלוק
+    serialized של אותה קבוצה.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues = {}  # group_id -> תור של אירועי המתנה (הראשון מחזיק בנעילה)
+        self._counters = {'runs': 0, 'contended': 0}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @contextmanager
+    def serialized(self, group_id):
+        """הרצת בלוק כשהוא היחיד שרץ עבור הקבוצה (בסדר ההגעה)"""
+        ticket = threading.Event()
+        with self._lock:
+            waiting = self._queues.setdefault(group_id, deque())
+            waiting.append(ticket)
+            contended = len(waiting) > 1
+            if not contended:
+                ticket.set()
+
+        started = time.monotonic()
+        ticket.wait()
+        wait = time.monotonic() - started
+
+        with self._lock:
+            self._counters['runs'] += 1
+            if contended:
+                self._counters['contended'] += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                waiting.popleft()
+                if waiting:
+                    waiting[0].set()
+                else:
+                    del self._queues[group_id]
+
+    def stats(self):
+        """מדדי התזמון: קבוצות פעילות, המתנות וזמני המתנה"""
+        with self._lock:
+            runs = self._counters['runs']
+            return {
+                'active_groups': len(self._queues),
+                'waiting': sum(len(waiting) - 1 for waiting in self._queues.values()),
+                **self._counters,
+                'avg_wait': round(self._wait_total / runs, 4) if runs else 0,
+                'max_wait': round(self._wait_max, 4)
+            }
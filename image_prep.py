@@ -0,0 +1,113 @@
+import io
+import threading
+import logging
+
+# Pillow נדרש רק להקטנה ולדחיסה מחדש של התמונה
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+class ImagePreprocessor:
+    """
+    הכנת תמונה לפני שליחתה לזיהוי הלוחיות
+
+    במקום להוריד תמיד את הגודל הגדול ביותר של התמונה מטלגרם, נבחר הגודל
+    הקטן ביותר שצלעו הקצרה היא לפחות min_side. אם Pillow מותקן, תמונה
+    שצלעה הארוכה גדולה מ-max_side מוקטנת ונדחסת מחדש ל-JPEG. התוצאה
+    המעובדת נשלחת רק אם היא קטנה מהמקור.
+    """
+
+    def __init__(self, enabled=False, min_side=720, max_side=1280, quality=85):
+        """
+        Args:
+            enabled: האם לבחור גודל קטן יותר ולעבד את התמונה (אחרת - הגודל הגדול ביותר כפי שהוא)
+            min_side: אורך הצלע הקצרה המינימלי (פיקסלים) של הגודל שנבחר מטלגרם
+            max_side: אורך הצלע הארוכה המרבי (פיקסלים) לאחר הקטנה
+            quality: איכות הדחיסה מחדש ל-JPEG (1-95)
+        """
+        self.enabled = enabled
+        self.min_side = min_side
+        self.max_side = max_side
+        self.quality = quality
+
+        if enabled and Image is None:
+            logger.warning("Pillow אינו מותקן - התמונות יישלחו בגודל שנבחר ללא הקטנה ודחיסה מחדש")
+
+        self._lock = threading.Lock()
+        self._counters = {
+            'images': 0, 'smaller_size': 0, 'download_bytes_saved': 0,
+            'recompressed': 0, 'bytes_in': 0, 'bytes_out': 0
+        }
+
+    def select_size(self, photo_sizes):
+        """
+        בחירת גודל התמונה להורדה מתוך הגדלים שטלגרם שולח (מהקטן לגדול)
+
+        Returns:
+            PhotoSize: הגודל הקטן ביותר שעומד ברזולוציה המינימלית, או הגדול ביותר
+        """
+        if not self.enabled:
+            return photo_sizes[-1]
+
+        for photo_size in photo_sizes:
+            if min(photo_size.width, photo_size.height) >= self.min_side:
+                if photo_size is not photo_sizes[-1]:
+                    saved = (photo_sizes[-1].file_size or 0) - (photo_size.file_size or 0)
+                    with self._lock:
+                        self._counters['smaller_size'] += 1
+                        self._counters['download_bytes_saved'] += max(saved, 0)
+                return photo_size
+        return photo_sizes[-1]
+
+    def prepare(self, image_bytes):
+        """
+        הקטנה ודחיסה מחדש של התמונה לפני השליחה
+
+        Returns:
+            bytes: התמונה לשליחה (המקור אם העיבוד כבוי, נכשל או לא הקטין אותה)
+        """
+        prepared = image_bytes
+        if self.enabled and Image is not None:
+            prepared = self._recompress(image_bytes)
+
+        with self._lock:
+            self._counters['images'] += 1
+            self._counters['bytes_in'] += len(image_bytes)
+            self._counters['bytes_out'] += len(prepared)
+            if prepared is not image_bytes:
+                self._counters['recompressed'] += 1
+
+        if prepared is not image_bytes:
+            logger.info(f"התמונה הוקטנה לפני הזיהוי: {len(image_bytes)} -> {len(prepared)} בתים")
+        return prepared
+
+    def _recompress(self, image_bytes):
+        try:
+            with Image.open(io.BytesIO(image_bytes)) as image:
+                if max(image.size) <= self.max_side and image.format == 'JPEG':
+                    return image_bytes
+
+                image = image.convert('RGB')
+                image.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+                output = io.BytesIO()
+                image.save(output, format='JPEG', quality=self.quality, optimize=True)
+        except Exception as e:
+            logger.warning(f"לא ניתן לעבד את התמונה לפני הזיהוי: {e}")
+            return image_bytes
+
+        prepared = output.getvalue()
+        return prepared if len(prepared) < len(image_bytes) else image_bytes
+
+    def stats(self):
+        """מוני העיבוד: תמונות, גדלים קטנים שנבחרו ובתים שנחסכו בהורדה ובשליחה"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                **self._counters,
+                'upload_bytes_saved': self._counters['bytes_in'] - self._counters['bytes_out']
+            }
@@ -0,0 +1,64 @@
+import threading
+import logging
+from collections import OrderedDict
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+class ImageStore:
+    """
+    מאגר תמונות בזיכרון, חסום לפי נפח כולל
+
+    משמש במצב ללא דיסק לשמירת התמונות עד שהמנהל מטפל בהן. כשהנפח
+    עובר את המגבלה, התמונות הישנות ביותר מפונות.
+    """
+
+    def __init__(self, max_bytes=50 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: הנפח הכולל המרבי של התמונות בזיכרון
+        """
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()  # מזהה -> תוכן התמונה
+        self._total_bytes = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def put(self, key, image_bytes):
+        """שמירת תמונה ופינוי הישנות ביותר אם עברנו את המגבלה"""
+        with self._lock:
+            previous = self._images.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= len(previous)
+
+            self._images[key] = image_bytes
+            self._total_bytes += len(image_bytes)
+
+            while self._total_bytes > self.max_bytes and len(self._images) > 1:
+                _, evicted = self._images.popitem(last=False)
+                self._total_bytes -= len(evicted)
+                self._evictions += 1
+
+    def get(self, key):
+        """קבלת תמונה (או None אם פונתה)"""
+        with self._lock:
+            return self._images.get(key)
+
+    def pop(self, key):
+        """הוצאת תמונה מהמאגר"""
+        with self._lock:
+            image_bytes = self._images.pop(key, None)
+            if image_bytes is not None:
+                self._total_bytes -= len(image_bytes)
+            return image_bytes
+
+    def stats(self):
+        """נתוני שימוש במאגר"""
+        with self._lock:
+            return {
+                'images': len(self._images),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self._evictions
+            }
@@ -3,10 +3,21 @@ import time
 import threading
 import requests
 import logging
-from flask import Flask
+from flask import Flask, jsonify
 import telebot
-from config import IS_RENDER, PORT, WEBHOOK_URL, TELEGRAM_TOKEN, print_config_info
-from bot_handlers import bot, test_bot, db
+from config import (
+    IS_RENDER, PORT, WEBHOOK_URL, TELEGRAM_TOKEN, OCR_CACHE_PERSISTENT, OCR_CACHE_TTL,
+    IMAGE_STORAGE_MODE, BOT_RUNTIME, WEB_SERVER, WEBHOOK_QUEUE_ENABLED, WEBHOOK_SECRET_TOKEN,
+    UPDATE_QUEUE_RETENTION_HOURS, PROCESSED_MESSAGES_RETENTION_HOURS, print_config_info
+)
+
+# במצב async הבוט, השירותים ושרת ה-webhook מוגדרים ב-async_bot
+if BOT_RUNTIME == 'async':
+    import async_bot
+else:
+    from bot_handlers import (
+        bot, test_bot, db, collect_metrics, update_queue, update_dedup, start_background_services
+    )
 
 # הגדרת לוגר
 logger = logging.getLogger(__name__)
@@ -23,18 +34,49 @@ def index():
     """עמוד הבית של השירות"""
     return "בוט צייד לוחיות רישוי פעיל!"
 
+@app.route('/metrics')
+def metrics():
+    """מדדי ביצועים של הבוט (מאגר חיבורים, מטמונים)"""
+    return jsonify(collect_metrics())
+
 @app.route('/' + TELEGRAM_TOKEN, methods=['POST'])
 def webhook():
     """נקודת קצה לקבלת עדכונים מטלגרם במצב webhook"""
+    from flask import request
+    
+    # אימות שהבקשה הגיעה מטלגרם
+    if WEBHOOK_SECRET_TOKEN and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET_TOKEN:
+        logger.warning("התקבלה בקשת webhook עם טוקן סודי שגוי")
+        return 'forbidden', 403
+    
+    if WEBHOOK_QUEUE_ENABLED:
+        return enqueue_webhook_update(request)
+    
     try:
-        from flask import request
         update = telebot.types.Update.de_json(request.stream.read().decode('utf-8'))
+        
+        # עדכון שטלגרם שלח שוב (ה-webhook לא ענה בזמן) - כבר בטיפול
+        if update_dedup is not None and not update_dedup.first_update(update.update_id):
+            return ''
+        
         bot.process_new_updates([update])
         return ''
     except Exception as e:
         logger.error(f"שגיאה בטיפול בעדכון: {e}")
         return 'error'
 
+def enqueue_webhook_update(request):
+    """שמירת העדכון בתור הקבוע והחזרת תשובה מיידית לטלגרם"""
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('update_id'), int):
+        logger.warning("התקבל עדכון לא תקין ב-webhook")
+        return 'bad request', 400
+    
+    # אם השמירה נכשלה, טלגרם ישלח את העדכון שוב
+    if not update_queue.enqueue(payload):
+        return 'error', 500
+    return ''
+
 # מנגנון שמירה על עירנות לסביבת Render
 def setup_keep_alive(app_url=None):
     """
@@ -75,11 +117,21 @@ def main():
     
     logger.info("הבוט מופעל...")
     
+    if BOT_RUNTIME == 'async':
+        async_bot.run()
+        return
+    
     # וידוא שתיקיית הנתונים קיימת
-    os.makedirs('data', exist_ok=True)
+    if IMAGE_STORAGE_MODE != 'memory':
+        os.makedirs('data', exist_ok=True)
     
     # ניקוי תמונות זמניות ישנות
     db.clean_old_temp_images(hours=24)
+    if WEBHOOK_QUEUE_ENABLED:
+        db.clean_old_updates(hours=UPDATE_QUEUE_RETENTION_HOURS)
+    db.clean_old_processed_messages(hours=PROCESSED_MESSAGES_RETENTION_HOURS)
+    if OCR_CACHE_PERSISTENT:
+        db.clean_old_ocr_cache(OCR_CACHE_TTL)
     
     # בדיקת סטטוס הבוט
     status_ok, status_info = test_bot()
@@ -110,14 +162,20 @@ def main():
             # הסרת webhook קיים והגדרת webhook חדש
             bot.remove_webhook()
             time.sleep(1)
-            bot.set_webhook(url=webhook_url)
+            bot.set_webhook(url=webhook_url, secret_token=WEBHOOK_SECRET_TOKEN)
             
             # הפעלת שרת
             logger.info(f"מפעיל שרת על פורט {PORT}")
-            app.run(host='0.0.0.0', port=PORT, debug=False)
+            if WEB_SERVER == 'gunicorn':
+                from server import run_server
+                run_server(app)
+            else:
+                start_background_services()
+                app.run(host='0.0.0.0', port=PORT, debug=False)
         else:
             # הפעלה במצב polling (מקומי)
             logger.info("מפעיל במצב polling מקומי")
+            start_background_services()
             bot.remove_webhook()
             time.sleep(1)
             bot.infinity_polling(timeout=60, long_polling_timeout=60)
@@ -0,0 +1,81 @@
+"""
+פעולות על מפת סיביות (bitmap) של מאגר המספרים של קבוצה
+
+כל מספר במאגר מיוצג בסיבית אחת: 1 = נמצא, 0 = עדיין לא נמצא.
+מאגר של 1000 מספרים נשמר כך ב-125 בתים בלבד.
+"""
+
+import random
+
+
+def bitmap_size(total):
+    """מספר הבתים הדרוש למפת סיביות של total מספרים"""
+    return (total + 7) // 8
+
+
+def empty_bitmap(total):
+    """מפת סיביות שבה אף מספר עדיין לא נמצא"""
+    return bytes(bitmap_size(total))
+
+
+def is_set(bitmap, number):
+    """האם המספר מסומן כנמצא"""
+    return bool(bitmap[number >> 3] & (1 << (number & 7)))
+
+
+def set_bit(bitmap, number):
+    """סימון מספר כנמצא (מחזיר מפה חדשה)"""
+    data = bytearray(bitmap)
+    data[number >> 3] |= 1 << (number & 7)
+    return bytes(data)
+
+
+def clear_bit(bitmap, number):
+    """החזרת מספר למאגר (מחזיר מפה חדשה)"""
+    data = bytearray(bitmap)
+    data[number >> 3] &= ~(1 << (number & 7)) & 0xFF
+    return bytes(data)
+
+
+def count_set(bitmap):
+    """מספר המספרים שנמצאו"""
+    return bin(int.from_bytes(bitmap, 'little')).count('1')
+
+
+def from_numbers(numbers, total):
+    """בניית מפת סיביות מרשימת מספרים שנמצאו"""
+    value = 0
+    for number in numbers:
+        value |= 1 << number
+    return value.to_bytes(bitmap_size(total), 'little')
+
+
+def to_numbers(bitmap):
+    """רשימת המספרים המסומנים כנמצאו"""
+    value = int.from_bytes(bitmap, 'little')
+    numbers = []
+    while value:
+        lowest = value & -value
+        numbers.append(lowest.bit_length() - 1)
+        value ^= lowest
+    return numbers
+
+
+def random_unset(bitmap, total):
+    """
+    בחירת מספר אקראי שעדיין לא נמצא
+
+    Returns:
+        int: מספר אקראי מבין המספרים שלא נמצאו, או None אם כולם נמצאו
+    """
+    # הסיביות הפנויות מתקבלות מהיפוך המפה, מוגבל ל-total הסיביות הראשונות
+    free = ~int.from_bytes(bitmap, 'little') & ((1 << total) - 1)
+    remaining = bin(free).count('1')
+    if remaining == 0:
+        return None
+
+    # דילוג על index סיביות פנויות ובחירת הבאה בתור
+    index = random.randrange(remaining)
+    for _ in range(index):
+        free &= free - 1
+    return (free & -free).bit_length() - 1
@@ -0,0 +1,393 @@
+"""
+מנועי זיהוי לוחיות רישוי עבור OCRService
+
+כל מנוע מקבל תוכן תמונה ומחזיר תשובה במבנה של PlateRecognizer
+({'results': [{'plate', 'score', 'candidates'}]}), כך שהחילוץ וההתאמה
+(plate_matcher) משותפים לכולם:
+
+- cloud: PlateRecognizer API
+- local: Tesseract על המעבד בלבד (ללא GPU), דרך pytesseract ו-Pillow
+- cascade: המנוע המקומי קודם, ופנייה לענן רק כשהביטחון נמוך
+"""
+
+import io
+import re
+import time
+import random
+import threading
+import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from plate_matcher import PlateMatch, WINDOW_SIZE
+
+# pytesseract ו-Pillow נדרשים רק למנוע המקומי
+try:
+    import pytesseract
+    from PIL import Image, ImageOps
+except ImportError:
+    pytesseract = None
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+# סטטוסים שעליהם מתבצע ניסיון חוזר
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class OCRBackendError(Exception):
+    """
+    כשל בקריאה למנוע זיהוי
+
+    transient: האם הכשל זמני בצד השירות (5xx, 429, כשל רשת) - רק כשלים
+    כאלה נספרים במפסק הזרם ומצדיקים ניסיון חוזר.
+    """
+
+    def __init__(self, message, status=None, transient=True):
+        super().__init__(message)
+        self.status = status
+        self.transient = transient
+
+
+class OCRUnavailableError(OCRBackendError):
+    """
+    שירות הזיהוי אינו זמין כרגע, והתמונה צריכה להמתין לניסיון חוזר
+
+    fail_fast: הקריאה נחסמה בלי לפנות לשירות (המפסק פתוח)
+    """
+
+    def __init__(self, message, fail_fast=False):
+        super().__init__(message)
+        self.fail_fast = fail_fast
+
+
+def is_transient(error):
+    """האם הכשל זמני בצד השירות (שגיאת שרת, הגבלת קצב או כשל רשת)"""
+    transient = getattr(error, 'transient', None)
+    if transient is not None:
+        return transient
+    return isinstance(error, requests.RequestException)
+
+
+def best_score(ocr_result):
+    """ציון הביטחון הגבוה ביותר בתשובה (0 אם אין תוצאות)"""
+    if not ocr_result or not ocr_result.get('results'):
+        return 0.0
+    return max(result.get('score', 0.0) for result in ocr_result['results'])
+
+
+class BackendMetrics:
+    """מוני קריאות, כשלים וזמני תגובה של מנוע זיהוי"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._failures = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    @contextmanager
+    def measure(self):
+        """מדידת קריאה אחת למנוע"""
+        started = time.monotonic()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.record(time.monotonic() - started, failed)
+
+    def record(self, latency, failed=False):
+        with self._lock:
+            self._calls += 1
+            self._failures += failed
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': self._calls,
+                'failures': self._failures,
+                'avg_latency': round(self._latency_total / self._calls, 3) if self._calls else 0,
+                'max_latency': round(self._latency_max, 3)
+            }
+
+
+class OCRBackend:
+    """
+    ממשק מנוע זיהוי: recognize מחזיר תשובה במבנה של PlateRecognizer או None
+    """
+
+    name = None
+
+    def __init__(self):
+        self.metrics = BackendMetrics()
+
+    def recognize(self, image_bytes):
+        """זיהוי הלוחיות בתמונה, עם מדידת זמן התגובה"""
+        with self.metrics.measure():
+            return self._recognize(image_bytes)
+
+    def _recognize(self, image_bytes):
+        raise NotImplementedError
+
+    def stats(self):
+        """מדדי המנוע"""
+        return {self.name: self.metrics.stats()}
+
+
+class CloudBackend(OCRBackend):
+    """
+    זיהוי באמצעות PlateRecognizer API
+    """
+
+    name = 'cloud'
+
+    def __init__(self, token, api_url, regions, timeout, max_retries=3, retry_backoff=0.5, pool_size=10):
+        """
+        Args:
+            token: אסימון ה-API
+            api_url: כתובת ה-API
+            regions: אזורי הלוחיות לזיהוי
+            timeout: זמן המתנה (התחברות, קריאה) בשניות
+            max_retries: מספר הניסיונות החוזרים על שגיאות 429/5xx וכשלי התחברות
+            retry_backoff: מקדם המתנה בין ניסיונות חוזרים
+            pool_size: חיבורים פתוחים מרביים ל-API
+        """
+        super().__init__()
+        self.token = token
+        self.api_url = api_url
+        self.regions = regions
+        self.timeout = timeout
+        self.session = self._create_session(max_retries, retry_backoff, pool_size)
+
+    def _create_session(self, max_retries, retry_backoff, pool_size):
+        """
+        יצירת סשן HTTP קבוע עם חיבורי keep-alive וניסיונות חוזרים
+
+        הניסיונות החוזרים מתבצעים עם המתנה הולכת וגדלה על שגיאות 429/5xx
+        ועל כשלי התחברות, ומכבדים את הכותרת Retry-After.
+        """
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=retry_backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['POST']),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=pool_size)
+
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({'Authorization': f'Token {self.token}'})
+        return session
+
+    def _recognize(self, image_bytes):
+        response = self.session.post(
+            self.api_url,
+            data=dict(regions=self.regions),
+            files=dict(upload=('image.jpg', image_bytes)),
+            timeout=self.timeout
+        )
+
+        # בדיקת תקינות התגובה
+        if response.status_code in (200, 201):
+            return response.json()
+        raise OCRBackendError(
+            f"שגיאה מ-API זיהוי הלוחיות: סטטוס {response.status_code}",
+            status=response.status_code,
+            transient=response.status_code in RETRY_STATUSES
+        )
+
+
+class TesseractBackend(OCRBackend):
+    """
+    זיהוי מקומי באמצעות Tesseract (מעבד בלבד, ללא GPU)
+
+    התמונה מומרת לגווני אפור עם מתיחת ניגודיות, ו-Tesseract מחפש ספרות
+    בלבד בטקסט מפוזר. המילים בכל שורה מחוברות ללוחית אחת, והמילים עצמן
+    נשמרות כמועמדים חלופיים. הביטחון של Tesseract (0-100) מומר לטווח 0-1.
+    """
+
+    name = 'local'
+
+    # טקסט מפוזר (psm 11) וספרות בלבד
+    TESSERACT_CONFIG = '--psm 11 -c tessedit_char_whitelist=0123456789'
+
+    def __init__(self, timeout=10, min_side=1000):
+        """
+        Args:
+            timeout: זמן מרבי (שניות) להרצת Tesseract על תמונה
+            min_side: תמונה שצלעה הארוכה קטנה מזה מוגדלת פי 2 לפני הזיהוי
+        """
+        if pytesseract is None:
+            raise RuntimeError("pytesseract או Pillow לא מותקנים - לא ניתן להפעיל את מנוע הזיהוי המקומי")
+        super().__init__()
+        self.timeout = timeout
+        self.min_side = min_side
+
+    def _prepare(self, image_bytes):
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            gray = ImageOps.autocontrast(image.convert('L'))
+        if max(gray.size) < self.min_side:
+            gray = gray.resize((gray.width * 2, gray.height * 2), Image.LANCZOS)
+        return gray
+
+    def _recognize(self, image_bytes):
+        data = pytesseract.image_to_data(
+            self._prepare(image_bytes),
+            config=self.TESSERACT_CONFIG,
+            output_type=pytesseract.Output.DICT,
+            timeout=self.timeout
+        )
+
+        # קיבוץ המילים לפי שורה
+        lines = {}
+        for index, text in enumerate(data['text']):
+            digits = re.sub(r'\D', '', text)
+            confidence = float(data['conf'][index])
+            if not digits or confidence < 0:
+                continue
+            key = (data['block_num'][index], data['par_num'][index], data['line_num'][index])
+            lines.setdefault(key, []).append((digits, confidence / 100))
+
+        results = []
+        for words in lines.values():
+            plate = ''.join(digits for digits, _ in words)
+            if len(plate) < WINDOW_SIZE:
+                continue
+            results.append({
+                'plate': plate,
+                'score': round(min(score for _, score in words), 3),
+                'candidates': [
+                    {'plate': digits, 'score': round(score, 3)}
+                    for digits, score in words if len(digits) >= WINDOW_SIZE
+                ]
+            })
+
+        results.sort(key=lambda result: result['score'], reverse=True)
+        return {'results': results}
+
+
+class CascadeBackend(OCRBackend):
+    """
+    זיהוי מדורג: המנוע המקומי קודם, והענן רק כשהביטחון המקומי נמוך
+
+    בכל פנייה לענן נמדדת ההסכמה בין המנועים (אותה לוחית ראשית, או חלונות
+    משותפים של 3 ספרות). כדי למדוד הסכמה גם על תוצאות מקומיות שהתקבלו,
+    חלק audit_rate מהן נשלח גם לענן לבדיקה. הבדיקה רצה ברקע, כך שהתשובה
+    המקומית מוחזרת מיד; כשכבר יש max_pending_audits בדיקות בדרך, הבדיקה
+    הנוספת מדולגת במקום להצטבר.
+    """
+
+    name = 'cascade'
+
+    def __init__(self, local, cloud, min_confidence=0.8, audit_rate=0.0, audit_workers=2, max_pending_audits=20):
+        """
+        Args:
+            local: המנוע המקומי
+            cloud: מנוע הענן
+            min_confidence: הביטחון המקומי המינימלי לקבלת התשובה בלי פנייה לענן
+            audit_rate: חלק התשובות המקומיות שהתקבלו שנשלחות גם לענן למדידת הסכמה
+            audit_workers: תהליכוני הרקע לבדיקות מול הענן
+            max_pending_audits: מספר הבדיקות המרבי שממתינות או רצות ברקע
+        """
+        super().__init__()
+        self.local = local
+        self.cloud = cloud
+        self.min_confidence = min_confidence
+        self.audit_rate = audit_rate
+        self.max_pending_audits = max_pending_audits
+
+        # התהליכונים נוצרים רק בבדיקה הראשונה
+        self._audit_executor = ThreadPoolExecutor(max_workers=audit_workers, thread_name_prefix='ocr-audit')
+        self._pending_audits = 0
+
+        self._lock = threading.Lock()
+        self._counters = {
+            'local_accepted': 0, 'escalated': 0, 'audited': 0, 'audit_skipped': 0, 'audit_errors': 0,
+            'compared': 0, 'same_plate': 0, 'shared_windows': 0
+        }
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+
+    def _compare(self, local_result, cloud_result):
+        """מדידת ההסכמה בין תשובת המנוע המקומי לתשובת הענן"""
+        if cloud_result is None:
+            return
+        local_match = PlateMatch.from_ocr_result(local_result)
+        cloud_match = PlateMatch.from_ocr_result(cloud_result)
+        with self._lock:
+            self._counters['compared'] += 1
+            if local_match.plates[:1] == cloud_match.plates[:1]:
+                self._counters['same_plate'] += 1
+            if local_match.windows.keys() & cloud_match.windows.keys():
+                self._counters['shared_windows'] += 1
+
+    def _submit_audit(self, image_bytes, local_result):
+        """שליחת תשובה מקומית לבדיקה מול הענן ברקע (או דילוג אם התור מלא)"""
+        with self._lock:
+            if self._pending_audits >= self.max_pending_audits:
+                self._counters['audit_skipped'] += 1
+                return
+            self._pending_audits += 1
+            self._counters['audited'] += 1
+        self._audit_executor.submit(self._audit, image_bytes, local_result)
+
+    def _audit(self, image_bytes, local_result):
+        """בדיקת התשובה המקומית מול הענן ורישום ההסכמה (רץ בתהליכון רקע)"""
+        try:
+            self._compare(local_result, self.cloud.recognize(image_bytes))
+        except Exception as e:
+            self._count('audit_errors')
+            logger.warning(f"שגיאה בבדיקת התשובה המקומית מול הענן: {e}")
+        finally:
+            with self._lock:
+                self._pending_audits -= 1
+
+    def _recognize(self, image_bytes):
+        local_result = None
+        try:
+            local_result = self.local.recognize(image_bytes)
+        except Exception as e:
+            logger.warning(f"שגיאה במנוע הזיהוי המקומי, פונה לענן: {e}")
+
+        if best_score(local_result) >= self.min_confidence:
+            self._count('local_accepted')
+            if self.audit_rate and random.random() < self.audit_rate:
+                self._submit_audit(image_bytes, local_result)
+            return local_result
+
+        self._count('escalated')
+        cloud_result = self.cloud.recognize(image_bytes)
+        self._compare(local_result, cloud_result)
+        return cloud_result
+
+    def stats(self):
+        """מדדי שני המנועים, שיעור הפנייה לענן ושיעורי ההסכמה"""
+        with self._lock:
+            counters = dict(self._counters)
+            pending = self._pending_audits
+        decided = counters['local_accepted'] + counters['escalated']
+        compared = counters['compared']
+        return {
+            **self.local.stats(),
+            **self.cloud.stats(),
+            self.name: {
+                **self.metrics.stats(),
+                **counters,
+                'audits_pending': pending,
+                'escalation_rate': round(counters['escalated'] / decided, 4) if decided else 0,
+                'same_plate_rate': round(counters['same_plate'] / compared, 4) if compared else 0,
+                'shared_windows_rate': round(counters['shared_windows'] / compared, 4) if compared else 0
+            }
+        }
@@ -0,0 +1,164 @@
+import io
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+# Pillow נדרש רק לגיבוב התפיסתי (זיהוי תמונות כמעט זהות)
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+def perceptual_hash(image_bytes, hash_size=8):
+    """
+    חישוב גיבוב תפיסתי (dHash) של תמונה
+
+    תמונות כמעט זהות (דחיסה מחדש, שינוי גודל) מקבלות גיבוב זהה או קרוב
+    במרחק Hamming.
+
+    Returns:
+        int: גיבוב של 64 סיביות, או None אם Pillow לא מותקן או שהתמונה לא נקראה
+    """
+    if Image is None:
+        return None
+
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            pixels = list(image.convert('L').resize((hash_size + 1, hash_size)).getdata())
+    except Exception as e:
+        logger.warning(f"לא ניתן לחשב גיבוב תפיסתי לתמונה: {e}")
+        return None
+
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+class CacheKey:
+    """מפתח מטמון: גיבוב SHA-256 של התמונה וגיבוב תפיסתי אופציונלי"""
+
+    def __init__(self, digest, phash=None):
+        self.digest = digest
+        self.phash = phash
+
+
+class OCRCache:
+    """
+    מטמון תוצאות OCR לפי תוכן התמונה
+
+    שכבה ראשונה: מטמון LRU חסום בזיכרון עם זמן תפוגה (TTL).
+    שכבה שנייה (אופציונלית): טבלת ocr_cache ב-PostgreSQL דרך DBManager.
+    """
+
+    def __init__(self, max_entries=1000, ttl=86400, perceptual=False, max_distance=4, store=None):
+        """
+        Args:
+            max_entries: מספר התוצאות המרבי בזיכרון
+            ttl: זמן תפוגה של תוצאה בשניות
+            perceptual: האם לחפש גם תמונות כמעט זהות לפי גיבוב תפיסתי
+            max_distance: מרחק Hamming מרבי בין גיבובים תפיסתיים שנחשבים לאותה תמונה
+            store: שכבה קבועה (DBManager) או None
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.perceptual = perceptual and Image is not None
+        self.max_distance = max_distance
+        self.store = store
+
+        self._entries = OrderedDict()  # digest -> (זמן שמירה, גיבוב תפיסתי, תוצאה)
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits_memory': 0,
+            'hits_perceptual': 0,
+            'hits_persistent': 0,
+            'misses': 0,
+            'evictions': 0
+        }
+
+        if perceptual and Image is None:
+            logger.warning("Pillow לא מותקן - זיהוי תמונות כמעט זהות במטמון ה-OCR כבוי")
+
+    def make_key(self, image_bytes):
+        """חישוב מפתח המטמון של תמונה"""
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        phash = perceptual_hash(image_bytes) if self.perceptual else None
+        return CacheKey(digest, phash)
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def get(self, key):
+        """
+        חיפוש תוצאה במטמון
+
+        Returns:
+            dict: תוצאת ה-OCR השמורה, או None אם לא נמצאה
+        """
+        now = time.time()
+
+        with self._lock:
+            # התאמה מדויקת לפי תוכן התמונה
+            entry = self._entries.get(key.digest)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._entries.move_to_end(key.digest)
+                    self._counters['hits_memory'] += 1
+                    return entry[2]
+                del self._entries[key.digest]
+
+            # התאמה לתמונה כמעט זהה
+            if key.phash is not None:
+                for digest, (stored_at, phash, result) in reversed(self._entries.items()):
+                    if phash is None or now - stored_at > self.ttl:
+                        continue
+                    if bin(phash ^ key.phash).count('1') <= self.max_distance:
+                        self._entries.move_to_end(digest)
+                        self._counters['hits_perceptual'] += 1
+                        return result
+
+        # שכבה קבועה במסד הנתונים
+        if self.store is not None:
+            result = self.store.get_cached_ocr_result(key.digest, self.ttl)
+            if result is not None:
+                self._remember(key, result)
+                self._count('hits_persistent')
+                return result
+
+        self._count('misses')
+        return None
+
+    def _remember(self, key, result):
+        """שמירת תוצאה בשכבת הזיכרון ופינוי הרשומות הישנות ביותר"""
+        with self._lock:
+            self._entries[key.digest] = (time.time(), key.phash, result)
+            self._entries.move_to_end(key.digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def put(self, key, result):
+        """שמירת תוצאת OCR במטמון"""
+        self._remember(key, result)
+        if self.store is not None:
+            self.store.save_cached_ocr_result(key.digest, result)
+
+    def stats(self):
+        """מוני פגיעות והחטאות של המטמון"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+        hits = stats['hits_memory'] + stats['hits_perceptual'] + stats['hits_persistent']
+        lookups = hits + stats['misses']
+        stats['hit_rate'] = round(hits / lookups, 3) if lookups else 0
+        return stats
@@ -0,0 +1,335 @@
+"""
+הגנה על מנוע זיהוי הלוחיות: מפסק זרם, מגבלת מקביליות מסתגלת ותור המתנה
+
+- CircuitBreaker: נפתח לאחר כשלים רצופים (או קריאות איטיות במיוחד) וחוסם
+  קריאות מיד, עד שקריאת ניסיון אחת (half-open) מצליחה.
+- AdaptiveLimiter: מגבלת קריאות לשנייה לפי מכסת התוכנית, ומגבלת מקביליות
+  שגדלה בהדרגה בהצלחות ונחתכת בחצי בכשלים ובהגבלות (AIMD).
+- GuardedBackend: מנוע זיהוי עטוף בשניהם.
+- HeldJobs: משימות שנעצרו בזמן שהשירות לא זמין, ונשלחות שוב כשהוא חוזר.
+"""
+
+import time
+import threading
+import logging
+from collections import deque
+from ocr_backends import OCRBackend, OCRBackendError
+from telegram_dispatcher import TokenBucket
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+# מצבי המפסק
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(OCRBackendError):
+    """המפסק פתוח - הקריאה נחסמה בלי לפנות לשירות"""
+
+
+class CircuitBreaker:
+    """
+    מפסק זרם לשירות חיצוני
+
+    סגור: כל הקריאות עוברות. לאחר failure_threshold כשלים רצופים (קריאה
+    שנמשכה יותר מ-slow_call_threshold נחשבת כשל) המפסק נפתח, וכל הקריאות
+    נחסמות מיד למשך reset_timeout שניות. לאחר מכן עוברת קריאת ניסיון אחת
+    (half-open): הצלחה סוגרת את המפסק וכשל פותח אותו מחדש.
+    """
+
+    def __init__(self, failure_threshold=5, slow_call_threshold=15.0, reset_timeout=30.0, clock=time.monotonic):
+        """
+        Args:
+            failure_threshold: מספר הכשלים הרצופים לפתיחת המפסק
+            slow_call_threshold: משך קריאה (שניות) שמעליו היא נחשבת כשל
+            reset_timeout: שניות במצב פתוח לפני קריאת ניסיון
+            clock: פונקציית זמן (להחלפה בבדיקות)
+        """
+        self.failure_threshold = failure_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._counters = {'opened': 0, 'rejected': 0, 'slow_calls': 0}
+
+    @property
+    def state(self):
+        """המצב הנוכחי (פתוח עובר ל-half-open כשחלף reset_timeout)"""
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+            logger.info("מפסק הזרם של שירות הזיהוי במצב ניסיון (half-open)")
+        return self._state
+
+    def probe_ready(self):
+        """האם המפסק ממתין לקריאת ניסיון שעוד לא נשלחה"""
+        with self._lock:
+            return self._current_state() == HALF_OPEN and not self._probe_in_flight
+
+    def allow(self):
+        """
+        האם לבצע קריאה כעת
+
+        Returns:
+            bool: False אם המפסק פתוח, או שקריאת הניסיון כבר בדרך
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self._counters['rejected'] += 1
+            return False
+
+    def record_success(self, latency):
+        """רישום קריאה שהסתיימה (קריאה איטית מדי נרשמת ככשל)"""
+        if latency > self.slow_call_threshold:
+            with self._lock:
+                self._counters['slow_calls'] += 1
+            self.record_failure()
+            return
+
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info("מפסק הזרם של שירות הזיהוי נסגר - השירות חזר לפעול")
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        """רישום כשל (פותח את המפסק לאחר כשלים רצופים, או מיד במצב ניסיון)"""
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = self.clock()
+                self._probe_in_flight = False
+                self._counters['opened'] += 1
+                logger.warning(
+                    f"מפסק הזרם של שירות הזיהוי נפתח לאחר {self._failures} כשלים רצופים "
+                    f"- קריאות ייחסמו ל-{self.reset_timeout} שניות"
+                )
+
+    def stats(self):
+        """מצב המפסק ומוניו"""
+        with self._lock:
+            return {'state': self._current_state(), 'consecutive_failures': self._failures, **self._counters}
+
+
+class AdaptiveLimiter:
+    """
+    מגבלת קצב ומקביליות מסתגלת לשירות חיצוני
+
+    קצב הקריאות מוגבל ל-rate לשנייה (מכסת התוכנית, 0 = ללא מגבלה). מגבלת
+    המקביליות גדלה ב-1/limit אחרי כל קריאה מהירה ומוצלחת, ונחתכת בחצי
+    אחרי כשל, הגבלת קצב (429) או קריאה איטית מ-latency_target.
+    """
+
+    def __init__(self, rate=0, initial_limit=4, min_limit=1, max_limit=16, latency_target=5.0):
+        """
+        Args:
+            rate: קריאות לשנייה מרביות (0 = ללא מגבלה)
+            initial_limit: מגבלת המקביליות ההתחלתית
+            min_limit: מגבלת המקביליות המינימלית
+            max_limit: מגבלת המקביליות המרבית
+            latency_target: משך קריאה (שניות) שמעליו המגבלה יורדת
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self._bucket = TokenBucket(rate, max(rate, 1)) if rate > 0 else None
+
+        self._cond = threading.Condition()
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._counters = {'acquired': 0, 'decreases': 0}
+        self._wait_total = 0.0
+
+    def reserve(self):
+        """
+        תפיסת מקום לקריאה בלי להמתין
+
+        Returns:
+            float: שניות להמתנה עד שמגיע תור הקריאה לפי הקצב, או None אם אין מקום פנוי
+        """
+        with self._cond:
+            if self._in_flight >= int(self._limit):
+                return None
+            self._in_flight += 1
+            self._counters['acquired'] += 1
+            wait = self._bucket.reserve(time.monotonic()) if self._bucket is not None else 0.0
+            self._wait_total += wait
+            return wait
+
+    def acquire(self):
+        """תפיסת מקום לקריאה, עם המתנה למקום פנוי ולתור לפי הקצב"""
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    def release(self, latency=0.0, ok=True):
+        """שחרור המקום ועדכון המגבלה לפי תוצאת הקריאה"""
+        with self._cond:
+            self._in_flight -= 1
+            if ok and latency <= self.latency_target:
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            else:
+                self._limit = max(self.min_limit, self._limit / 2)
+                self._counters['decreases'] += 1
+            self._cond.notify_all()
+
+    def stats(self):
+        """המגבלה הנוכחית, הקריאות בדרך וזמני ההמתנה לקצב"""
+        with self._cond:
+            acquired = self._counters['acquired']
+            return {
+                'limit': int(self._limit),
+                'in_flight': self._in_flight,
+                **self._counters,
+                'avg_rate_wait': round(self._wait_total / acquired, 3) if acquired else 0
+            }
+
+
+class GuardedBackend(OCRBackend):
+    """
+    מנוע זיהוי עטוף במפסק זרם ובמגבלת מקביליות מסתגלת
+
+    כשלים שאינם של השירות (למשל תמונה לא תקינה - שגיאת 4xx) לא נספרים
+    במפסק. הגבלת קצב (429) נספרת כשל ומקטינה את המקביליות.
+    """
+
+    def __init__(self, inner, breaker, limiter):
+        super().__init__()
+        self.inner = inner
+        self.name = inner.name
+        self.metrics = inner.metrics
+        self.breaker = breaker
+        self.limiter = limiter
+
+    def admit(self):
+        """בדיקת המפסק לפני קריאה (CircuitOpenError אם היא נחסמה)"""
+        if not self.breaker.allow():
+            raise CircuitOpenError("שירות זיהוי הלוחיות אינו זמין (המפסק פתוח)")
+
+    def complete(self, latency, error=None):
+        """רישום תוצאת קריאה במפסק ובמגבלת המקביליות"""
+        service_failure = error is not None and getattr(error, 'transient', True)
+        self.limiter.release(latency, ok=not service_failure)
+        if service_failure:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success(latency)
+
+    def recognize(self, image_bytes):
+        self.admit()
+        self.limiter.acquire()
+        started = time.monotonic()
+        try:
+            result = self.inner.recognize(image_bytes)
+        except Exception as e:
+            self.complete(time.monotonic() - started, e)
+            raise
+        self.complete(time.monotonic() - started)
+        return result
+
+    def stats(self):
+        return {
+            **self.inner.stats(),
+            f'{self.name}_guard': {'circuit': self.breaker.stats(), 'limiter': self.limiter.stats()}
+        }
+
+
+class HeldJobs:
+    """
+    משימות שממתינות לחזרת שירות הזיהוי
+
+    כשהמפסק נסגר כל המשימות נשלחות שוב לעיבוד. כשהמפסק מוכן לקריאת ניסיון,
+    משימה אחת נשלחת כניסיון (אם אין תנועה חדשה שתבדוק את השירות).
+    """
+
+    def __init__(self, breaker, resubmit, max_jobs=200, check_interval=2.0):
+        """
+        Args:
+            breaker: מפסק הזרם של שירות הזיהוי
+            resubmit: פונקציה המקבלת משימה ומחזירה True אם נכנסה שוב לעיבוד
+            max_jobs: מספר המשימות המרבי הממתינות
+            check_interval: שניות בין בדיקות מצב המפסק
+        """
+        self.breaker = breaker
+        self.resubmit = resubmit
+        self.max_jobs = max_jobs
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._jobs = deque()
+        self._thread = None
+        self._stopping = threading.Event()
+        self._counters = {'held': 0, 'released': 0, 'rejected': 0}
+
+    def hold(self, job):
+        """
+        הוספת משימה להמתנה
+
+        Returns:
+            bool: False אם תור ההמתנה מלא
+        """
+        with self._lock:
+            if len(self._jobs) >= self.max_jobs:
+                self._counters['rejected'] += 1
+                return False
+            self._jobs.append(job)
+            self._counters['held'] += 1
+            if self._thread is None:
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='ocr-held-jobs', daemon=True)
+                self._thread.start()
+        return True
+
+    def _release(self, count):
+        for _ in range(count):
+            with self._lock:
+                if not self._jobs:
+                    return
+                job = self._jobs.popleft()
+            if not self.resubmit(job):
+                with self._lock:
+                    self._jobs.appendleft(job)
+                return
+            with self._lock:
+                self._counters['released'] += 1
+
+    def _run(self):
+        while not self._stopping.wait(self.check_interval):
+            if self.breaker.state == CLOSED:
+                self._release(self.max_jobs)
+            elif self.breaker.probe_ready():
+                self._release(1)
+
+    def stop(self, timeout=5):
+        """עצירת תהליכון הבדיקה (משימות שממתינות נשארות בזיכרון)"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stopping.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self):
+        """מספר המשימות הממתינות ומוני ההמתנה"""
+        with self._lock:
+            return {'waiting': len(self._jobs), **self._counters}
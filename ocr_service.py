@@ -1,85 +1,347 @@
-import requests
-from config import PLATE_RECOGNIZER_TOKEN, REGIONS
+import time
+import asyncio
+import logging
+from config import (
+    PLATE_RECOGNIZER_TOKEN, PLATE_RECOGNIZER_API_URL, REGIONS,
+    OCR_CONNECT_TIMEOUT, OCR_READ_TIMEOUT, OCR_MAX_RETRIES, OCR_RETRY_BACKOFF, OCR_POOL_SIZE,
+    OCR_CACHE_ENABLED, OCR_CACHE_MAX_ENTRIES, OCR_CACHE_TTL, OCR_CACHE_PERSISTENT,
+    OCR_CACHE_PERCEPTUAL, OCR_CACHE_PHASH_DISTANCE,
+    OCR_BACKEND, OCR_LOCAL_TIMEOUT, OCR_CASCADE_MIN_CONFIDENCE, OCR_CASCADE_AUDIT_RATE,
+    OCR_CIRCUIT_ENABLED, OCR_CIRCUIT_FAILURES, OCR_CIRCUIT_SLOW_CALL, OCR_CIRCUIT_RESET,
+    OCR_RATE_LIMIT, OCR_MAX_CONCURRENCY, OCR_CANDIDATE_MIN_CONFIDENCE
+)
+from ocr_cache import OCRCache
+from ocr_backends import (
+    CloudBackend, TesseractBackend, CascadeBackend, OCRBackendError, OCRUnavailableError,
+    RETRY_STATUSES, is_transient
+)
+from ocr_guard import GuardedBackend, CircuitBreaker, AdaptiveLimiter, CircuitOpenError
+from plate_matcher import PlateMatch
+
+# aiohttp נדרש רק לשירות האסינכרוני (מצב הרצה async)
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+def create_backend(name):
+    """
+    יצירת מנוע הזיהוי לפי שמו ('cloud', 'local' או 'cascade')
+    """
+    cloud = None
+    if name in ('cloud', 'cascade'):
+        cloud = CloudBackend(
+            token=PLATE_RECOGNIZER_TOKEN,
+            api_url=PLATE_RECOGNIZER_API_URL,
+            regions=REGIONS,
+            timeout=(OCR_CONNECT_TIMEOUT, OCR_READ_TIMEOUT),
+            max_retries=OCR_MAX_RETRIES,
+            retry_backoff=OCR_RETRY_BACKOFF,
+            pool_size=OCR_POOL_SIZE
+        )
+        if OCR_CIRCUIT_ENABLED:
+            cloud = GuardedBackend(
+                cloud,
+                CircuitBreaker(
+                    failure_threshold=OCR_CIRCUIT_FAILURES,
+                    slow_call_threshold=OCR_CIRCUIT_SLOW_CALL,
+                    reset_timeout=OCR_CIRCUIT_RESET
+                ),
+                AdaptiveLimiter(
+                    rate=OCR_RATE_LIMIT,
+                    initial_limit=min(4, OCR_MAX_CONCURRENCY),
+                    max_limit=OCR_MAX_CONCURRENCY,
+                    latency_target=OCR_CIRCUIT_SLOW_CALL / 2
+                )
+            )
+    if name == 'cloud':
+        return cloud
+
+    local = TesseractBackend(timeout=OCR_LOCAL_TIMEOUT)
+    if name == 'local':
+        return local
+    if name == 'cascade':
+        return CascadeBackend(
+            local, cloud, min_confidence=OCR_CASCADE_MIN_CONFIDENCE, audit_rate=OCR_CASCADE_AUDIT_RATE
+        )
+    raise ValueError(f"מנוע זיהוי לא מוכר: {name}")
+
 
 class OCRService:
     """
-    שירות לזיהוי לוחיות רישוי באמצעות PlateRecognizer API
+    שירות לזיהוי לוחיות רישוי באמצעות מנוע זיהוי מוחלף (ענן, מקומי או מדורג)
     """
     
-    def __init__(self):
-        """אתחול השירות"""
+    def __init__(self, db=None, backend=None):
+        """
+        אתחול השירות
+
+        Args:
+            db: מנהל מסד הנתונים לשכבה הקבועה של מטמון ה-OCR (אופציונלי)
+            backend: מנוע הזיהוי (ברירת מחדל - לפי OCR_BACKEND)
+        """
         self.token = PLATE_RECOGNIZER_TOKEN
         self.regions = REGIONS
-    
+        self.api_url = PLATE_RECOGNIZER_API_URL
+        self.backend = backend or create_backend(OCR_BACKEND)
+        logger.info(f"מנוע זיהוי הלוחיות: {self.backend.name}")
+
+        # מטמון תוצאות לפי תוכן התמונה
+        self.cache = None
+        if OCR_CACHE_ENABLED:
+            self.cache = OCRCache(
+                max_entries=OCR_CACHE_MAX_ENTRIES,
+                ttl=OCR_CACHE_TTL,
+                perceptual=OCR_CACHE_PERCEPTUAL,
+                max_distance=OCR_CACHE_PHASH_DISTANCE,
+                store=db if OCR_CACHE_PERSISTENT else None
+            )
+
     def recognize_plate(self, image_file):
         """
         זיהוי לוחית רישוי מתמונה
         
         Args:
-            image_file: קובץ התמונה (בינארי)
+            image_file: קובץ התמונה (בינארי) או תוכן התמונה כ-bytes
             
         Returns:
             dict: תוצאות הזיהוי או None אם נכשל
+            
+        Raises:
+            OCRUnavailableError: השירות אינו זמין כרגע (המפסק פתוח או כשל זמני) - כדאי לנסות שוב מאוחר יותר
         """
         try:
-            # שליחת התמונה ל-API
-            response = requests.post(
-                'https://api.platerecognizer.com/v1/plate-reader/',
-                data=dict(regions=self.regions),
-                files=dict(upload=image_file),
-                headers={'Authorization': f'Token {self.token}'}
-            )
-            
-            # בדיקת תקינות התגובה
-            if response.status_code == 200 or response.status_code == 201:  # תגובה תקינה
-                result = response.json()
-                # print(result)
-                return result
-            else:
-                    return None
+            # קריאת התמונה לזיכרון כדי שניסיון חוזר ישלח אותה שוב במלואה
+            image_bytes = image_file.read() if hasattr(image_file, 'read') else image_file
+
+            # בדיקה אם התמונה כבר זוהתה בעבר
+            cache_key = None
+            if self.cache is not None:
+                cache_key = self.cache.make_key(image_bytes)
+                cached_result = self.cache.get(cache_key)
+                if cached_result is not None:
+                    logger.info("תוצאת OCR נמצאה במטמון")
+                    return cached_result
+
+            # זיהוי באמצעות המנוע
+            result = self.backend.recognize(image_bytes)
+            if result is not None and cache_key is not None:
+                self.cache.put(cache_key, result)
+            return result
+        except CircuitOpenError as e:
+            raise OCRUnavailableError(str(e), fail_fast=True)
         except Exception as e:
+            logger.error(f"שגיאה בזיהוי הלוחיות ({self.backend.name}): {e}")
+            if is_transient(e):
+                raise OCRUnavailableError(str(e))
             return None
+
+    @property
+    def breaker(self):
+        """מפסק הזרם של שירות הזיהוי בענן (None אם אינו מופעל)"""
+        backend = getattr(self.backend, 'cloud', self.backend)
+        return getattr(backend, 'breaker', None)
+
+    def cache_stats(self):
+        """מוני המטמון של תוצאות ה-OCR"""
+        return self.cache.stats() if self.cache is not None else {'enabled': False}
     
-    def extract_plate_numbers(self, ocr_result):
+    def backend_stats(self):
+        """זמני התגובה של מנועי הזיהוי (ובמצב מדורג - שיעורי הפנייה לענן וההסכמה)"""
+        return self.backend.stats()
+    
+    def match_plates(self, ocr_result):
         """
-        חילוץ מספרי לוחיות רישוי מתוצאות ה-OCR
+        עיבוד תוצאות ה-OCR להתאמה מול מספרי המשחק
         
         Args:
             ocr_result: תוצאות ה-OCR מה-API
             
         Returns:
-            list: רשימת מספרי לוחיות שזוהו, או רשימה ריקה אם לא זוהו לוחיות
+            PlateMatch: הלוחיות שזוהו וכל החלונות של 3 ספרות שבהן, עם ביטחון הזיהוי
         """
-        plates = []
+        return PlateMatch.from_ocr_result(ocr_result, OCR_CANDIDATE_MIN_CONFIDENCE)
+    
+    def plate_candidates(self, ocr_result):
+        """
+        כל הלוחיות שזוהו כולל המועמדים החלופיים של ה-API שעברו את סף הביטחון
         
-        # בדיקה אם יש תוצאות
-        if not ocr_result or 'results' not in ocr_result:
-            return plates
+        Returns:
+            list: זוגות (טקסט לוחית, ביטחון), מהביטחון הגבוה לנמוך
+        """
+        return self.match_plates(ocr_result).scored_candidates()
+    
+    def extract_plate_numbers(self, ocr_result):
+        """
+        חילוץ מספרי לוחיות רישוי מתוצאות ה-OCR
         
-        # עיבוד כל התוצאות
-        for result in ocr_result['results']:
-            plate_text = result.get('plate', '').replace('-', '').replace(' ', '')
-            
-            # הוספת הלוחית המלאה
-            if plate_text:
-                plates.append(plate_text)
+        Args:
+            ocr_result: תוצאות ה-OCR מה-API
             
-            # חילוץ קטעים של 3 ספרות
-            if len(plate_text) >= 3:
-                # לוחיות עם מספר ספרות אי-זוגי (מספר באמצע)
-                if len(plate_text) % 2 == 1:
-                    mid_index = len(plate_text) // 2
-                    middle_three = plate_text[mid_index-1:mid_index+2]
-                    plates.append(middle_three)
-                
-                # לוחיות עם מספר ספרות זוגי (מספר בצדדים)
-                else:
-                    # שלוש ספרות ראשונות
-                    first_three = plate_text[:3]
-                    plates.append(first_three)
-                    
-                    # שלוש ספרות אחרונות
-                    last_three = plate_text[-3:]
-                    plates.append(last_three)
-        
-        return plates
\ No newline at end of file
+        Returns:
+            list: רשימת מספרי לוחיות שזוהו (ללא כפילויות), או רשימה ריקה אם לא זוהו לוחיות
+        """
+        return self.match_plates(ocr_result).plates
+
+
+class AsyncOCRService:
+    """
+    שירות אסינכרוני לזיהוי לוחיות רישוי (למצב הרצה async)
+
+    מנוע הענן נקרא ישירות דרך aiohttp עם חיבורי keep-alive. מנועים מקומיים
+    או מדורגים רצים במאגר התהליכונים דרך run_blocking. המטמון וחילוץ
+    המספרים משותפים עם OCRService.
+    """
+
+    def __init__(self, ocr_service, run_blocking):
+        """
+        Args:
+            ocr_service: מופע OCRService (מטמון, הגדרות וחילוץ מספרים)
+            run_blocking: פונקציה אסינכרונית להרצת קריאה חוסמת מחוץ ללולאת האירועים
+        """
+        if aiohttp is None:
+            raise RuntimeError("aiohttp לא מותקן - לא ניתן להפעיל את שירות ה-OCR האסינכרוני")
+
+        self.service = ocr_service
+        self.run_blocking = run_blocking
+        self.timeout = aiohttp.ClientTimeout(sock_connect=OCR_CONNECT_TIMEOUT, sock_read=OCR_READ_TIMEOUT)
+        self._session = None
+
+    def _get_session(self):
+        """סשן HTTP יחיד, נוצר בתוך לולאת האירועים בשימוש הראשון"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=OCR_POOL_SIZE),
+                headers={'Authorization': f'Token {self.service.token}'},
+                timeout=self.timeout
+            )
+        return self._session
+
+    async def close(self):
+        """סגירת סשן ה-HTTP"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _post(self, image_bytes):
+        """שליחת התמונה ל-API עם ניסיונות חוזרים על שגיאות 429/5xx וכשלי התחברות"""
+        session = self._get_session()
+
+        for attempt in range(OCR_MAX_RETRIES + 1):
+            delay = OCR_RETRY_BACKOFF * (2 ** attempt)
+            try:
+                form = aiohttp.FormData()
+                for region in self.service.regions:
+                    form.add_field('regions', region)
+                form.add_field('upload', image_bytes, filename='image.jpg')
+
+                async with session.post(self.service.api_url, data=form) as response:
+                    if response.status in (200, 201):
+                        return await response.json()
+                    if response.status not in RETRY_STATUSES or attempt == OCR_MAX_RETRIES:
+                        raise OCRBackendError(
+                            f"שגיאה מ-API זיהוי הלוחיות: סטטוס {response.status}",
+                            status=response.status,
+                            transient=response.status in RETRY_STATUSES
+                        )
+                    retry_after = response.headers.get('Retry-After')
+                    if retry_after and retry_after.isdigit():
+                        delay = int(retry_after)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt == OCR_MAX_RETRIES:
+                    raise
+                logger.warning(f"כשל בהתחברות ל-API זיהוי הלוחיות, מנסה שוב: {e}")
+
+            await asyncio.sleep(delay)
+
+    async def _call_cloud(self, backend, image_bytes):
+        """קריאה לענן דרך aiohttp, עם מפסק הזרם ומגבלת המקביליות של המנוע (אם הוגדרו)"""
+        guard = backend if isinstance(backend, GuardedBackend) else None
+        if guard is not None:
+            guard.admit()
+            wait = guard.limiter.reserve()
+            while wait is None:
+                await asyncio.sleep(0.05)
+                wait = guard.limiter.reserve()
+            if wait:
+                await asyncio.sleep(wait)
+
+        started = time.monotonic()
+        try:
+            result = await self._post(image_bytes)
+        except Exception as e:
+            latency = time.monotonic() - started
+            backend.metrics.record(latency, failed=True)
+            if guard is not None:
+                guard.complete(latency, e)
+            raise
+
+        latency = time.monotonic() - started
+        backend.metrics.record(latency)
+        if guard is not None:
+            guard.complete(latency)
+        return result
+
+    async def recognize_plate(self, image_bytes):
+        """
+        זיהוי לוחית רישוי מתמונה
+
+        Args:
+            image_bytes: תוכן התמונה
+
+        Returns:
+            dict: תוצאות הזיהוי או None אם נכשל
+
+        Raises:
+            OCRUnavailableError: השירות אינו זמין כרגע (המפסק פתוח או כשל זמני)
+        """
+        cache = self.service.cache
+        try:
+            # בדיקה אם התמונה כבר זוהתה בעבר (גיבוב ומטמון קבוע רצים מחוץ ללולאה)
+            cache_key = None
+            if cache is not None:
+                cache_key = await self.run_blocking(cache.make_key, image_bytes)
+                cached_result = await self.run_blocking(cache.get, cache_key)
+                if cached_result is not None:
+                    logger.info("תוצאת OCR נמצאה במטמון")
+                    return cached_result
+
+            backend = self.service.backend
+            if backend.name == 'cloud':
+                result = await self._call_cloud(backend, image_bytes)
+            else:
+                result = await self.run_blocking(backend.recognize, image_bytes)
+            if result is not None and cache_key is not None:
+                await self.run_blocking(cache.put, cache_key, result)
+            return result
+        except CircuitOpenError as e:
+            raise OCRUnavailableError(str(e), fail_fast=True)
+        except Exception as e:
+            logger.error(f"שגיאה בזיהוי הלוחיות ({self.service.backend.name}): {e}")
+            if is_transient(e) or isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)):
+                raise OCRUnavailableError(str(e))
+            return None
+
+    def match_plates(self, ocr_result):
+        """עיבוד תוצאות ה-OCR להתאמה מול מספרי המשחק"""
+        return self.service.match_plates(ocr_result)
+
+    def extract_plate_numbers(self, ocr_result):
+        """חילוץ מספרי לוחיות רישוי מתוצאות ה-OCR"""
+        return self.service.extract_plate_numbers(ocr_result)
+
+    def cache_stats(self):
+        """מוני המטמון של תוצאות ה-OCR"""
+        return self.service.cache_stats()
+
+    def backend_stats(self):
+        """מדדי מנועי הזיהוי"""
+        return self.service.backend_stats()
+
+    @property
+    def breaker(self):
+        """מפסק הזרם של שירות הזיהוי בענן (None אם אינו מופעל)"""
+        return self.service.breaker
@@ -0,0 +1,186 @@
+import time
+import queue
+import threading
+import logging
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+class StageTimer:
+    """
+    מדידת משכי השלבים של פעולה מרובת שלבים
+    """
+
+    def __init__(self):
+        self.timings = {}  # שם שלב -> משך בשניות
+
+    @contextmanager
+    def stage(self, name):
+        """מדידת משך שלב"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0) + time.monotonic() - started
+
+    def format_timings(self):
+        """תיאור משכי השלבים לרישום בלוג"""
+        return ', '.join(f"{stage}={seconds:.3f}s" for stage, seconds in self.timings.items())
+
+
+class PhotoJob(StageTimer):
+    """
+    משימת עיבוד תמונה שממתינה בתור
+    """
+
+    def __init__(self, message, loading_message, current_number, album=None, update_ids=()):
+        """
+        Args:
+            message: הודעת התמונה (באלבום - התמונה הראשונה)
+            loading_message: הודעת הטעינה, או Future שלה אם היא עדיין נשלחת
+            current_number: המספר המבוקש בזמן קבלת התמונה
+            album: כל הודעות התמונה של האלבום, אם התמונות מעובדות יחד
+            update_ids: עדכוני תור העדכונים שיסומנו כמעובדים בסיום העיבוד
+        """
+        super().__init__()
+        self.message = message
+        self.messages = album or [message]
+        self.update_ids = list(update_ids)
+        self.current_number = current_number
+        self.enqueued_at = time.monotonic()
+        self._loading_message = loading_message
+
+        # המתנה לחזרת שירות הזיהוי
+        self.held_since = None
+        self.ocr_failures = 0
+
+    @property
+    def loading_message(self):
+        """הודעת הטעינה (ממתין לסיום שליחתה אם היא נשלחת במקביל)"""
+        if isinstance(self._loading_message, Future):
+            try:
+                self._loading_message = self._loading_message.result()
+            except Exception as e:
+                logger.warning(f"הודעת הטעינה לא נשלחה: {e}")
+                self._loading_message = None
+        return self._loading_message
+
+
+class PhotoWorkerPool:
+    """
+    מאגר תהליכוני עבודה לעיבוד תמונות עם תור חסום
+
+    המטפל בעדכון רק מכניס משימה לתור, והתהליכונים מריצים את צינור העיבוד
+    (הורדה, OCR, מסד נתונים והודעות). התהליכונים מופעלים בשימוש הראשון.
+    """
+
+    def __init__(self, process, num_workers=4, max_queue=100, name='photo-worker'):
+        """
+        Args:
+            process: פונקציה המקבלת PhotoJob ומבצעת את העיבוד
+            num_workers: מספר תהליכוני העבודה
+            max_queue: מספר המשימות המרבי הממתינות בתור
+            name: קידומת לשמות התהליכונים
+        """
+        self.process = process
+        self.num_workers = num_workers
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+
+        self._counters = {'submitted': 0, 'rejected': 0, 'processed': 0, 'failed': 0}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._stage_totals = {}
+
+    def start(self):
+        """הפעלת תהליכוני העבודה (אם עדיין לא הופעלו)"""
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.num_workers):
+                thread = threading.Thread(target=self._worker, name=f"{self.name}-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"הופעלו {self.num_workers} תהליכוני עיבוד תמונות")
+
+    def submit(self, job):
+        """
+        הכנסת משימה לתור
+
+        Returns:
+            bool: True אם המשימה נכנסה לתור, False אם התור מלא
+        """
+        self.start()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._counters['rejected'] += 1
+            logger.warning("תור עיבוד התמונות מלא, המשימה נדחתה")
+            return False
+
+        with self._lock:
+            self._counters['submitted'] += 1
+        return True
+
+    def _worker(self):
+        """לולאת העבודה של תהליכון"""
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+
+            wait = time.monotonic() - job.enqueued_at
+            failed = False
+            try:
+                self.process(job)
+            except Exception as e:
+                failed = True
+                logger.error(f"שגיאה לא מטופלת בעיבוד תמונה: {e}")
+            finally:
+                self._record(job, wait, failed)
+                self._queue.task_done()
+
+    def _record(self, job, wait, failed):
+        """עדכון מדדי הביצועים לאחר סיום משימה"""
+        with self._lock:
+            self._counters['failed' if failed else 'processed'] += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            for stage, seconds in job.timings.items():
+                self._stage_totals[stage] = self._stage_totals.get(stage, 0) + seconds
+
+        logger.info(f"עיבוד תמונה הסתיים: המתנה בתור={wait:.3f}s, {job.format_timings()}")
+
+    def stop(self, timeout=30):
+        """עצירת התהליכונים לאחר סיום המשימות שכבר בתור"""
+        with self._lock:
+            threads = list(self._threads)
+            self._threads = []
+        for _ in threads:
+            self._queue.put(None)
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        logger.info("תהליכוני עיבוד התמונות נעצרו")
+
+    def stats(self):
+        """מדדי התור: עומק, זמני המתנה וזמני שלבים ממוצעים"""
+        with self._lock:
+            completed = self._counters['processed'] + self._counters['failed']
+            return {
+                'queue_depth': self._queue.qsize(),
+                'workers': len(self._threads),
+                **self._counters,
+                'avg_wait': round(self._wait_total / completed, 3) if completed else 0,
+                'max_wait': round(self._wait_max, 3),
+                'avg_stage_seconds': {
+                    stage: round(total / completed, 3) for stage, total in self._stage_totals.items()
+                } if completed else {}
+            }
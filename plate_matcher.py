@@ -0,0 +1,139 @@
+"""
+מנוע התאמה בין תוצאות ה-OCR למספרי המשחק
+
+כל תוצאת OCR מתורגמת פעם אחת לקבוצת חלונות של 3 ספרות רצופות שמופיעים
+בלוחיות שזוהו, וכל חלון מקבל את ביטחון הזיהוי הגבוה ביותר שבו הופיע. לאחר
+מכן בדיקת מספר היא חיפוש במילון - O(1).
+
+הלוחית הראשית של כל תוצאה נכללת תמיד. מועמד חלופי של ה-API נכלל רק אם
+הביטחון שלו הוא לפחות candidate_min_confidence - מועמד חלש מכיל לרוב
+ספרות אקראיות, וחלון של 3 ספרות בו היה מסמן מספר כנמצא.
+"""
+
+import re
+
+# רצפים של ספרות בתוך טקסט הלוחית (אותיות מפרידות בין רצפים)
+DIGIT_RUNS = re.compile(r'\d{3,}')
+
+# אורך המספרים במשחק (000-999)
+WINDOW_SIZE = 3
+
+# הביטחון המינימלי של מועמד חלופי כדי שהחלונות שלו ייכללו בהתאמה
+CANDIDATE_MIN_CONFIDENCE = 0.8
+
+
+def normalize_plate(plate_text):
+    """ניקוי טקסט לוחית: הסרת מקפים ורווחים"""
+    return (plate_text or '').replace('-', '').replace(' ', '')
+
+
+def plate_windows(plate_text):
+    """
+    כל החלונות של 3 ספרות רצופות בלוחית
+
+    חלון אינו חוצה אות, כך ש-"12a345" מכיל את 345 בלבד.
+
+    Returns:
+        set: המספרים (int) שמופיעים בלוחית
+    """
+    windows = set()
+    for run in DIGIT_RUNS.findall(plate_text):
+        for start in range(len(run) - WINDOW_SIZE + 1):
+            windows.add(int(run[start:start + WINDOW_SIZE]))
+    return windows
+
+
+def _result_candidates(result, candidate_min_confidence):
+    """
+    הלוחית הראשית של תוצאה והמועמדים החלופיים שעברו את הסף, עם ציון הביטחון של כל אחד
+    """
+    score = result.get('score', 1.0)
+    yield result.get('plate', ''), score
+    for candidate in result.get('candidates') or ():
+        candidate_score = candidate.get('score', score)
+        if candidate_score >= candidate_min_confidence:
+            yield candidate.get('plate', ''), candidate_score
+
+
+class PlateMatch:
+    """
+    תוצאת OCR מעובדת: הלוחיות שזוהו והחלונות של 3 ספרות שהן מכילות
+    """
+
+    __slots__ = ('plates', 'candidates', 'windows')
+
+    def __init__(self, plates=None, windows=None, candidates=None):
+        """
+        Args:
+            plates: רשימת הלוחיות הראשיות שזוהו (ללא כפילויות, לפי סדר ה-API)
+            windows: מילון מספר -> ביטחון הזיהוי הגבוה ביותר שלו
+            candidates: מילון טקסט לוחית -> ביטחון, לכל הלוחיות והמועמדים החלופיים שנכללו
+        """
+        self.plates = plates or []
+        self.windows = windows or {}
+        self.candidates = candidates or {}
+
+    @classmethod
+    def from_ocr_result(cls, ocr_result, candidate_min_confidence=CANDIDATE_MIN_CONFIDENCE):
+        """
+        בניית ההתאמה מתשובת ה-API (מעבר אחד על כל התוצאות והמועמדים)
+
+        Args:
+            candidate_min_confidence: הביטחון המינימלי של מועמד חלופי כדי שייכלל
+        """
+        plates = []
+        windows = {}
+        candidates = {}
+        if not ocr_result or 'results' not in ocr_result:
+            return cls(plates, windows, candidates)
+
+        for result in ocr_result['results']:
+            plate_text = normalize_plate(result.get('plate'))
+            if plate_text and plate_text not in plates:
+                plates.append(plate_text)
+
+            for candidate_text, score in _result_candidates(result, candidate_min_confidence):
+                candidate_text = normalize_plate(candidate_text)
+                if not candidate_text or score <= candidates.get(candidate_text, -1.0):
+                    continue
+                candidates[candidate_text] = score
+                for number in plate_windows(candidate_text):
+                    if score > windows.get(number, -1.0):
+                        windows[number] = score
+
+        return cls(plates, windows, candidates)
+
+    def scored_candidates(self):
+        """כל הלוחיות והמועמדים שזוהו, מהביטחון הגבוה לנמוך"""
+        return sorted(self.candidates.items(), key=lambda item: item[1], reverse=True)
+
+    def __contains__(self, number):
+        return number in self.windows
+
+    def __bool__(self):
+        return bool(self.windows)
+
+    def confidence(self, number):
+        """ביטחון הזיהוי של המספר בתמונה, או None אם אינו מופיע בה"""
+        return self.windows.get(number)
+
+    def matches(self, number, min_confidence=0.0):
+        """האם המספר מופיע בתמונה בביטחון של לפחות min_confidence"""
+        score = self.windows.get(number)
+        return score is not None and score >= min_confidence
+
+    def covered(self, found_numbers, total, min_confidence=0.0):
+        """
+        המספרים שעדיין לא נמצאו ומופיעים בתמונה
+
+        Args:
+            found_numbers: קבוצת המספרים שכבר נמצאו בקבוצה
+            total: גודל מאגר המספרים של הקבוצה
+
+        Returns:
+            list: המספרים המכוסים, ממוינים
+        """
+        return sorted(
+            number for number, score in self.windows.items()
+            if number < total and score >= min_confidence and number not in found_numbers
+        )
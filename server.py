@@ -0,0 +1,88 @@
+"""
+הרצת שרת ה-webhook בייצור באמצעות gunicorn
+
+האפליקציה נטענת פעם אחת בתהליך הראשי (preload) ומשוכפלת לתהליכי העבודה.
+כל תהליך מנתק את מאגר החיבורים שירש ופותח חיבורים משלו, ובכיבוי מסיים
+את העבודה שבתור לפני סגירת החיבורים.
+"""
+
+import logging
+from gunicorn.app.base import BaseApplication
+from config import PORT, WEB_WORKERS, WEB_THREADS, WEB_TIMEOUT, WEB_GRACEFUL_TIMEOUT
+from bot_handlers import db, reset_bot_after_fork, start_background_services, shutdown_services
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+def when_ready(server):
+    """התהליך הראשי מוכן - סגירת החיבורים שנפתחו בזמן הטעינה, לפני יצירת תהליכי העבודה"""
+    db.close()
+    logger.info(f"שרת gunicorn מוכן: {WEB_WORKERS} תהליכים, {WEB_THREADS} תהליכונים לכל תהליך")
+
+
+def post_fork(server, worker):
+    """אתחול תהליך עבודה חדש"""
+    # החיבורים שנפתחו בתהליך הראשי שייכים לו - התהליך החדש פותח חיבורים משלו
+    db.pool.reset_after_fork()
+
+    # תהליכוני המטפלים של הבוט נוצרו בתהליך הראשי ולא עברו ב-fork
+    reset_bot_after_fork()
+
+    # מטמון מצב המשחק מתעדכן רק בתוך התהליך שביצע את השינוי
+    if WEB_WORKERS > 1 and db.state_cache.enabled:
+        logger.warning("מטמון מצב המשחק כובה: הוא אינו משותף בין מספר תהליכי gunicorn")
+        db.state_cache.enabled = False
+        db.state_cache.invalidate()
+
+    # שירותי הרקע רצים בכל תהליך עבודה (תהליכונים לא שורדים fork)
+    start_background_services()
+
+    logger.info(f"תהליך עבודה {worker.pid} הופעל")
+
+
+def worker_exit(server, worker):
+    """כיבוי מסודר של תהליך עבודה"""
+    logger.info(f"תהליך עבודה {worker.pid} נסגר, מסיים את העבודה שבתור...")
+    shutdown_services(timeout=WEB_GRACEFUL_TIMEOUT)
+
+
+class WebhookServer(BaseApplication):
+    """
+    אפליקציית gunicorn המריצה את אפליקציית ה-Flask ישירות מהקוד
+    """
+
+    def __init__(self, app, options=None):
+        """
+        Args:
+            app: אפליקציית ה-WSGI
+            options: הגדרות gunicorn
+        """
+        self.application = app
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def run_server(app):
+    """הפעלת שרת gunicorn עבור אפליקציית ה-webhook"""
+    options = {
+        'bind': f'0.0.0.0:{PORT}',
+        'workers': WEB_WORKERS,
+        'threads': WEB_THREADS,
+        'worker_class': 'gthread',
+        'timeout': WEB_TIMEOUT,
+        'graceful_timeout': WEB_GRACEFUL_TIMEOUT,
+        'preload_app': True,
+        'when_ready': when_ready,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+    }
+    WebhookServer(app, options).run()
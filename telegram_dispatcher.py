@@ -0,0 +1,208 @@
+import time
+import threading
+import logging
+from telebot import types
+from telebot.apihelper import ApiTelegramException
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    דלי אסימונים עם שמירת מקום: כל קריאה מזמינה אסימון ומקבלת את זמן
+    ההמתנה עד שמגיע תורה, כך שממתינים משרתים לפי סדר ההגעה
+    """
+
+    def __init__(self, rate, burst):
+        """
+        Args:
+            rate: אסימונים לשנייה
+            burst: מספר האסימונים המרבי שנצבר (פרץ מותר)
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now):
+        """הזמנת אסימון - מחזיר כמה שניות להמתין"""
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def block(self, now, seconds):
+        """חסימת הדלי למשך seconds שניות (בעקבות retry_after מטלגרם)"""
+        self._refill(now)
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class TelegramDispatcher:
+    """
+    שליחת קריאות יוצאות לטלגרם במגבלות הקצב של טלגרם
+
+    כל קריאה ממתינה לתורה לפי מגבלה כללית לבוט ומגבלה לכל צ'אט (נמוכה
+    יותר בקבוצות). תשובת 429 חוסמת את הצ'אט לזמן שב-retry_after והקריאה
+    נשלחת שוב. עריכות של כיתוב ומקלדת לאותה הודעה מאוחדות לקריאה אחת.
+    """
+
+    def __init__(self, bot, global_rate=30, chat_rate=1, group_rate_per_minute=20, chat_burst=3, max_retries=3):
+        """
+        Args:
+            bot: מופע TeleBot
+            global_rate: קריאות לשנייה לכל הבוט
+            chat_rate: הודעות לשנייה לצ'אט פרטי
+            group_rate_per_minute: הודעות לדקה לקבוצה
+            chat_burst: מספר ההודעות הרצופות המותר לצ'אט לפני האטה
+            max_retries: מספר הניסיונות החוזרים המרבי לאחר 429
+        """
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate_per_minute / 60
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}  # chat_id -> TokenBucket
+        self._lock = threading.Lock()
+        self._counters = {'sent': 0, 'failed': 0, 'throttled': 0, 'retries': 0, 'coalesced_edits': 0}
+        self._waiting = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # מזהי קבוצות בטלגרם שליליים
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    def _reserve(self, chat_id):
+        """הזמנת מקום לשליחה - מחזיר כמה שניות להמתין"""
+        with self._lock:
+            now = time.monotonic()
+            wait = self._global.reserve(now)
+            if chat_id is not None:
+                wait = max(wait, self._chat_bucket(chat_id).reserve(now))
+
+            # דליים מלאים של צ'אטים לא פעילים אינם נחוצים יותר
+            if len(self._chats) > 10000:
+                self._chats = {key: bucket for key, bucket in self._chats.items() if bucket.tokens < bucket.burst}
+            return wait
+
+    def _throttle(self, chat_id, retry_after):
+        """חסימת הצ'אט (או הבוט כולו) בעקבות תשובת 429"""
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._chat_bucket(chat_id) if chat_id is not None else self._global
+            bucket.block(now, retry_after)
+            self._counters['throttled'] += 1
+
+    def call(self, chat_id, func, *args, **kwargs):
+        """
+        הרצת קריאה לטלגרם לאחר המתנה לתורה, עם ניסיון חוזר על 429
+
+        Args:
+            chat_id: הצ'אט שאליו הקריאה נשלחת (None לקריאות שאינן לצ'אט)
+            func: מתודת הבוט לקריאה
+        """
+        for attempt in range(self.max_retries + 1):
+            wait = self._reserve(chat_id)
+            with self._lock:
+                self._waiting += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+            try:
+                if wait > 0:
+                    time.sleep(wait)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+
+            try:
+                result = func(*args, **kwargs)
+            except ApiTelegramException as e:
+                if e.error_code != 429 or attempt == self.max_retries:
+                    with self._lock:
+                        self._counters['failed'] += 1
+                    raise
+                retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 1)
+                logger.warning(f"טלגרם הגביל את קצב השליחה לצ'אט {chat_id}, ממתין {retry_after} שניות")
+                self._throttle(chat_id, retry_after)
+                with self._lock:
+                    self._counters['retries'] += 1
+                continue
+            except Exception:
+                with self._lock:
+                    self._counters['failed'] += 1
+                raise
+
+            with self._lock:
+                self._counters['sent'] += 1
+            return result
+
+    def send_message(self, chat_id, text, **kwargs):
+        return self.call(chat_id, self.bot.send_message, chat_id, text, **kwargs)
+
+    def reply_to(self, message, text, **kwargs):
+        return self.call(message.chat.id, self.bot.reply_to, message, text, **kwargs)
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        return self.call(chat_id, self.bot.send_photo, chat_id, photo, **kwargs)
+
+    def send_media_group(self, chat_id, media, **kwargs):
+        return self.call(chat_id, self.bot.send_media_group, chat_id, media, **kwargs)
+
+    def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        return self.call(chat_id, self.bot.edit_message_text, text, chat_id, message_id, **kwargs)
+
+    def delete_message(self, chat_id, message_id):
+        return self.call(chat_id, self.bot.delete_message, chat_id, message_id)
+
+    def answer_callback_query(self, callback_query_id, text=None, **kwargs):
+        return self.call(None, self.bot.answer_callback_query, callback_query_id, text, **kwargs)
+
+    def edit_message(self, chat_id, message_id, caption=None, text=None, reply_markup=None, remove_markup=False):
+        """
+        עריכת הודעה בקריאה אחת: כיתוב או טקסט יחד עם המקלדת
+
+        במקום edit_message_caption ואחריו edit_message_reply_markup, המקלדת
+        נשלחת באותה קריאה (מקלדת ריקה מסירה את הכפתורים).
+        """
+        if remove_markup:
+            reply_markup = types.InlineKeyboardMarkup()
+        if reply_markup is not None and (caption is not None or text is not None):
+            with self._lock:
+                self._counters['coalesced_edits'] += 1
+
+        if caption is not None:
+            return self.call(
+                chat_id, self.bot.edit_message_caption,
+                caption=caption, chat_id=chat_id, message_id=message_id, reply_markup=reply_markup
+            )
+        if text is not None:
+            return self.call(
+                chat_id, self.bot.edit_message_text,
+                text, chat_id, message_id, reply_markup=reply_markup
+            )
+        return self.call(
+            chat_id, self.bot.edit_message_reply_markup,
+            chat_id=chat_id, message_id=message_id, reply_markup=reply_markup
+        )
+
+    def stats(self):
+        """מדדי השליחה: ממתינים, זמני המתנה, הגבלות וניסיונות חוזרים"""
+        with self._lock:
+            reservations = self._counters['sent'] + self._counters['failed'] + self._counters['retries']
+            return {
+                'waiting': self._waiting,
+                **self._counters,
+                'tracked_chats': len(self._chats),
+                'avg_wait': round(self._wait_total / reservations, 3) if reservations else 0,
+                'max_wait': round(self._wait_max, 3)
+            }
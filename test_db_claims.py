@@ -0,0 +1,149 @@
+"""
+בדיקת מציאות במקביל מול מסד נתונים אמיתי: לעולם אין שני מספרים נוכחיים
+בקבוצה ומספר אינו מסומן כנמצא פעמיים
+
+כל תהליכון משתמש ב-DBManager משלו (מטמון ונעילות נפרדים), כמו תהליכי
+gunicorn שונים, כך שרק הנעילות במסד הנתונים מונעות התנגשות. הבדיקה רצה
+רק כשמוגדר מסד נתונים לבדיקות (הטבלאות נוצרות בו והקבוצות נמחקות בסיום):
+
+    TEST_DB_NAME=plates_test DB_HOST=... DB_PORT=... DB_USER=... DB_PASSWORD=... \\
+        python -m pytest -q test_db_claims.py
+"""
+
+import os
+import random
+import threading
+import pytest
+
+TEST_DB_NAME = os.environ.get('TEST_DB_NAME')
+
+pytestmark = pytest.mark.skipif(not TEST_DB_NAME, reason="TEST_DB_NAME לא מוגדר - אין מסד נתונים לבדיקות")
+
+NUM_MANAGERS = 4
+THREADS_PER_MANAGER = 3
+ROUNDS = 20
+
+
+@pytest.fixture(params=['rows', 'bitmap'])
+def storage(request, monkeypatch):
+    """מנהלי מסד נתונים נפרדים וקבוצה חדשה במצב האחסון הנבדק"""
+    import db_manager
+    monkeypatch.setattr(db_manager, 'DB_NAME', TEST_DB_NAME)
+    monkeypatch.setattr(db_manager, 'NUMBERS_STORAGE_MODE', request.param)
+    managers = [db_manager.DBManager() for _ in range(NUM_MANAGERS)]
+    group_id = -random.randrange(10 ** 9, 10 ** 12)
+
+    assert managers[0].init_group(group_id)
+    assert managers[0].select_next_number(group_id) is not None
+    yield request.param, managers, group_id
+
+    with managers[0]._cursor() as cur:
+        for table in ('numbers', 'number_bitmaps', 'finds', 'groups'):
+            cur.execute(f"DELETE FROM {table} WHERE group_id = %s", (group_id,))
+    for manager in managers:
+        manager.close()
+
+
+def read_state(manager, storage_mode, group_id):
+    """(מספרי השורות המסומנות כנוכחיות, המספרים שנמצאו) ישירות ממסד הנתונים"""
+    import number_bitmap
+    with manager._cursor() as cur:
+        if storage_mode == 'bitmap':
+            cur.execute(
+                "SELECT found_bitmap, current_number FROM number_bitmaps WHERE group_id = %s", (group_id,)
+            )
+            found_bitmap, current_number = cur.fetchone()
+            found = number_bitmap.to_numbers(bytes(found_bitmap))
+            cur.execute(
+                "SELECT number, COUNT(*) FROM finds WHERE group_id = %s AND action = 'found' GROUP BY number",
+                (group_id,)
+            )
+            assert all(count == 1 for _, count in cur.fetchall()), "מספר נרשם ביומן המציאות פעמיים"
+            current = [current_number] if current_number is not None else []
+            return current, found
+        cur.execute("SELECT number FROM numbers WHERE group_id = %s AND is_current", (group_id,))
+        current = [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT number FROM numbers WHERE group_id = %s AND is_found", (group_id,))
+        found = [row[0] for row in cur.fetchall()]
+        return current, found
+
+
+def race(managers, target):
+    """הרצת target(manager) בכל התהליכונים יחד"""
+    start = threading.Barrier(NUM_MANAGERS * THREADS_PER_MANAGER)
+    results = []
+    lock = threading.Lock()
+
+    def worker(manager):
+        start.wait()
+        result = target(manager)
+        with lock:
+            results.append(result)
+
+    threads = [
+        threading.Thread(target=worker, args=(manager,))
+        for manager in managers for _ in range(THREADS_PER_MANAGER)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_claims_of_the_same_number(storage):
+    storage_mode, managers, group_id = storage
+    claimed_numbers = []
+
+    for _ in range(ROUNDS):
+        current, _ = read_state(managers[0], storage_mode, group_id)
+        assert len(current) == 1
+        number = current[0]
+
+        results = race(managers, lambda manager: manager.claim_numbers(group_id, number, user_id=1))
+        winners = [result for result in results if result[0]]
+        assert len(winners) == 1
+        claimed_numbers.append(number)
+
+        # כל המפסידים רואים את המספר שנבחר על ידי המנצח
+        next_number = winners[0][1]
+        assert all(result[1] == next_number for result in results)
+
+        current, found = read_state(managers[0], storage_mode, group_id)
+        assert current == [next_number]
+        assert next_number not in found
+
+    _, found = read_state(managers[0], storage_mode, group_id)
+    assert sorted(found) == sorted(claimed_numbers)
+    assert len(set(claimed_numbers)) == ROUNDS
+
+
+def test_concurrent_marks_are_idempotent(storage):
+    storage_mode, managers, group_id = storage
+
+    for _ in range(ROUNDS):
+        current, found_before = read_state(managers[0], storage_mode, group_id)
+        number = current[0]
+
+        race(managers, lambda manager: manager.mark_number_as_found(group_id, number, user_id=1))
+
+        current, found = read_state(managers[0], storage_mode, group_id)
+        assert len(current) == 1 and current[0] != number
+        assert sorted(found) == sorted(found_before + [number])
+
+
+def test_repeated_approval_does_not_skip_a_number(storage):
+    """אישור חוזר של אותו מספר (לחיצה כפולה) אינו מסמן את המספר הבא כנמצא"""
+    storage_mode, managers, group_id = storage
+    manager = managers[0]
+
+    for _ in range(ROUNDS):
+        current, found_before = read_state(manager, storage_mode, group_id)
+        number = current[0]
+
+        next_number = manager.mark_number_as_found(group_id, number, user_id=1)
+        assert manager.mark_number_as_found(group_id, number, user_id=1) == next_number
+
+        current, found = read_state(manager, storage_mode, group_id)
+        assert current == [next_number]
+        assert sorted(found) == sorted(found_before + [number])
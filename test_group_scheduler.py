@@ -0,0 +1,164 @@
+"""
+בדיקת עומס של GroupScheduler: מעברי מצב של קבוצה רצים אחד בכל פעם,
+וקבוצות שונות אינן חוסמות זו את זו
+
+    python -m pytest -q test_group_scheduler.py
+    python test_group_scheduler.py --threads 1000 --groups 50
+"""
+
+import time
+import random
+import argparse
+import threading
+from collections import defaultdict
+from group_scheduler import GroupScheduler
+
+
+def run_stress(num_threads=400, num_groups=20, hold=0.001, seed=1):
+    """
+    הרצת num_threads תהליכונים על num_groups קבוצות ומדידת החפיפות
+
+    Returns:
+        dict: החפיפה המרבית בתוך קבוצה, מספר הקבוצות המרבי שרצו במקביל,
+              סדר ההרצה בכל קבוצה ומדדי המתזמן
+    """
+    scheduler = GroupScheduler()
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    active = defaultdict(int)
+    state = {'max_in_group': 0, 'running_groups': 0, 'max_running_groups': 0}
+    start = threading.Barrier(num_threads)
+
+    def worker(group_id):
+        start.wait()
+        with scheduler.serialized(group_id):
+            with lock:
+                active[group_id] += 1
+                if active[group_id] == 1:
+                    state['running_groups'] += 1
+                state['max_in_group'] = max(state['max_in_group'], active[group_id])
+                state['max_running_groups'] = max(state['max_running_groups'], state['running_groups'])
+            time.sleep(hold)
+            with lock:
+                active[group_id] -= 1
+                if active[group_id] == 0:
+                    state['running_groups'] -= 1
+
+    threads = [
+        threading.Thread(target=worker, args=(rng.randrange(num_groups),))
+        for _ in range(num_threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {
+        'max_in_group': state['max_in_group'],
+        'max_running_groups': state['max_running_groups'],
+        'stats': scheduler.stats()
+    }
+
+
+def test_no_overlap_within_group():
+    result = run_stress(num_threads=400, num_groups=20)
+    stats = result['stats']
+    assert result['max_in_group'] == 1
+    assert stats['runs'] == 400
+    assert stats['contended'] > 0
+    assert stats['max_wait'] > 0
+    assert stats['active_groups'] == 0 and stats['waiting'] == 0
+
+
+def test_groups_run_in_parallel():
+    result = run_stress(num_threads=200, num_groups=50, hold=0.005)
+    assert result['max_running_groups'] > 1
+
+
+def test_busy_group_does_not_block_other_groups():
+    scheduler = GroupScheduler()
+    holding = threading.Event()
+    release = threading.Event()
+
+    def hold_group():
+        with scheduler.serialized('busy'):
+            holding.set()
+            release.wait(5)
+
+    def wait_group():
+        with scheduler.serialized('busy'):
+            pass
+
+    blocker = threading.Thread(target=hold_group)
+    blocker.start()
+    holding.wait(5)
+    waiters = [threading.Thread(target=wait_group) for _ in range(5)]
+    for waiter in waiters:
+        waiter.start()
+
+    # קבוצה אחרת רצה מיד, בזמן שהקבוצה העמוסה מחזיקה בנעילה ויש לה ממתינים
+    started = time.monotonic()
+    with scheduler.serialized('other'):
+        other_wait = time.monotonic() - started
+    stats = scheduler.stats()
+    assert other_wait < 0.1
+    assert stats['active_groups'] == 1 and stats['waiting'] == 5
+
+    release.set()
+    blocker.join()
+    for waiter in waiters:
+        waiter.join()
+    assert scheduler.stats()['contended'] == 5
+
+
+def test_fifo_order_within_group():
+    scheduler = GroupScheduler()
+    order = []
+    gate = threading.Event()
+
+    def first():
+        with scheduler.serialized(1):
+            gate.wait(5)
+            order.append(0)
+
+    def later(index):
+        with scheduler.serialized(1):
+            order.append(index)
+
+    threads = [threading.Thread(target=first)]
+    threads[0].start()
+    while scheduler.stats()['active_groups'] == 0:
+        time.sleep(0.001)
+    for index in range(1, 6):
+        thread = threading.Thread(target=later, args=(index,))
+        thread.start()
+        threads.append(thread)
+        # הבא בתור נכנס רק לאחר שהקודם כבר ממתין
+        while scheduler.stats()['waiting'] < index:
+            time.sleep(0.001)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    assert order == list(range(6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress GroupScheduler with many threads and groups")
+    parser.add_argument('--threads', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=50)
+    parser.add_argument('--hold', type=float, default=0.001, help="seconds each run holds its group")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    result = run_stress(args.threads, args.groups, args.hold)
+    elapsed = time.monotonic() - started
+    print(f"threads={args.threads} groups={args.groups} elapsed={elapsed:.2f}s")
+    print(f"max concurrent runs in one group: {result['max_in_group']}")
+    print(f"max groups running at once: {result['max_running_groups']}")
+    print(f"scheduler stats: {result['stats']}")
+    if result['max_in_group'] != 1:
+        raise SystemExit("FAIL: two runs of the same group overlapped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+בדיקות מפסק הזרם ומגבלת המקביליות של שירות הזיהוי (ocr_guard)
+
+מעברי המצב נבדקים עם שעון מדומה, ו-GuardedBackend נבדק מול שרת OCR מדומה
+מקומי שמחזיר שגיאות או עונה לאט.
+
+    python -m pytest -q test_ocr_guard.py
+"""
+
+import time
+import json
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from ocr_backends import CloudBackend, OCRBackendError
+from ocr_guard import (
+    CircuitBreaker, AdaptiveLimiter, GuardedBackend, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+)
+
+OCR_RESPONSE = {'results': [{'plate': '1234567', 'score': 0.9, 'candidates': []}]}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=FakeClock())
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.stats()['opened'] == 1 and breaker.stats()['rejected'] == 1
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=3, clock=FakeClock())
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success(0.1)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_slow_calls_count_as_failures():
+    breaker = CircuitBreaker(failure_threshold=2, slow_call_threshold=5, clock=FakeClock())
+    breaker.record_success(6)
+    breaker.record_success(7)
+    assert breaker.state == OPEN
+    assert breaker.stats()['slow_calls'] == 2
+
+
+def test_half_open_allows_a_single_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    open_breaker(breaker)
+
+    clock.now = 29.9
+    assert breaker.state == OPEN and not breaker.probe_ready()
+
+    clock.now = 30
+    assert breaker.state == HALF_OPEN and breaker.probe_ready()
+    assert breaker.allow()
+    assert not breaker.probe_ready()
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    open_breaker(breaker)
+    clock.now = 30
+    assert breaker.allow()
+    breaker.record_success(0.5)
+    assert breaker.state == CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+@pytest.mark.parametrize('outcome', ['failure', 'slow'])
+def test_failed_or_slow_probe_reopens(outcome):
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, slow_call_threshold=5, reset_timeout=30, clock=clock)
+    open_breaker(breaker)
+    clock.now = 30
+    assert breaker.allow()
+    if outcome == 'failure':
+        breaker.record_failure()
+    else:
+        breaker.record_success(10)
+    assert breaker.state == OPEN
+    assert breaker.stats()['opened'] == 2
+
+    # המפסק נפתח מחדש לתקופה מלאה מרגע הכשל
+    clock.now = 59
+    assert breaker.state == OPEN
+    clock.now = 60
+    assert breaker.state == HALF_OPEN
+
+
+def test_limiter_increases_on_fast_success_and_halves_on_failure():
+    limiter = AdaptiveLimiter(initial_limit=4, min_limit=1, max_limit=8, latency_target=1.0)
+    for _ in range(4):
+        assert limiter.reserve() == 0
+    assert limiter.reserve() is None
+
+    # גידול חיבורי: בערך +1 לכל חלון של limit קריאות מהירות
+    for _ in range(4):
+        limiter.release(0.1, ok=True)
+    assert limiter.stats()['limit'] == 4
+    limiter.reserve()
+    limiter.release(0.1, ok=True)
+    assert limiter.stats()['limit'] == 5
+
+    assert limiter.reserve() == 0
+    limiter.release(0.1, ok=False)
+    assert limiter.stats()['limit'] == 2
+
+    assert limiter.reserve() == 0
+    limiter.release(2.0, ok=True)
+    assert limiter.stats()['limit'] == 1
+    assert limiter.stats()['decreases'] == 2
+
+    # המגבלה לא יורדת מתחת למינימום ולא עולה מעל למקסימום
+    for _ in range(3):
+        limiter.reserve()
+        limiter.release(0.1, ok=False)
+    assert limiter.stats()['limit'] == 1
+    for _ in range(200):
+        limiter.reserve()
+        limiter.release(0.1, ok=True)
+    assert limiter.stats()['limit'] == 8
+
+
+def test_limiter_rate_reserves_wait():
+    limiter = AdaptiveLimiter(rate=2, initial_limit=10, max_limit=10)
+    waits = [limiter.reserve() for _ in range(4)]
+    assert waits[:2] == [0, 0]
+    assert waits[2] == pytest.approx(0.5, abs=0.05)
+    assert waits[3] == pytest.approx(1.0, abs=0.05)
+
+
+@contextmanager
+def stub_ocr_server():
+    """שרת OCR מקומי שהתנהגותו נקבעת בבדיקה: status ו-delay"""
+    behavior = {'status': 200, 'delay': 0.0, 'requests': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            behavior['requests'] += 1
+            time.sleep(behavior['delay'])
+            body = json.dumps(OCR_RESPONSE if behavior['status'] < 300 else {'error': 'down'}).encode()
+            self.send_response(behavior['status'])
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/plate-reader/", behavior
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def guarded_cloud(url, clock, slow_call_threshold=5.0):
+    cloud = CloudBackend('token', url, ['il'], timeout=(1, 2), max_retries=0)
+    breaker = CircuitBreaker(
+        failure_threshold=3, slow_call_threshold=slow_call_threshold, reset_timeout=30, clock=clock
+    )
+    limiter = AdaptiveLimiter(initial_limit=4, max_limit=8, latency_target=slow_call_threshold)
+    return GuardedBackend(cloud, breaker, limiter)
+
+
+def test_guarded_backend_against_failing_server():
+    clock = FakeClock()
+    with stub_ocr_server() as (url, behavior):
+        backend = guarded_cloud(url, clock)
+        assert backend.recognize(b'image') == OCR_RESPONSE
+
+        behavior['status'] = 503
+        for _ in range(3):
+            with pytest.raises(OCRBackendError) as error:
+                backend.recognize(b'image')
+            assert error.value.transient
+        assert backend.breaker.state == OPEN
+
+        # המפסק פתוח: הקריאה נחסמת בלי לפנות לשרת
+        requests_before = behavior['requests']
+        with pytest.raises(CircuitOpenError):
+            backend.recognize(b'image')
+        assert behavior['requests'] == requests_before
+
+        # השרת חזר: קריאת הניסיון מצליחה וסוגרת את המפסק
+        behavior['status'] = 200
+        clock.now = 30
+        assert backend.recognize(b'image') == OCR_RESPONSE
+        assert backend.breaker.state == CLOSED
+        assert backend.limiter.stats()['in_flight'] == 0
+
+
+def test_client_errors_do_not_open_breaker():
+    clock = FakeClock()
+    with stub_ocr_server() as (url, behavior):
+        backend = guarded_cloud(url, clock)
+        behavior['status'] = 400
+        for _ in range(5):
+            with pytest.raises(OCRBackendError) as error:
+                backend.recognize(b'image')
+            assert not error.value.transient
+        assert backend.breaker.state == CLOSED
+
+
+def test_guarded_backend_against_slow_server():
+    clock = FakeClock()
+    with stub_ocr_server() as (url, behavior):
+        backend = guarded_cloud(url, clock, slow_call_threshold=0.05)
+        behavior['delay'] = 0.1
+        for _ in range(3):
+            assert backend.recognize(b'image') == OCR_RESPONSE
+        assert backend.breaker.state == OPEN
+        assert backend.breaker.stats()['slow_calls'] == 3
+        assert backend.limiter.stats()['decreases'] == 3
@@ -0,0 +1,82 @@
+"""
+בדיקות מנוע ההתאמה בין תוצאות ה-OCR למספרי המשחק (plate_matcher)
+
+    python -m pytest -q test_plate_matcher.py
+"""
+
+from plate_matcher import PlateMatch, plate_windows
+
+
+def ocr_result(*results):
+    return {'results': list(results)}
+
+
+def test_primary_plate_matches_at_any_score():
+    match = PlateMatch.from_ocr_result(ocr_result({'plate': '1234567', 'score': 0.1, 'candidates': []}))
+    assert match.plates == ['1234567']
+    assert match.matches(345)
+    assert match.confidence(345) == 0.1
+
+
+def test_low_score_candidates_are_ignored():
+    result = {
+        'plate': '1234567', 'score': 0.9,
+        'candidates': [{'plate': '1234567', 'score': 0.9}, {'plate': '9876543', 'score': 0.3}]
+    }
+    match = PlateMatch.from_ocr_result(ocr_result(result))
+    assert 987 not in match
+    assert '9876543' not in dict(match.scored_candidates())
+
+
+def test_candidates_above_threshold_are_matched():
+    result = {'plate': '1234567', 'score': 0.9, 'candidates': [{'plate': '9876543', 'score': 0.85}]}
+    match = PlateMatch.from_ocr_result(ocr_result(result))
+    assert match.confidence(987) == 0.85
+
+    # סף נמוך יותר כולל גם מועמדים חלשים
+    weak = {'plate': '1234567', 'score': 0.9, 'candidates': [{'plate': '9876543', 'score': 0.3}]}
+    assert PlateMatch.from_ocr_result(ocr_result(weak), candidate_min_confidence=0.2).confidence(987) == 0.3
+
+
+def test_windows_do_not_cross_letters():
+    assert plate_windows('12a345') == {345}
+    assert plate_windows('1234567') == {123, 234, 345, 456, 567}
+    assert plate_windows('12-34') == set()
+
+
+def test_windows_are_zero_padded_numbers():
+    # המספר 5 מוצג בלוחית כ-"005"
+    assert plate_windows('1005') == {100, 5}
+    match = PlateMatch.from_ocr_result(ocr_result({'plate': '10-05', 'score': 0.9, 'candidates': []}))
+    assert match.matches(5)
+    assert 50 not in match
+
+
+def test_duplicate_plates_are_listed_once():
+    match = PlateMatch.from_ocr_result(ocr_result(
+        {'plate': '123-45-67', 'score': 0.6, 'candidates': []},
+        {'plate': '1234567', 'score': 0.9, 'candidates': []}
+    ))
+    assert match.plates == ['1234567']
+    assert match.candidates == {'1234567': 0.9}
+
+
+def test_window_keeps_the_highest_score():
+    match = PlateMatch.from_ocr_result(ocr_result(
+        {'plate': '1234567', 'score': 0.6, 'candidates': []},
+        {'plate': '9912300', 'score': 0.95, 'candidates': []},
+        {'plate': '5551239', 'score': 0.7, 'candidates': []}
+    ))
+    assert match.confidence(123) == 0.95
+    assert match.confidence(456) == 0.6
+    assert match.matches(456, 0.5) and not match.matches(456, 0.7)
+
+
+def test_covered_skips_found_numbers_and_numbers_outside_the_pool():
+    match = PlateMatch.from_ocr_result(ocr_result(
+        {'plate': '1234567', 'score': 0.9, 'candidates': []},
+        {'plate': '8880', 'score': 0.4, 'candidates': []}
+    ))
+    assert match.covered(set(), 1000) == [123, 234, 345, 456, 567, 880, 888]
+    assert match.covered({234, 456}, 500) == [123, 345]
+    assert match.covered(set(), 1000, min_confidence=0.5) == [123, 234, 345, 456, 567]
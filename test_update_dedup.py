@@ -0,0 +1,196 @@
+"""
+בדיקות זיהוי העדכונים וההודעות שנשלחו שוב (update_dedup), יחד עם תור העדכונים
+
+    python -m pytest -q test_update_dedup.py
+"""
+
+import time
+import threading
+from types import SimpleNamespace
+from update_dedup import RecentKeys, UpdateDeduplicator
+from update_queue import UpdateQueueConsumer
+
+
+class FakeDB:
+    """processed_messages ו-update_queue בזיכרון"""
+
+    def __init__(self):
+        self.processed = set()
+        self.queue = {}  # update_id -> [payload, status, attempts]
+        self.lock = threading.Lock()
+
+    def is_message_processed(self, chat_id, message_id):
+        return (chat_id, message_id) in self.processed
+
+    def mark_message_processed(self, chat_id, message_id):
+        with self.lock:
+            if (chat_id, message_id) in self.processed:
+                return False
+            self.processed.add((chat_id, message_id))
+            return True
+
+    def enqueue_update(self, update_id, payload):
+        with self.lock:
+            if update_id in self.queue:
+                return False
+            self.queue[update_id] = [payload, 'pending', 0]
+            return True
+
+    def claim_updates(self, limit, stale_after):
+        with self.lock:
+            claimed = []
+            for update_id, row in sorted(self.queue.items()):
+                if row[1] == 'pending' and len(claimed) < limit:
+                    row[1] = 'processing'
+                    row[2] += 1
+                    claimed.append((update_id, row[0]))
+            return claimed
+
+    def complete_update(self, update_id):
+        with self.lock:
+            self.queue[update_id][1] = 'done'
+
+    def fail_update(self, update_id, max_attempts):
+        with self.lock:
+            row = self.queue[update_id]
+            row[1] = 'failed' if row[2] >= max_attempts else 'pending'
+            return row[1]
+
+    def touch_updates(self, update_ids):
+        pass
+
+    def update_queue_stats(self):
+        return {}
+
+
+class BrokenDB(FakeDB):
+    """מסד נתונים שאינו זמין: הבדיקה והרישום מחזירים None"""
+
+    def is_message_processed(self, chat_id, message_id):
+        return None
+
+    def mark_message_processed(self, chat_id, message_id):
+        return None
+
+
+def photo(message_id, chat_id=-100):
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id), message_id=message_id)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "התנאי לא התקיים בזמן"
+        time.sleep(0.005)
+
+
+def test_failed_photo_is_retried_from_the_queue():
+    """
+    תמונה שהטיפול בה נכשל חוזרת לתור ומעובדת בניסיון הבא, בדיוק כמו
+    handle_photo / complete_photo_updates / fail_photo_updates ב-bot_handlers
+    """
+    db = FakeDB()
+    dedup = UpdateDeduplicator(db)
+    attempts = []
+    processed = []
+
+    def handle_photo(payload):
+        message = photo(payload['message_id'])
+        if not dedup.first_message(message):
+            return
+        update_id = consumer.defer()
+        attempts.append(update_id)
+        try:
+            if len(attempts) == 1:
+                raise RuntimeError("שגיאה זמנית בתחילת העיבוד")
+        except Exception as e:
+            dedup.release_message(message)
+            consumer.fail(update_id, e)
+            raise
+        processed.append(message.message_id)
+        dedup.finish_message(message)
+        consumer.complete(update_id)
+
+    consumer = UpdateQueueConsumer(db, handle_photo, num_workers=1, poll_interval=0.01)
+    try:
+        consumer.enqueue({'update_id': 1, 'message_id': 10})
+        wait_for(lambda: db.queue[1][1] == 'done')
+    finally:
+        consumer.stop()
+
+    assert attempts == [1, 1]
+    assert processed == [10]
+    assert db.processed == {(-100, 10)}
+    assert dedup.stats()['duplicate_messages'] == 0 and dedup.stats()['db_duplicates'] == 0
+
+
+def test_unfinished_message_is_processed_after_a_crash():
+    db = FakeDB()
+    crashed = UpdateDeduplicator(db)
+    assert crashed.first_message(photo(10))
+
+    # התהליך נפל באמצע הטיפול - תהליך אחר שתופס את העדכון מחדש מעבד אותו
+    restarted = UpdateDeduplicator(db)
+    assert restarted.first_message(photo(10))
+    restarted.finish_message(photo(10))
+
+    # לאחר שהטיפול הסתיים, עדכון חוזר בתהליך שלישי נדחה
+    assert not UpdateDeduplicator(db).first_message(photo(10))
+
+
+def test_released_message_is_accepted_again():
+    dedup = UpdateDeduplicator(FakeDB())
+    assert dedup.first_message(photo(10))
+    assert not dedup.first_message(photo(10))
+    dedup.release_message(photo(10))
+    assert dedup.first_message(photo(10))
+
+
+def test_recent_keys_evicts_the_oldest_key():
+    keys = RecentKeys(max_size=3)
+    assert all(keys.add(key) for key in (1, 2, 3))
+    assert not keys.add(1)  # מפתח שנראה שוב עובר לסוף החלון
+
+    assert keys.add(4)
+    assert len(keys) == 3
+    assert keys.add(2)  # 2 היה הוותיק ביותר ונמחק
+    assert not keys.add(1) and not keys.add(4)
+
+
+def test_repeated_update_id_is_skipped():
+    dedup = UpdateDeduplicator(window=2)
+    assert dedup.first_update(100)
+    assert not dedup.first_update(100)
+    assert dedup.first_update(101)
+    assert dedup.first_update(102)
+    assert dedup.first_update(100)  # יצא מהחלון
+    assert dedup.stats()['duplicate_updates'] == 1
+
+
+def test_memory_and_db_duplicates_are_counted_separately():
+    db = FakeDB()
+    dedup = UpdateDeduplicator(db)
+    assert dedup.first_message(photo(10))
+    assert not dedup.first_message(photo(10))
+
+    # עדכון חוזר שהגיע לתהליך אחר נדחה לפי מסד הנתונים
+    dedup.finish_message(photo(10))
+    other = UpdateDeduplicator(db)
+    assert not other.first_message(photo(10))
+
+    # אותו מזהה הודעה בקבוצה אחרת הוא הודעה אחרת
+    assert dedup.first_message(photo(10, chat_id=-200))
+
+    assert dedup.stats()['duplicate_messages'] == 1 and dedup.stats()['db_duplicates'] == 0
+    assert other.stats()['duplicate_messages'] == 0 and other.stats()['db_duplicates'] == 1
+
+
+def test_db_errors_fail_open():
+    dedup = UpdateDeduplicator(BrokenDB())
+    assert dedup.first_message(photo(10))
+    dedup.finish_message(photo(10))
+
+    # החלון בזיכרון עדיין מונע עיבוד כפול באותו תהליך
+    assert not dedup.first_message(photo(10))
+    assert UpdateDeduplicator(BrokenDB()).first_message(photo(10))
+    assert dedup.stats()['db_errors'] == 2
@@ -0,0 +1,132 @@
+"""
+זיהוי עדכונים והודעות שטלגרם שלח שוב
+
+טלגרם שולח עדכון שוב כשה-webhook לא ענה בזמן. כדי שהעדכון החוזר לא יעבור
+שוב OCR ולא יסמן מציאה פעמיים:
+
+- update_id נבדק מול חלון חסום בזיכרון של העדכונים האחרונים.
+- (chat_id, message_id) של תמונה נבדק מול חלון בזיכרון, ואחריו מול טבלת
+  processed_messages - כך שגם עדכון חוזר שהגיע לתהליך אחר מזוהה.
+
+הודעה נרשמת ב-processed_messages רק כשהטיפול בה הסתיים, וטיפול שנכשל
+משחרר אותה מהחלון שבזיכרון. כך ניסיון חוזר של עדכון מתור העדכונים (לאחר
+כשל, או לאחר נפילת התהליך שטיפל בו) אינו נדחה ככפילות.
+"""
+
+import threading
+import logging
+from collections import OrderedDict
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+class RecentKeys:
+    """
+    חלון חסום של המפתחות האחרונים שנראו (המפתח הוותיק ביותר נמחק ראשון)
+    """
+
+    def __init__(self, max_size=10000):
+        """
+        Args:
+            max_size: מספר המפתחות המרבי בחלון
+        """
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()
+
+    def add(self, key):
+        """
+        הוספת מפתח לחלון
+
+        Returns:
+            bool: True אם המפתח חדש, False אם כבר נמצא בחלון
+        """
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                return False
+            self._keys[key] = None
+            if len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+            return True
+
+    def discard(self, key):
+        """הסרת מפתח מהחלון (אם קיים)"""
+        with self._lock:
+            self._keys.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._keys)
+
+
+class UpdateDeduplicator:
+    """
+    בדיקת עדכונים והודעות תמונה לפני העיבוד
+    """
+
+    def __init__(self, db=None, window=10000):
+        """
+        Args:
+            db: מנהל מסד הנתונים (None - בדיקה בזיכרון בלבד)
+            window: מספר המפתחות האחרונים שנשמרים בזיכרון לכל סוג
+        """
+        self.db = db
+        self._updates = RecentKeys(window)
+        self._messages = RecentKeys(window)
+
+        self._lock = threading.Lock()
+        self._counters = {'duplicate_updates': 0, 'duplicate_messages': 0, 'db_duplicates': 0, 'db_errors': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+
+    def first_update(self, update_id):
+        """האם זו הפעם הראשונה שהעדכון התקבל (בחלון שבזיכרון)"""
+        if self._updates.add(update_id):
+            return True
+        self._count('duplicate_updates')
+        logger.info(f"העדכון {update_id} התקבל שוב - מדלג")
+        return False
+
+    def first_message(self, message):
+        """
+        האם הודעת התמונה לא עובדה ואינה בטיפול כעת
+
+        ההודעה נרשמת בחלון שבזיכרון עד לסיום הטיפול (finish_message) או עד
+        שחרורה (release_message). אם מסד הנתונים אינו זמין ההודעה מעובדת
+        (עדיף עיבוד כפול נדיר על פני תמונה שלא נבדקה).
+        """
+        key = (message.chat.id, message.message_id)
+        if not self._messages.add(key):
+            self._count('duplicate_messages')
+            logger.info(f"ההודעה {key[1]} בקבוצה {key[0]} התקבלה שוב - מדלג")
+            return False
+
+        if self.db is None:
+            return True
+
+        processed = self.db.is_message_processed(*key)
+        if processed is None:
+            self._count('db_errors')
+            return True
+        if processed:
+            self._count('db_duplicates')
+            logger.info(f"ההודעה {key[1]} בקבוצה {key[0]} כבר עובדה בתהליך אחר - מדלג")
+        return not processed
+
+    def finish_message(self, message):
+        """רישום הודעת התמונה כמעובדת, לאחר שהטיפול בה הסתיים"""
+        if self.db is not None and self.db.mark_message_processed(message.chat.id, message.message_id) is None:
+            self._count('db_errors')
+
+    def release_message(self, message):
+        """שחרור הודעת תמונה שהטיפול בה נכשל, כדי שניסיון חוזר שלה יעובד"""
+        self._messages.discard((message.chat.id, message.message_id))
+
+    def stats(self):
+        """מוני הכפילויות וגודל החלונות בזיכרון"""
+        with self._lock:
+            return {**self._counters, 'updates_window': len(self._updates), 'messages_window': len(self._messages)}
@@ -0,0 +1,173 @@
+import time
+import threading
+import logging
+
+# הגדרת לוגר
+logger = logging.getLogger(__name__)
+
+
+class UpdateQueueConsumer:
+    """
+    צרכני תור העדכונים הקבוע (טבלת update_queue)
+
+    ה-webhook רק שומר את העדכון בתור ומחזיר תשובה מיד. תהליכוני הצרכן
+    תופסים עדכונים ממתינים, מעבדים אותם ומסמנים אותם כמעובדים. עדכון
+    שנכשל חוזר לתור, ועדכון שתהליך נפל באמצע עיבודו נתפס מחדש לאחר
+    stale_after שניות - כך כל עדכון מעובד לפחות פעם אחת.
+
+    מטפל שמעביר את העבודה לרקע (למשל תמונה שנכנסת לתור העיבוד) קורא
+    ל-defer, והעדכון נשאר בטיפול עד שהעבודה קוראת ל-complete או ל-fail.
+    בזמן הזה הצרכן מחדש את זמן התפיסה של העדכון, כך שהוא נתפס מחדש רק
+    אם התהליך נפל לפני שהעבודה הסתיימה.
+    """
+
+    def __init__(self, db, process, num_workers=2, batch_size=10, poll_interval=1.0,
+                 stale_after=300, max_attempts=5):
+        """
+        Args:
+            db: מנהל מסד הנתונים
+            process: פונקציה המקבלת את תוכן העדכון (dict) ומעבדת אותו
+            num_workers: מספר תהליכוני הצרכן
+            batch_size: מספר העדכונים שנתפסים בכל פעם
+            poll_interval: שניות המתנה כשהתור ריק
+            stale_after: שניות עד שעדכון שנתפס ולא הושלם נתפס מחדש
+            max_attempts: מספר ניסיונות העיבוד המרבי לעדכון
+        """
+        self.db = db
+        self.process = process
+        self.num_workers = num_workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._counters = {'enqueued': 0, 'duplicates': 0, 'processed': 0, 'failed': 0, 'deferred': 0}
+
+        # העדכון שבטיפול בכל תהליכון צרכן, ועדכונים שהועברו לעבודת רקע -> זמן חידוש התפיסה
+        self._local = threading.local()
+        self._deferred = {}
+
+    def start(self):
+        """הפעלת תהליכוני הצרכן (אם עדיין לא הופעלו)"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for index in range(self.num_workers):
+                thread = threading.Thread(target=self._worker, name=f"update-consumer-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"הופעלו {self.num_workers} צרכני תור עדכונים")
+
+    def enqueue(self, payload):
+        """
+        שמירת עדכון בתור
+
+        Returns:
+            bool: True אם העדכון נשמר (או שכבר היה בתור), False אם השמירה נכשלה
+        """
+        self.start()
+        added = self.db.enqueue_update(payload['update_id'], payload)
+        if added is None:
+            return False
+
+        with self._lock:
+            self._counters['enqueued' if added else 'duplicates'] += 1
+        if added:
+            self._wakeup.set()
+        return True
+
+    def _worker(self):
+        """לולאת העבודה של צרכן"""
+        while not self._stopping.is_set():
+            self._touch_deferred()
+            claimed = self.db.claim_updates(self.batch_size, self.stale_after)
+            if not claimed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            for update_id, payload in claimed:
+                self._local.update_id = update_id
+                self._local.deferred = False
+                try:
+                    self.process(payload)
+                except Exception as e:
+                    if not self._local.deferred:
+                        self.fail(update_id, e)
+                    continue
+                finally:
+                    self._local.update_id = None
+
+                if not self._local.deferred:
+                    self.complete(update_id)
+
+    def defer(self):
+        """
+        השארת העדכון שבטיפול כעת פתוח עד שעבודת הרקע שלו תסתיים
+
+        Returns:
+            int: מזהה העדכון להעברה ל-complete או fail, או None אם הקריאה
+                 אינה מתוך מטפל שהופעל על ידי הצרכן
+        """
+        update_id = getattr(self._local, 'update_id', None)
+        if update_id is None:
+            return None
+        self._local.deferred = True
+        with self._lock:
+            self._deferred[update_id] = time.monotonic()
+            self._counters['deferred'] += 1
+        return update_id
+
+    def complete(self, update_id):
+        """סימון עדכון כמעובד"""
+        with self._lock:
+            self._deferred.pop(update_id, None)
+            self._counters['processed'] += 1
+        self.db.complete_update(update_id)
+
+    def fail(self, update_id, error):
+        """החזרת עדכון שנכשל לתור (או סימונו ככושל לאחר max_attempts ניסיונות)"""
+        with self._lock:
+            self._deferred.pop(update_id, None)
+            self._counters['failed'] += 1
+        status = self.db.fail_update(update_id, self.max_attempts)
+        logger.error(f"שגיאה בעיבוד עדכון {update_id} (מצב: {status}): {error}")
+
+    def _touch_deferred(self):
+        """חידוש זמן התפיסה של עדכונים שעבודת הרקע שלהם עדיין רצה"""
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                update_id for update_id, touched in self._deferred.items()
+                if now - touched >= self.stale_after / 3
+            ]
+            for update_id in due:
+                self._deferred[update_id] = now
+        if due:
+            self.db.touch_updates(due)
+
+    def stop(self, timeout=30):
+        """עצירת הצרכנים לאחר סיום העדכונים שכבר נתפסו"""
+        with self._lock:
+            threads = list(self._threads)
+            self._threads = []
+        self._stopping.set()
+        self._wakeup.set()
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        logger.info("צרכני תור העדכונים נעצרו")
+
+    def stats(self):
+        """מוני התור והתפלגות העדכונים לפי מצב"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['workers'] = len(self._threads)
+            stats['in_background'] = len(self._deferred)
+        stats['queue'] = self.db.update_queue_stats()
+        return stats